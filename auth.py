@@ -2,31 +2,35 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends, Request
-import aiosqlite
-import hashlib
 
-# Security configuration
-SECRET_KEY = "your-secret-key-here-change-in-production"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+from cache import user_cache, MISSING
+from database import read_connection, write_connection
+from passwords import hash_password, verify_password
+from settings import SECRET_KEY, ACCESS_TOKEN_EXPIRE_MINUTES
 
-def verify_password(plain_password, hashed_password):
-    return get_password_hash(plain_password) == hashed_password
+ALGORITHM = "HS256"
 
-def get_password_hash(password):
-    salt = "construction_store_salt"
-    return hashlib.sha256(f"{password}{salt}".encode()).hexdigest()
+async def get_password_hash(password):
+    return await hash_password(password)
 
 async def authenticate_user(username: str, password: str):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
+    async with read_connection() as db:
         async with db.execute("SELECT * FROM users WHERE username = ?", (username,)) as cursor:
             user = await cursor.fetchone()
-            if not user:
-                return False
-            if not verify_password(password, user["hashed_password"]):
-                return False
-            return user
+    if not user:
+        return False
+    
+    is_valid, new_hash = await verify_password(password, user["hashed_password"])
+    if not is_valid:
+        return False
+    
+    # Устаревший или ослабленный хеш заменяется после успешного входа
+    if new_hash:
+        async with write_connection() as db:
+            await db.execute("UPDATE users SET hashed_password = ? WHERE id = ?", (new_hash, user["id"]))
+            await db.commit()
+        invalidate_user(username)
+    return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -38,7 +42,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(request: Request):
+def get_username_from_token(request: Request) -> Optional[str]:
     token = request.cookies.get("access_token")
     if not token or not token.startswith("bearer "):
         return None
@@ -47,18 +51,51 @@ async def get_current_user(request: Request):
     
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
     except JWTError:
         return None
+    return payload.get("sub")
+
+def invalidate_user(username: str):
+    user_cache.invalidate(username)
+
+async def _load_user(db, username: str):
+    user = user_cache.get(username)
+    if user is not MISSING:
+        return user
     
-    # Get user from database
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM users WHERE username = ?", (username,)) as cursor:
-            user = await cursor.fetchone()
-            return user
+    async with db.execute("SELECT * FROM users WHERE username = ?", (username,)) as cursor:
+        user = await cursor.fetchone()
+    
+    if user:
+        user_cache.set(username, user)
+    return user
+
+async def resolve_identity(request: Request):
+    # Пользователь и количество товаров в корзине вычисляются один раз за запрос
+    if getattr(request.state, "identity_resolved", False):
+        return request.state.current_user
+    
+    current_user = None
+    cart_count = 0
+    username = get_username_from_token(request)
+    if username is not None:
+        async with read_connection() as db:
+            current_user = await _load_user(db, username)
+            if current_user:
+                async with db.execute(
+                    "SELECT SUM(quantity) as total FROM cart WHERE user_id = ?",
+                    (current_user["id"],)
+                ) as cursor:
+                    result = await cursor.fetchone()
+                    cart_count = result["total"] if result and result["total"] else 0
+    
+    request.state.current_user = current_user
+    request.state.cart_count = cart_count
+    request.state.identity_resolved = True
+    return current_user
+
+async def get_current_user(request: Request):
+    return await resolve_identity(request)
 
 async def get_current_active_user(current_user: dict = Depends(get_current_user)):
     if not current_user:
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database, timed
+import crud
+import database
+
+def fill_users(path, count):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (username, email, hashed_password, full_name, is_active, created_at) "
+        "VALUES (?, ?, '', ?, ?, datetime('2020-01-01', ? || ' minutes'))",
+        ((f"user{i}", f"user{i}@example.com", f"Пользователь {i}", rng.random() > 0.1, i)
+         for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+async def run(args):
+    async with bench_database() as path:
+        started = time.perf_counter()
+        fill_users(path, args.users)
+        print(f"Inserted {args.users} users in {time.perf_counter() - started:.1f}s")
+
+        db = await database.connect(path, readonly=True)
+
+        async def offset_page(offset):
+            # Как было до keyset-пагинации: вся таблица без фильтров и LIMIT/OFFSET
+            async with db.execute(
+                "SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?", (args.page_size, offset)
+            ) as cursor:
+                return await cursor.fetchall()
+
+        async def count_all():
+            async with db.execute(
+                "SELECT COUNT(*), SUM(is_active = TRUE) FROM users"
+            ) as cursor:
+                return await cursor.fetchone()
+
+        print(f"summary: COUNT(*) {await timed(count_all, args.repeat):.2f} ms, "
+              f"summary_counts {await timed(lambda: crud.get_summary_counts(db), args.repeat):.2f} ms")
+
+        cases = [
+            ("first page", {}),
+            ("active only", {"is_active": True}),
+            ("search 'user12345'", {"search": "user12345"}),
+            ("search 'r1'", {"search": "r1"}),
+            ("date range", {"date_from": "2020-03-01", "date_to": "2020-03-31"}),
+        ]
+        print(f"page size {args.page_size}")
+        print(f"{'filter':<24}{'first ms':>10}{'deep ms':>10}")
+        for label, filters in cases:
+            rows, next_cursor, _ = await crud.get_users_page(db, limit=args.page_size, **filters)
+            first = await timed(lambda: crud.get_users_page(db, limit=args.page_size, **filters), args.repeat)
+            # Переход на несколько сотен страниц вглубь по курсору
+            for _ in range(args.depth):
+                if not next_cursor:
+                    break
+                rows, next_cursor, _ = await crud.get_users_page(
+                    db, limit=args.page_size, page_cursor=next_cursor, **filters)
+            deep_cursor = next_cursor
+            deep = await timed(lambda: crud.get_users_page(
+                db, limit=args.page_size, page_cursor=deep_cursor, **filters), args.repeat) if deep_cursor else 0.0
+            print(f"{label:<24}{first:>10.2f}{deep:>10.2f}")
+
+        offset = args.depth * args.page_size
+        print(f"OFFSET {offset}: {await timed(lambda: offset_page(offset), args.repeat):.2f} ms")
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin users listing: keyset pages with filters and summary counters")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=crud.ADMIN_PAGE_SIZE)
+    parser.add_argument("--depth", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import gzip
+import os
+import sqlite3
+import time
+import tracemalloc
+
+from starlette.requests import Request
+
+from benchmarks.common import ROOT, bench_database
+import database
+
+def fill_users(path, count):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (username, email, hashed_password, full_name) VALUES (?, ?, '', ?)",
+        ((f"user{i}", f"user{i}@example.com", f"Пользователь {i}") for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+def admin_context(users):
+    request = Request({"type": "http", "method": "GET", "path": "/admin/users", "query_string": b"",
+                       "headers": [(b"cookie", b"access_token=bearer x")]})
+    # Контекст как у маршрута без фильтров; счётчики и ссылки страниц на время рендеринга почти не влияют
+    return {"request": request, "users": users, "cart_count": 0,
+            "filters": {"status": None, "role": None, "q": None, "date_from": None, "date_to": None},
+            "counts": {"users": 0, "active_users": 0}, "next_url": None, "prev_url": None,
+            "current_user": {"id": 1, "username": "admin", "is_superuser": True}}
+
+async def buffered(templates):
+    started = time.perf_counter()
+    async with database.read_connection() as db:
+        async with db.execute("SELECT * FROM users ORDER BY created_at DESC") as cursor:
+            users = await cursor.fetchall()
+    html = templates.get_template("admin/users.html").render(admin_context(users))
+    # Первый байт уходит только после рендеринга всей страницы
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed, len(html.encode())
+
+async def streamed(stream_template):
+    started = time.perf_counter()
+    first_chunk = None
+    size = 0
+    context = admin_context(database.stream_rows("SELECT * FROM users ORDER BY created_at DESC"))
+    async for chunk in stream_template("admin/users.html", context):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        size += len(chunk.encode())
+    return first_chunk, time.perf_counter() - started, size
+
+async def measure(coro_factory):
+    result = await coro_factory()
+    # Память отдельным прогоном: tracemalloc заметно замедляет рендеринг
+    tracemalloc.start()
+    await coro_factory()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+async def run(args):
+    os.chdir(ROOT)
+    from templating import templates, stream_template
+
+    async with bench_database() as path:
+        fill_users(path, args.users)
+        await database.open_pool()
+
+        print(f"/admin/users with {args.users} users")
+        print(f"{'mode':<10}{'TTFB ms':>10}{'total ms':>10}{'peak MiB':>10}{'HTML MiB':>10}")
+        for name, coro_factory in (("buffered", lambda: buffered(templates)),
+                                   ("streamed", lambda: streamed(stream_template))):
+            (ttfb, total, size), peak = await measure(coro_factory)
+            print(f"{name:<10}{ttfb * 1000:>10.1f}{total * 1000:>10.1f}{peak / 2**20:>10.1f}{size / 2**20:>10.1f}")
+
+        html = templates.get_template("admin/users.html").render(admin_context(
+            [row async for row in database.stream_rows("SELECT * FROM users ORDER BY created_at DESC LIMIT 1000")]
+        )).encode()
+        print(f"1000-row page: {len(html) / 1024:.0f} KiB raw, {len(gzip.compress(html, 6)) / 1024:.0f} KiB gzip")
+        try:
+            import brotli
+            print(f"               {len(brotli.compress(html, quality=4)) / 1024:.0f} KiB brotli q4")
+        except ImportError:
+            pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Buffered vs streamed admin listing: TTFB and peak memory")
+    parser.add_argument("--users", type=int, default=100_000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import sqlite3
+import statistics
+import time
+
+from benchmarks.common import bench_database
+import crud
+import database
+
+async def legacy_add_to_cart(db, user_id, product_id, quantity):
+    # Прежняя реализация: SELECT, затем UPDATE или INSERT
+    async with db.execute(
+        "SELECT * FROM cart WHERE user_id = ? AND product_id = ?", (user_id, product_id)
+    ) as cursor:
+        existing = await cursor.fetchone()
+    if existing:
+        await db.execute(
+            "UPDATE cart SET quantity = ? WHERE user_id = ? AND product_id = ?",
+            (existing["quantity"] + quantity, user_id, product_id)
+        )
+    else:
+        await db.execute(
+            "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)", (user_id, product_id, quantity)
+        )
+    await db.commit()
+
+async def legacy_order_items(db, order_id, items):
+    for item in items:
+        await db.execute(
+            "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+            (order_id, item["product_id"], item["quantity"], item["price"])
+        )
+    await db.commit()
+
+async def bulk_order_items(db, order_id, items):
+    await crud.add_order_items(db, order_id, items)
+    await db.commit()
+
+async def measure(operation, repeat):
+    samples = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        await operation(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+def report(name, before, after):
+    print(f"{name:<32}{before[0]:>10.3f}{before[1]:>10.3f}{after[0]:>10.3f}{after[1]:>10.3f}")
+
+async def run(args):
+    async with bench_database() as path:
+        conn = sqlite3.connect(path)
+        conn.executemany(
+            "INSERT INTO products (name, description, price, category, image_url, stock_quantity) "
+            "VALUES (?, '', ?, 'Крепёж', '', 1000)",
+            [(f"Позиция {i}", 10.0 + i) for i in range(args.items)]
+        )
+        conn.executemany(
+            "INSERT INTO users (username, email, hashed_password) VALUES (?, ?, '')",
+            [(f"u{i}", f"u{i}@example.com") for i in range(2)]
+        )
+        conn.execute("INSERT INTO orders (user_id, total_amount) VALUES (1, 0)")
+        conn.commit()
+        product_ids = [row[0] for row in conn.execute("SELECT id FROM products WHERE name LIKE 'Позиция %'")]
+        legacy_user, upsert_user = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'u%'")]
+        conn.close()
+
+        db = await database.connect(path)
+        items = [{"product_id": product_id, "quantity": 2, "price": 10.0} for product_id in product_ids]
+
+        print(f"{'operation (ms)':<32}{'before p50':>10}{'p99':>10}{'after p50':>10}{'p99':>10}")
+        report(
+            "add to cart (new + repeat)",
+            await measure(lambda i: legacy_add_to_cart(db, legacy_user, product_ids[i % len(product_ids)], 1),
+                          args.repeat),
+            await measure(lambda i: crud.add_to_cart(db, upsert_user, product_ids[i % len(product_ids)], 1),
+                          args.repeat),
+        )
+
+        async def legacy_bulk(_):
+            for product_id in product_ids:
+                await legacy_add_to_cart(db, legacy_user, product_id, 1)
+
+        report(
+            f"add {len(product_ids)} items to cart",
+            await measure(legacy_bulk, max(1, args.repeat // 10)),
+            await measure(lambda _: crud.add_many_to_cart(db, upsert_user, [(p, 1) for p in product_ids]),
+                          max(1, args.repeat // 10)),
+        )
+        report(
+            f"insert {len(items)} order items",
+            await measure(lambda _: legacy_order_items(db, 1, items), max(1, args.repeat // 10)),
+            await measure(lambda _: bulk_order_items(db, 1, items), max(1, args.repeat // 10)),
+        )
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Cart and order-item write latency, before and after batching")
+    parser.add_argument("--items", type=int, default=50, help="size of a pasted materials list / order")
+    parser.add_argument("--repeat", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
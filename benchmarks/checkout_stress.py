@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database
+import crud
+import database
+
+def fill(path, users, products, stock, items_per_cart):
+    rng = random.Random(8)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (name, description, price, category, image_url, stock_quantity) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"Популярный товар {i}", "", 100.0 + i, "Инструменты", "", stock) for i in range(products)]
+    )
+    product_ids = [row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE name LIKE 'Популярный товар %'")]
+    # Хеш пароля не нужен: пользователи только оформляют заказы
+    conn.executemany(
+        "INSERT INTO users (username, email, hashed_password) VALUES (?, ?, '')",
+        [(f"buyer{i}", f"buyer{i}@example.com") for i in range(users)]
+    )
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'buyer%'")]
+    conn.executemany(
+        "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+        [
+            (user_id, product_id, rng.randint(1, 3))
+            for user_id in user_ids
+            for product_id in rng.sample(product_ids, items_per_cart)
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return user_ids, product_ids
+
+async def run(args):
+    async with bench_database() as path:
+        user_ids, product_ids = fill(path, args.users, args.products, args.stock, args.items)
+
+        # Отдельные соединения вместо общего писателя пула: атомарность должна
+        # обеспечиваться самой транзакцией, как при нескольких процессах
+        connections = [await database.connect(path) for _ in range(args.connections)]
+        idle = asyncio.Queue()
+        for db in connections:
+            idle.put_nowait(db)
+        ordered = 0
+        rejected = 0
+
+        async def buyer(user_id):
+            nonlocal ordered, rejected
+            db = await idle.get()
+            try:
+                order_id, _ = await crud.checkout_cart(db, user_id)
+            except crud.InsufficientStockError:
+                rejected += 1
+                return
+            finally:
+                idle.put_nowait(db)
+            if order_id is not None:
+                ordered += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(buyer(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+        for db in connections:
+            await db.close()
+
+        conn = sqlite3.connect(path)
+        placeholders = ",".join("?" * len(product_ids))
+        negative = conn.execute(
+            f"SELECT COUNT(*) FROM products WHERE id IN ({placeholders}) AND stock_quantity < 0", product_ids
+        ).fetchone()[0]
+        remaining = conn.execute(
+            f"SELECT SUM(stock_quantity) FROM products WHERE id IN ({placeholders})", product_ids
+        ).fetchone()[0]
+        sold = conn.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_items").fetchone()[0]
+        orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        carts_left = conn.execute("SELECT COUNT(DISTINCT user_id) FROM cart").fetchone()[0]
+        conn.close()
+
+        print(f"{len(user_ids)} concurrent checkouts over {args.connections} connections, "
+              f"{args.products} products x {args.stock} in stock")
+        print(f"ordered {ordered}, rejected {rejected} in {elapsed:.2f}s, {ordered / elapsed:.1f} orders/s")
+        print(f"sold {sold}, remaining {remaining}, negative stock rows {negative}")
+
+        assert negative == 0, "stock went negative"
+        assert sold + remaining == args.products * args.stock, "stock was lost or oversold"
+        assert orders == ordered, "order count does not match successful checkouts"
+        assert carts_left == rejected, "carts of completed orders were not cleared"
+        print("OK")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent checkouts racing for the same products")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=300)
+    parser.add_argument("--items", type=int, default=2, help="distinct products per cart")
+    parser.add_argument("--connections", type=int, default=8)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+async def timed(coro_factory, repeat: int) -> float:
+    # Лучшее из repeat выполнений coro_factory(), в миллисекундах
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+def percentile(values, share: float) -> float:
+    # Квантиль share (0..1) длительностей в секундах, в миллисекундах; 0 без значений
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * share), len(ordered) - 1)] * 1000 if ordered else 0.0
+
+@asynccontextmanager
+async def bench_database():
+    # Свежая БД со всеми миграциями во временном каталоге, рабочая construction_store.db не затрагивается.
+    # Пул открывает сам замер (обычно после заполнения БД); при выходе он закрывается, каталог удаляется
+    import database
+
+    workdir = tempfile.mkdtemp(prefix="store-bench-")
+    path = os.path.join(workdir, "bench.db")
+    database.DATABASE_URL = path
+    try:
+        await database.init_db()
+        yield path
+    finally:
+        await database.close_pool()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+@contextmanager
+def app_client(login: bool = True):
+    # Приложение запускается в отдельном каталоге со свежей БД,
+    # рабочая construction_store.db не затрагивается
+    workdir = tempfile.mkdtemp(prefix="store-bench-")
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    previous = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        from fastapi.testclient import TestClient
+        import main
+
+        with TestClient(main.app) as client:
+            if login:
+                client.post("/users/login", data={"username": "admin", "password": "admin123"})
+            yield client
+    finally:
+        os.chdir(previous)
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+
+from benchmarks.common import bench_database, percentile
+import crud
+import database
+from schemas import UserCreate
+
+@asynccontextmanager
+async def own_connection():
+    # Как до пула: у каждого запроса своё соединение и своя фиксация
+    db = await database.connect()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def shared_writer():
+    return database.write_connection(grouped=False)
+
+def group_commit():
+    return database.write_connection()
+
+MODES = {
+    "connection per write": own_connection,
+    "shared writer, commit per block": shared_writer,
+    "group commit": group_commit,
+}
+
+async def write(connection, user_id: int, i: int):
+    # Смесь записей из корзины, обратной связи и регистрации
+    kind = i % 4
+    async with connection() as db:
+        if kind == 0:
+            await crud.add_to_cart(db, user_id, i % 8 + 1, 1)
+        elif kind == 1:
+            await crud.update_cart_item(db, user_id, i % 8 + 1, i % 5 + 1)
+        elif kind == 2:
+            async with db.execute(
+                "INSERT INTO feedback (user_id, subject, message, email) VALUES (?, ?, ?, ?)",
+                (user_id, f"Тема {i}", "Сообщение", "client@example.com")
+            ) as cursor:
+                await crud.enqueue_job(db, "feedback_notification", {"feedback_id": cursor.lastrowid})
+            await db.commit()
+        else:
+            user = UserCreate(email=f"u{user_id}-{i}@example.com", username=f"u{user_id}-{i}", password="secret123")
+            await crud.create_user(db, user, "$argon2id$precomputed")
+
+async def run_mode(connection, user_ids: list, writes: int):
+    latencies = []
+    errors = 0
+
+    async def writer(user_id):
+        nonlocal errors
+        for i in range(writes):
+            started = time.perf_counter()
+            try:
+                await write(connection, user_id, i)
+            except sqlite3.OperationalError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    return {
+        "wps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "errors": errors,
+    }
+
+async def run(args):
+    # Выигрыш группы растёт со стоимостью COMMIT: при FULL каждая фиксация ждёт fsync журнала
+    database.CONNECTION_PRAGMAS = tuple(
+        f"PRAGMA synchronous={args.synchronous};" if pragma.startswith("PRAGMA synchronous") else pragma
+        for pragma in database.CONNECTION_PRAGMAS
+    )
+    print(f"{args.writers} concurrent writers x {args.writes} writes; "
+          f"synchronous={args.synchronous}, "
+          f"WRITE_BATCH_SIZE={database.WRITE_BATCH_SIZE}, WRITE_BATCH_DELAY_MS={database.WRITE_BATCH_DELAY_MS}")
+    print(f"{'mode':<34}{'writes/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'locked':>8}{'per commit':>12}")
+    for name in args.modes:
+        # Каждый режим - на свежей БД, чтобы размер таблиц был одинаковым
+        async with bench_database() as path:
+            conn = sqlite3.connect(path)
+            conn.executemany(
+                "INSERT INTO users (email, username, hashed_password) VALUES (?, ?, '')",
+                [(f"writer{i}@example.com", f"writer{i}") for i in range(args.writers)]
+            )
+            conn.commit()
+            user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'writer%'")]
+            conn.close()
+
+            await database.open_pool()
+            result = await run_mode(MODES[name], user_ids, args.writes)
+            stats = database.pool.stats()
+        per_commit = f"{stats['units_per_commit']:.1f}" if stats["group_commits"] else "1.0"
+        print(f"{name:<34}{result['wps']:>10.1f}{result['p50']:>10.2f}{result['p99']:>10.2f}"
+              f"{result['errors']:>8}{per_commit:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent writes: own connections vs shared writer vs group commit")
+    parser.add_argument("--writers", type=int, default=200)
+    parser.add_argument("--writes", type=int, default=20, help="writes per writer")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="NORMAL")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
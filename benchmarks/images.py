@@ -0,0 +1,101 @@
+import argparse
+import os
+import re
+import time
+from html import unescape
+from urllib.parse import unquote, urlsplit
+
+from benchmarks.common import ROOT, app_client
+
+# Ширина окна в CSS-пикселях и плотность пикселей экрана
+VIEWPORTS = [("desktop 1280 @1x", 1280, 1), ("desktop 1280 @2x", 1280, 2), ("phone 390 @3x", 390, 3)]
+FORMATS = [("avif", "image/avif"), ("webp", "image/webp"), ("jpg", None)]
+
+def parse_pictures(html: str) -> list:
+    pictures = []
+    for block in re.findall(r"<picture>(.*?)</picture>", html, re.S):
+        attrs = lambda tag: {name: unescape(value) for name, value in re.findall(r'(\w+)="([^"]*)"', tag)}
+        img = attrs(re.search(r"<img[^>]*>", block).group(0))
+        srcsets = {source["type"]: source["srcset"]
+                   for source in map(attrs, re.findall(r"<source[^>]*>", block))}
+        srcsets[None] = img.get("srcset", "")
+        pictures.append({"src": img["src"], "sizes": img.get("sizes", ""), "srcsets": srcsets})
+    return pictures
+
+def slot_width(sizes: str, viewport: int) -> float:
+    # Первое подходящее условие из sizes, как его вычисляет браузер
+    for entry in sizes.split(","):
+        entry = entry.strip()
+        match = re.match(r"\(min-width: (\d+)px\)\s+(.*)", entry)
+        if match:
+            if viewport < int(match.group(1)):
+                continue
+            entry = match.group(2)
+        if entry.endswith("px"):
+            return float(entry[:-2])
+        match = re.match(r"calc\(100vw - (\d+)px\)", entry)
+        if match:
+            return viewport - float(match.group(1))
+        if entry.endswith("vw"):
+            return viewport * float(entry[:-2]) / 100
+    return viewport
+
+def choose(srcset: str, needed: float) -> str:
+    # Наименьшая копия не уже нужного числа физических пикселей, иначе самая большая
+    candidates = sorted((int(width[:-1]), url) for url, width in (item.split() for item in srcset.split(", ")))
+    for width, url in candidates:
+        if width >= needed:
+            return url
+    return candidates[-1][1]
+
+def original_size(url: str) -> int:
+    # /images/320/images/hammer.jpg.webp?v=... -> static/images/hammer.jpg
+    path = unquote(urlsplit(url).path).split("/", 3)[3]
+    return os.path.getsize(os.path.join(ROOT, "static", path.rsplit(".", 1)[0]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Image bytes per catalog page: originals vs resized AVIF/WebP/JPEG")
+    parser.add_argument("--path", default="/products/")
+    parser.add_argument("--warm-requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with app_client() as client:
+        pictures = parse_pictures(client.get(args.path).text)
+        assert pictures, "no <picture> on the page"
+        original = sum(original_size(picture["src"]) for picture in {p["src"]: p for p in pictures}.values())
+        print(f"{args.path}: {len(pictures)} images, originals {original / 1024:.0f} KiB")
+
+        sizes, cold = {}, []
+        print(f"{'viewport':<20}" + "".join(f"{fmt + ' KiB':>11}" for fmt, _ in FORMATS) + f"{'best vs orig':>14}")
+        for name, viewport, dpr in VIEWPORTS:
+            total = {}
+            for fmt, media_type in FORMATS:
+                urls = {choose(picture["srcsets"][media_type], slot_width(picture["sizes"], viewport) * dpr)
+                        for picture in pictures}
+                total[fmt] = 0
+                for url in urls:
+                    if url not in sizes:
+                        # Первый запрос копии - кодирование в пуле процессов
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        cold.append(time.perf_counter() - started)
+                        assert response.status_code == 200, (url, response.status_code)
+                        sizes[url] = len(response.content)
+                    total[fmt] += sizes[url]
+            best = min(total.values())
+            print(f"{name:<20}" + "".join(f"{total[fmt] / 1024:>11.1f}" for fmt, _ in FORMATS)
+                  + f"{original / best:>13.1f}x")
+
+        urls = list(sizes)
+        started = time.perf_counter()
+        for i in range(args.warm_requests):
+            assert client.get(urls[i % len(urls)]).status_code == 200
+        warm = (time.perf_counter() - started) / args.warm_requests
+
+    cold.sort()
+    print(f"cold: {len(cold)} variants generated, median {cold[len(cold) // 2] * 1000:.0f} ms, "
+          f"max {cold[-1] * 1000:.0f} ms (the first one includes starting the process pool)")
+    print(f"warm: {warm * 1000:.2f} ms per cached variant")
+
+if __name__ == "__main__":
+    main()
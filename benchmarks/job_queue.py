@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import bench_database
+import crud
+import database
+import jobs
+
+async def timed_requests(count, handler):
+    started = time.perf_counter()
+    for i in range(count):
+        await handler(i)
+    return (time.perf_counter() - started) / count * 1000
+
+async def run(args):
+    async with bench_database() as path:
+        await database.open_pool()
+        work = args.work_ms / 1000
+
+        async def insert_feedback(db, i):
+            async with db.execute(
+                "INSERT INTO feedback (subject, message, email) VALUES (?, ?, ?)",
+                (f"Тема {i}", "Сообщение", "client@example.com")
+            ) as cursor:
+                return cursor.lastrowid
+
+        async def inline(i):
+            # Как было: уведомление отправляется до ответа
+            async with database.write_connection() as db:
+                await insert_feedback(db, i)
+                await db.commit()
+            await asyncio.sleep(work)
+
+        async def enqueued(i):
+            async with database.write_connection() as db:
+                feedback_id = await insert_feedback(db, i)
+                await crud.enqueue_job(db, "bench", {"feedback_id": feedback_id})
+                await db.commit()
+
+        print(f"request path, {args.requests} feedback submissions, notification takes {args.work_ms} ms")
+        print(f"{'inline notification':<24}{await timed_requests(args.requests, inline):>8.2f} ms/request")
+        print(f"{'enqueued':<24}{await timed_requests(args.requests, enqueued):>8.2f} ms/request")
+
+        @jobs.job_handler("bench")
+        async def notify(payload):
+            await asyncio.sleep(work)
+
+        async with database.write_connection() as db:
+            for i in range(args.jobs - args.requests):
+                await crud.enqueue_job(db, "bench", {"feedback_id": i})
+            await db.commit()
+
+        print(f"draining {args.jobs} jobs")
+        print(f"{'workers':>8}{'seconds':>10}{'jobs/s':>10}{'latency avg':>14}{'max':>10}")
+        for concurrency in args.workers:
+            async with database.write_connection() as db:
+                await db.execute("UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, finished_at = NULL",
+                                 (time.time(),))
+                await db.commit()
+            since = time.time()
+            runner = jobs.JobRunner(concurrency)
+            started = time.perf_counter()
+            runner.start()
+            while runner.completed < args.jobs:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            await runner.stop()
+            async with database.read_connection() as db:
+                stats = await crud.get_job_stats(db, since)
+            print(f"{concurrency:>8}{elapsed:>10.2f}{args.jobs / elapsed:>10.0f}"
+                  f"{stats['latency_avg']:>13.2f}s{stats['latency_max']:>9.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Background jobs: request latency and queue throughput")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--work-ms", type=float, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 64])
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import html
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from urllib.parse import quote
+
+import httpx
+
+from benchmarks.common import ROOT, percentile
+from benchmarks.workers import free_port, start_server, stop_server
+from scripts.generate_dataset import CATALOG, LOAD_TEST_PASSWORD, USERNAME_PREFIX
+
+PRODUCT_LINK_RE = re.compile(r'href="/products/(\d+)"')
+NEXT_PAGE_RE = re.compile(r'href="(/products/\?[^"]*cursor=[^"]*)">Вперёд')
+SEARCH_WORDS = [kind.split()[0] for kinds, *_ in CATALOG.values() for kind in kinds]
+# Доли сценариев покупателя; администраторы ходят только по админке
+JOURNEYS = {"browse": 6, "buy": 3}
+
+class Session:
+    """One virtual user: a logged-in client that records latency per route."""
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random, think: float, stats: dict, is_admin: bool):
+        self.client = client
+        self.is_admin = is_admin
+        self.rng = rng
+        self.think = think
+        self.stats = stats
+        self.recording = False
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        if self.recording:
+            latencies, errors = self.stats.setdefault(route, ([], [0]))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[0] += 1
+        if self.think:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        return response
+
+    async def login(self, username: str, password: str):
+        # Вход не замеряется: argon2 за каждого виртуального пользователя один раз перед замером
+        response = await self.client.post("/users/login", data={"username": username, "password": password})
+        if "access_token" not in response.cookies:
+            raise RuntimeError(f"login failed for {username}")
+
+    async def listing(self, categories: list) -> list:
+        if self.rng.random() < 0.3:
+            response = await self.request("GET /products/", "GET", "/products/")
+        else:
+            category = self.rng.choice(categories)
+            response = await self.request("GET /products/?category", "GET", f"/products/?category={quote(category)}")
+        # Часть покупателей листает дальше первой страницы
+        for _ in range(self.rng.choice([0, 0, 1, 2])):
+            match = NEXT_PAGE_RE.search(response.text)
+            if not match:
+                break
+            response = await self.request("GET /products/?cursor", "GET", html.unescape(match.group(1)))
+        return [int(product_id) for product_id in PRODUCT_LINK_RE.findall(response.text)]
+
+    async def browse(self, categories: list):
+        product_ids = await self.listing(categories)
+        for product_id in self.rng.sample(product_ids, min(len(product_ids), self.rng.randint(1, 3))):
+            await self.request("GET /products/{id}", "GET", f"/products/{product_id}")
+        if self.rng.random() < 0.2:
+            await self.request("GET /products/search", "GET", f"/products/search?q={quote(self.rng.choice(SEARCH_WORDS))}")
+
+    async def buy(self, categories: list):
+        product_ids = await self.listing(categories)
+        for product_id in self.rng.sample(product_ids, min(len(product_ids), self.rng.randint(1, 2))):
+            await self.request("GET /products/{id}", "GET", f"/products/{product_id}")
+            await self.request("POST /cart/add/{id}", "POST", f"/cart/add/{product_id}",
+                               data={"quantity": str(self.rng.randint(1, 3))})
+        await self.request("GET /cart/", "GET", "/cart/")
+        if self.rng.random() < 0.5:
+            response = await self.request("POST /cart/checkout", "POST", "/cart/checkout")
+            # Товар кончился: покупатель начинает корзину заново, иначе каждое оформление упрётся в него же
+            if "Недостаточно товара" in response.text:
+                await self.client.post("/cart/clear")
+
+    async def admin(self, categories: list):
+        await self.request("GET /admin/", "GET", "/admin/")
+        await self.request("GET /admin/users", "GET", "/admin/users")
+        await self.request("GET /admin/users?q", "GET", f"/admin/users?q={USERNAME_PREFIX}{self.rng.randint(1, 999)}")
+        await self.request("GET /admin/products?category", "GET",
+                           f"/admin/products?category={quote(self.rng.choice(categories))}")
+        await self.request("GET /admin/feedback?status", "GET", "/admin/feedback?status=unread")
+        await self.request("GET /admin/analytics", "GET", "/admin/analytics")
+
+async def run_client(base_url: str, accounts: list, categories: list, args, seed: int) -> dict:
+    stats = {}
+    rng = random.Random(seed)
+    # Как у браузера: у каждого виртуального пользователя свои cookies и своё соединение
+    sessions = [
+        Session(httpx.AsyncClient(base_url=base_url, timeout=60), random.Random(rng.random()),
+                args.think_ms / 1000, stats, is_admin=password is not None)
+        for _, password in accounts
+    ]
+    try:
+        for session, (username, password) in zip(sessions, accounts):
+            await session.login(username, password or LOAD_TEST_PASSWORD)
+
+        async def user(session: Session, deadline: float):
+            journeys, weights = list(JOURNEYS), list(JOURNEYS.values())
+            while time.perf_counter() < deadline:
+                if session.is_admin:
+                    await session.admin(categories)
+                else:
+                    await getattr(session, session.rng.choices(journeys, weights)[0])(categories)
+
+        # Прогрев: шаблоны, кеши и соединения; его запросы не учитываются
+        await asyncio.gather(*(user(session, time.perf_counter() + args.warmup) for session in sessions))
+        for session in sessions:
+            session.recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*(user(session, started + args.seconds) for session in sessions))
+        elapsed = time.perf_counter() - started
+    finally:
+        for session in sessions:
+            await session.client.aclose()
+    return {"elapsed": elapsed, "stats": {route: (latencies, errors[0]) for route, (latencies, errors) in stats.items()}}
+
+def client_process(job):
+    return asyncio.run(run_client(*job))
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "errors": errors,
+    }
+
+def dataset_info(path: str) -> dict:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    counts = dict(conn.execute("SELECT name, value FROM summary_counts WHERE name IN ('products', 'users', 'orders')"))
+    counts["size_mb"] = round(os.path.getsize(path) / 2**20, 1)
+    conn.close()
+    return counts
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(result: dict, baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nagainst {baseline_path} ({baseline['version']}, {baseline['started_at']}):")
+    # Сравнивать имеет смысл прогоны с одинаковой нагрузкой на одинаковых данных
+    for section in ("args", "dataset"):
+        for key, value in result[section].items():
+            if baseline[section].get(key) != value:
+                print(f"  note: {key} differs: {baseline[section].get(key)} → {value}")
+    print(f"{'route':<30}{'p95 ms':>18}{'change':>9}{'req/s':>18}{'change':>9}")
+    regressions = 0
+    for route, current in result["routes"].items():
+        before = baseline["routes"].get(route)
+        if not before:
+            continue
+        p95_change = (current["p95"] / before["p95"] - 1) * 100 if before["p95"] else 0.0
+        rps_change = (current["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+        slower = p95_change > threshold or rps_change < -threshold
+        regressions += slower
+        print(f"{route:<30}{before['p95']:>8.1f} → {current['p95']:>7.1f}{p95_change:>+8.0f}%"
+              f"{before['rps']:>8.1f} → {current['rps']:>7.1f}{rps_change:>+8.0f}%{'  SLOWER' if slower else ''}")
+    print(f"{regressions} route(s) regressed by more than {threshold:.0f}%" if regressions else
+          f"no route regressed by more than {threshold:.0f}%")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted shopper and admin journeys against uvicorn on a generated dataset")
+    parser.add_argument("--db", default="scale_test.db", help="database from scripts/generate_dataset.py")
+    parser.add_argument("--users", type=int, default=32, help="virtual shoppers")
+    parser.add_argument("--admins", type=int, default=1, help="virtual admins")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between requests of one user")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="percent change of p95 or req/s counted as a regression")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"{args.db} not found, create it with python -m scripts.generate_dataset")
+
+    # Сервер работает на копии: оформленные заказы и корзины не меняют набор данных между прогонами
+    workdir = tempfile.mkdtemp(prefix="store-bench-")
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    path = os.path.join(workdir, "bench.db")
+    started = time.perf_counter()
+    source, target = sqlite3.connect(args.db), sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+    print(f"Copied {args.db} in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(path)
+    usernames = [row[0] for row in conn.execute(
+        "SELECT username FROM users WHERE username LIKE ? AND is_active AND NOT is_superuser", (f"{USERNAME_PREFIX}%",)
+    )]
+    categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM products WHERE is_active = TRUE")]
+    conn.close()
+    if len(usernames) < args.users:
+        parser.error(f"{args.db} has only {len(usernames)} generated users")
+    accounts = [(username, None) for username in rng.sample(usernames, args.users)] + [("admin", "admin123")] * args.admins
+    rng.shuffle(accounts)
+    clients = max(1, min(args.clients, len(accounts)))
+
+    port = free_port()
+    # Вывод сервера (письма без SMTP, ошибки) - в файл, чтобы не смешивался с отчётом
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        server = start_server(workdir, port, args.workers, log)
+        try:
+            jobs = [(f"http://127.0.0.1:{port}", accounts[i::clients], categories, args, rng.random())
+                    for i in range(clients)]
+            with Pool(clients) as pool:
+                results = pool.map(client_process, jobs)
+        finally:
+            stop_server(server)
+    print(f"Server output: {log_path}")
+
+    elapsed = max(result["elapsed"] for result in results)
+    merged = {}
+    for result in results:
+        for route, (latencies, errors) in result["stats"].items():
+            route_latencies, route_errors = merged.setdefault(route, ([], [0]))
+            route_latencies.extend(latencies)
+            route_errors[0] += errors
+    routes = {route: summarize(latencies, errors[0], elapsed) for route, (latencies, errors) in sorted(merged.items())}
+    total = summarize([latency for latencies, _ in merged.values() for latency in latencies],
+                      sum(errors[0] for _, errors in merged.values()), elapsed)
+
+    print(f"{args.users} shoppers + {args.admins} admins for {elapsed:.0f} s, {args.workers} uvicorn workers, "
+          f"{clients} load generator processes on the same machine ({os.cpu_count()} CPU cores)")
+    print(f"{'route':<30}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for route, row in list(routes.items()) + [("total", total)]:
+        print(f"{route:<30}{row['requests']:>9}{row['rps']:>9.1f}{row['p50']:>9.1f}{row['p95']:>9.1f}"
+              f"{row['p99']:>9.1f}{row['errors']:>8}")
+
+    result = {
+        "version": git_version(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "dataset": dataset_info(args.db),
+        "seconds": elapsed,
+        "routes": routes,
+        "total": total,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare and compare(result, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database, timed
+import crud
+import database
+from benchmarks.pagination import fill_products
+
+CONTRACTOR_ID = 1
+
+def fill_orders(path, orders, items_per_order, products, other_users):
+    # Один подрядчик с большой историей и много заказов других пользователей вокруг
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    order_id = 0
+    order_rows, item_rows = [], []
+    for user_id in [CONTRACTOR_ID] * orders + [rng.randint(2, other_users + 1) for _ in range(orders * 4)]:
+        order_id += 1
+        order_rows.append((order_id, user_id, 0, f"-{order_id} minutes"))
+        item_rows.extend((order_id, rng.randint(1, products), rng.randint(1, 20), 100.0)
+                         for _ in range(items_per_order))
+    conn.executemany(
+        "INSERT INTO orders (id, user_id, total_amount, created_at) VALUES (?, ?, ?, datetime('now', ?))",
+        order_rows
+    )
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                     item_rows)
+    conn.commit()
+    conn.close()
+
+async def run(args):
+    async with bench_database() as path:
+        fill_products(path, args.products)
+        started = time.perf_counter()
+        fill_orders(path, args.orders, args.items, args.products, args.other_users)
+        print(f"Inserted {args.orders * 5} orders with {args.items} items each in {time.perf_counter() - started:.1f}s")
+
+        db = await database.connect(path)
+
+        async def per_order_page(offset):
+            # Запрос на каждый заказ страницы, как делается без пакетной загрузки
+            async with db.execute(
+                "SELECT * FROM orders WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (CONTRACTOR_ID, args.page_size, offset)
+            ) as cursor:
+                orders = [dict(row) for row in await cursor.fetchall()]
+            for order in orders:
+                async with db.execute(
+                    """SELECT oi.*, p.name, p.image_url FROM order_items oi
+                       LEFT JOIN products p ON p.id = oi.product_id WHERE oi.order_id = ?""",
+                    (order["id"],)
+                ) as cursor:
+                    order["items"] = await cursor.fetchall()
+            return orders
+
+        print(f"contractor with {args.orders} orders, page size {args.page_size}")
+        print(f"{'page':>8}{'per-order ms':>14}{'batched ms':>12}")
+        page_cursor = None
+        page = 1
+        for target in args.pages:
+            while page < target and page_cursor is not False:
+                _, next_cursor, _ = await crud.get_orders_page(db, CONTRACTOR_ID, args.page_size, page_cursor)
+                page_cursor = next_cursor or False
+                page += 1
+            if page_cursor is False:
+                break
+            current = page_cursor
+            per_order = await timed(lambda: per_order_page((target - 1) * args.page_size), args.repeat)
+            batched = await timed(lambda: crud.get_orders_page(db, CONTRACTOR_ID, args.page_size, current), args.repeat)
+            print(f"{target:>8}{per_order:>14.2f}{batched:>12.2f}")
+
+        await db.execute("DELETE FROM cart")
+        reorder_ms = await timed(lambda: crud.reorder(db, CONTRACTOR_ID, 1), args.repeat)
+        print(f"reorder of a {args.items}-item order: {reorder_ms:.2f} ms")
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Order history pages: per-order queries vs one batched items query")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--other-users", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=crud.ORDERS_PAGE_SIZE)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 450])
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database, timed
+import crud
+import database
+
+CATEGORIES = ["Инструменты", "Электроинструменты", "Строительные материалы", "Пиломатериалы",
+              "Отделочные материалы", "Сантехника", "Электрика", "Крепёж"]
+
+def fill_products(path, count):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (name, description, price, category, image_url, stock_quantity) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (f"Товар {i}", "Описание товара " * 20, round(rng.uniform(0.5, 500), 2),
+             rng.choice(CATEGORIES), "/static/images/brick.jpg", rng.randint(0, 1000))
+            for i in range(count)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+async def run(args):
+    async with bench_database() as path:
+        started = time.perf_counter()
+        fill_products(path, args.products)
+        print(f"Inserted {args.products} products in {time.perf_counter() - started:.1f}s")
+
+        db = await database.connect(path, readonly=True)
+        column, order = crud.PRODUCT_SORTS[args.sort]
+        order_by = f"{column} {order}, id {order}" if column else f"id {order}"
+
+        async def offset_page(offset):
+            async with db.execute(
+                f"SELECT {crud.PRODUCT_CARD_COLUMNS} FROM products WHERE is_active = TRUE "
+                f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+                (args.page_size, offset)
+            ) as cursor:
+                return await cursor.fetchall()
+
+        print(f"sort={args.sort}, page size {args.page_size}")
+        print(f"{'page':>10}{'OFFSET ms':>12}{'keyset ms':>12}")
+        for page in args.pages:
+            offset = (page - 1) * args.page_size
+            if offset >= args.products:
+                continue
+            page_cursor = None
+            if offset:
+                previous = (await offset_page(offset - 1))[0]
+                page_cursor = crud.encode_cursor(args.sort, "next", previous)
+
+            keyset_rows = (await crud.get_products_page(
+                db, limit=args.page_size, sort=args.sort, page_cursor=page_cursor))[0]
+            assert [row["id"] for row in keyset_rows] == [row["id"] for row in await offset_page(offset)]
+
+            offset_ms = await timed(lambda: offset_page(offset), args.repeat)
+            keyset_ms = await timed(lambda: crud.get_products_page(
+                db, limit=args.page_size, sort=args.sort, page_cursor=page_cursor), args.repeat)
+            print(f"{page:>10}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="OFFSET vs keyset pagination of the catalog")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=crud.PRODUCTS_PAGE_SIZE)
+    parser.add_argument("--sort", default="price_asc", choices=sorted(crud.PRODUCT_SORTS))
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 40000])
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import percentile
+from passwords import Argon2Hasher, BcryptHasher
+
+SETTINGS = [
+    ("argon2 t=1 m=19MiB", lambda: Argon2Hasher(time_cost=1, memory_cost=19456, parallelism=1)),
+    ("argon2 t=2 m=19MiB", lambda: Argon2Hasher(time_cost=2, memory_cost=19456, parallelism=1)),
+    ("argon2 t=3 m=64MiB", lambda: Argon2Hasher(time_cost=3, memory_cost=65536, parallelism=1)),
+    ("bcrypt rounds=10", lambda: BcryptHasher(rounds=10)),
+    ("bcrypt rounds=12", lambda: BcryptHasher(rounds=12)),
+]
+
+async def run_logins(hasher, hashed, logins, concurrency, workers):
+    executor = ThreadPoolExecutor(max_workers=workers)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await loop.run_in_executor(executor, hasher.verify, "correct horse", hashed)
+            latencies.append(time.perf_counter() - started)
+            assert ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return latencies, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Login latency for each password hashing cost setting")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"{args.logins} logins, {args.concurrency} concurrent, {args.workers} hash workers, {cores} cores")
+    print(f"{'setting':<22}{'single ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'logins/s':>10}{'/core/s':>10}")
+    for name, factory in SETTINGS:
+        hasher = factory()
+        hashed = hasher.hash("correct horse")
+
+        started = time.perf_counter()
+        hasher.verify("correct horse", hashed)
+        single = time.perf_counter() - started
+
+        latencies, elapsed = asyncio.run(
+            run_logins(hasher, hashed, args.logins, args.concurrency, args.workers)
+        )
+        throughput = args.logins / elapsed
+        print(
+            f"{name:<22}{single * 1000:>10.1f}"
+            f"{statistics.median(latencies) * 1000:>10.1f}{percentile(latencies, 0.99):>10.1f}"
+            f"{throughput:>10.1f}{throughput / min(cores, args.workers):>10.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import csv
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+
+import database
+import product_io
+from benchmarks.common import bench_database
+from benchmarks.pagination import CATEGORIES
+
+def write_price_list(path, count, price_factor=1.0, prefix="ART"):
+    rng = random.Random(42)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["sku", "name", "description", "price", "category", "stock_quantity"])
+        for i in range(count):
+            writer.writerow([
+                f"{prefix}-{i:07d}", f"Товар {i}", "Описание товара из прайс-листа поставщика",
+                f"{round(rng.uniform(0.5, 500) * price_factor, 2)}".replace(".", ","),
+                rng.choice(CATEGORIES), rng.randint(0, 1000),
+            ])
+
+def other_process_writer(path, stop, waits, errors):
+    # Запись другого воркера: своё соединение с тем же busy_timeout, что у пула.
+    # Запись настоящая: UPDATE без изменений не фиксирует страниц и не виден по data_version
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=5000")
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            conn.execute("INSERT INTO feedback (subject, message, email) VALUES ('Тема', 'Сообщение', 'c@example.com')")
+        except sqlite3.OperationalError:
+            errors.append(1)
+        waits.append(time.perf_counter() - started)
+        time.sleep(0.02)
+    conn.close()
+
+async def timed_import(path, mode, writers=True):
+    # Копия: импорт удаляет файл по окончании
+    copy = path + ".copy"
+    shutil.copyfile(path, copy)
+    job = product_io.ImportJob(os.path.basename(path), "csv", mode)
+    if not writers:
+        started = time.perf_counter()
+        await product_io.run_import(job, copy)
+        assert job.status == "done", job.message
+        return job, time.perf_counter() - started, None
+    # Во время импорта корзины и заказы этого процесса и записи других процессов ждут блокировку записи
+    local_waits, other_waits, other_errors = [], [], []
+    stop = threading.Event()
+    other = threading.Thread(target=other_process_writer, args=(database.DATABASE_URL, stop, other_waits, other_errors))
+    other.start()
+
+    async def local_writer():
+        while not stop.is_set():
+            started = time.perf_counter()
+            async with database.write_connection() as db:
+                await db.execute("UPDATE summary_counts SET value = value WHERE name = 'users'")
+                await db.commit()
+            local_waits.append(time.perf_counter() - started)
+            await asyncio.sleep(0.02)
+
+    writer = asyncio.create_task(local_writer())
+    started = time.perf_counter()
+    await product_io.run_import(job, copy)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await writer
+    await asyncio.to_thread(other.join)
+    assert job.status == "done", job.message
+    return job, elapsed, {"local": max(local_waits, default=0), "other": max(other_waits, default=0),
+                          "locked": len(other_errors)}
+
+async def measure(args, path):
+    workdir = os.path.dirname(path)
+    await database.open_pool()
+
+    price_list = os.path.join(workdir, "prices.csv")
+    write_price_list(price_list, args.rows)
+    changed_list = os.path.join(workdir, "prices-changed.csv")
+    write_price_list(changed_list, args.rows, price_factor=1.1)
+    new_list = os.path.join(workdir, "prices-new.csv")
+    write_price_list(new_list, args.rows, prefix="NEW")
+    print(f"price list: {args.rows} rows, {os.path.getsize(price_list) / 2**20:.0f} MiB")
+
+    # Построчная вставка с коммитом на каждую строку - как без пакетного импорта
+    sample = min(args.rows, 2000)
+    rows = [("ROW-%d" % i, f"Товар {i}", "", 1.0, "Крепёж", None, 1, True) for i in range(sample)]
+    started = time.perf_counter()
+    async with database.write_connection() as db:
+        for row in rows:
+            await db.execute(product_io.PRODUCT_INSERT_NEW, row)
+            await db.commit()
+    per_row = (time.perf_counter() - started) / sample
+    print(f"{'row by row (estimate)':<28}{per_row * args.rows:>8.1f}s{1 / per_row:>12.0f} rows/s")
+
+    # Без других писателей импорт не делает пауз между транзакциями; с ними - уступает блокировку.
+    # 1М строк: без других писателей 125,5 с, с писателями 169,5 с (ожидание записи до 1,5 с),
+    # upsert без изменений 53,1 с, upsert со всеми новыми ценами 186,5 с; построчно - около 142 с
+    print(f"{'':<48}max write wait: this process / other process, 'database is locked'")
+    for label, source, mode, writers in (("insert, no other writers", price_list, "insert", False),
+                                         ("insert", new_list, "insert", True),
+                                         ("upsert, nothing changed", price_list, "upsert", True),
+                                         ("upsert, all prices changed", changed_list, "upsert", True)):
+        job, elapsed, waits = await timed_import(source, mode, writers)
+        line = f"{label:<28}{elapsed:>8.1f}s{job.processed / elapsed:>12.0f} rows/s"
+        if waits:
+            line += f"{waits['local'] * 1000:>10.0f} ms{waits['other'] * 1000:>8.0f} ms{waits['locked']:>5}"
+        print(f"{line}  (+{job.inserted} ~{job.updated} ={job.skipped} !{job.rejected})")
+
+    started = time.perf_counter()
+    size = 0
+    async for chunk in product_io.export_products("csv"):
+        size += len(chunk)
+    elapsed = time.perf_counter() - started
+    print(f"{'export csv':<28}{elapsed:>8.1f}s{args.rows / elapsed:>12.0f} rows/s  ({size / 2**20:.0f} MiB)")
+
+async def run(args):
+    async with bench_database() as path:
+        await measure(args, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk CSV import and export of the catalog")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+import time
+
+from benchmarks.common import app_client
+
+def main():
+    parser = argparse.ArgumentParser(description="Requests/sec for GET /products/")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--path", default="/products/")
+    args = parser.parse_args()
+
+    with app_client() as client:
+        for _ in range(20):
+            client.get(args.path)
+
+        count = 0
+        started = time.perf_counter()
+        deadline = started + args.seconds
+        while time.perf_counter() < deadline:
+            response = client.get(args.path)
+            assert response.status_code == 200, response.status_code
+            count += 1
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.path}: {count} requests in {elapsed:.2f}s, {count / elapsed:.1f} req/s")
+
+if __name__ == "__main__":
+    main()
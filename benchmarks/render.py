@@ -0,0 +1,86 @@
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from starlette.requests import Request
+
+from benchmarks.common import ROOT
+
+def make_products(count):
+    return [
+        {
+            "id": i, "name": f"Перфоратор профессиональный {i}",
+            "description": "Мощный перфоратор для бетона и кирпича, три режима работы, кейс в комплекте. " * 2,
+            "price": 1000.0 + i, "category": "Электроинструменты", "image_url": "/static/images/perforator.jpg",
+            "stock_quantity": i % 50, "created_at": "2024-01-01 00:00:00", "version": 1,
+        }
+        for i in range(1, count + 1)
+    ]
+
+def page_context(products):
+    request = Request({"type": "http", "method": "GET", "path": "/products/", "query_string": b"",
+                       "headers": [(b"cookie", b"access_token=bearer x")]})
+    return {
+        "request": request, "products": products,
+        "categories": [{"category": "Электроинструменты", "product_count": len(products)}],
+        "selected_category": None, "sort": "newest", "sort_labels": {"newest": "Сначала новые"},
+        "next_url": "/products/?cursor=x", "prev_url": None,
+        "current_user": {"id": 1, "username": "admin", "is_superuser": True}, "cart_count": 3,
+    }
+
+def compile_time(bytecode_dir):
+    from templating import templates
+
+    # Новое окружение без кеша шаблонов в памяти, как у только что запущенного воркера
+    env = Environment(loader=FileSystemLoader(os.path.join(ROOT, "templates")), autoescape=True,
+                      bytecode_cache=FileSystemBytecodeCache(bytecode_dir) if bytecode_dir else None)
+    env.filters.update(templates.env.filters)
+    env.globals.update(templates.env.globals)
+    started = time.perf_counter()
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+    return (time.perf_counter() - started) * 1000
+
+def render_times(template, context, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        template.render(context)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description="Template compile and products.html render time")
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    bytecode_dir = tempfile.mkdtemp(prefix="store-bench-")
+    cold = compile_time(None)
+    compile_time(bytecode_dir)
+    warm = compile_time(bytecode_dir)
+    shutil.rmtree(bytecode_dir)
+    print(f"compile all templates: {cold:.1f} ms from source, {warm:.1f} ms from bytecode cache")
+
+    from cache import fragment_cache
+    from templating import templates
+
+    template = templates.get_template("products.html")
+    context = page_context(make_products(args.products))
+
+    maxsize = fragment_cache.maxsize
+    fragment_cache.maxsize = 0
+    uncached = render_times(template, context, args.repeat)
+    fragment_cache.maxsize = maxsize
+    template.render(context)
+    cached = render_times(template, context, args.repeat)
+    print(f"products.html with {args.products} products: {uncached:.2f} ms without fragment cache, "
+          f"{cached:.2f} ms with warm fragment cache ({uncached / cached:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database, timed
+import crud
+import database
+from benchmarks.pagination import fill_products
+
+# Те же отчёты прямыми агрегатами по orders/order_items, как без таблиц-сводок
+AD_HOC = {
+    "by day": """SELECT date(created_at) AS day, COUNT(*), SUM(total_amount) FROM orders
+                 WHERE created_at > date('now', '-30 days') GROUP BY day ORDER BY day DESC""",
+    "by week": """SELECT date(created_at, 'weekday 0', '-6 days') AS week, COUNT(*), SUM(total_amount)
+                  FROM orders GROUP BY week ORDER BY week DESC LIMIT 12""",
+    "top products": """SELECT product_id, SUM(quantity), SUM(quantity * price) AS revenue FROM order_items
+                       GROUP BY product_id ORDER BY revenue DESC LIMIT 10""",
+    "by category": """SELECT p.category, SUM(oi.quantity), SUM(oi.quantity * oi.price) AS revenue
+                      FROM order_items oi JOIN products p ON p.id = oi.product_id
+                      GROUP BY p.category ORDER BY revenue DESC""",
+    "basket": "SELECT COUNT(*), SUM(total_amount), (SELECT SUM(quantity) FROM order_items) FROM orders",
+}
+
+ROLLUPS = {
+    "by day": crud.get_sales_by_day,
+    "by week": crud.get_sales_by_week,
+    "top products": crud.get_top_products,
+    "by category": crud.get_sales_by_category,
+    "basket": crud.get_summary_counts,
+}
+
+def fill_orders(path, orders, products):
+    # Заказы за последние два года; триггеры миграции 8 обновляют сводки при вставке
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    order_rows, item_rows = [], []
+    for order_id in range(1, orders + 1):
+        items = [(order_id, rng.randint(1, products), rng.randint(1, 5), round(rng.uniform(1, 500), 2))
+                 for _ in range(rng.randint(1, 4))]
+        total = sum(quantity * price for _, _, quantity, price in items)
+        order_rows.append((order_id, rng.randint(1, 1000), total, f"-{rng.randint(0, 730 * 24 * 60)} minutes"))
+        item_rows.extend(items)
+    conn.executemany(
+        "INSERT INTO orders (id, user_id, total_amount, created_at) VALUES (?, ?, ?, datetime('now', ?))",
+        order_rows
+    )
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                     item_rows)
+    conn.commit()
+    conn.close()
+    return len(item_rows)
+
+async def run(args):
+    async with bench_database() as path:
+        fill_products(path, args.products)
+        started = time.perf_counter()
+        items = fill_orders(path, args.orders, args.products)
+        print(f"Inserted {args.orders} orders ({items} items) in {time.perf_counter() - started:.1f}s")
+
+        db = await database.connect(path, readonly=True)
+
+        async def ad_hoc(sql):
+            async with db.execute(sql) as cursor:
+                return await cursor.fetchall()
+
+        print(f"{'report':<16}{'aggregate ms':>14}{'rollup ms':>12}")
+        for name, sql in AD_HOC.items():
+            scan = await timed(lambda: ad_hoc(sql), args.repeat)
+            rollup = await timed(lambda: ROLLUPS[name](db), args.repeat)
+            print(f"{name:<16}{scan:>14.2f}{rollup:>12.2f}")
+        low_stock = await timed(lambda: crud.get_low_stock_products(db), args.repeat)
+        print(f"{'low stock':<16}{'':>14}{low_stock:>12.2f}")
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sales reports: ad-hoc aggregates vs trigger-maintained rollups")
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
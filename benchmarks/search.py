@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import time
+
+from benchmarks.common import bench_database
+import crud
+import database
+
+NOUNS = ["Цемент", "Перфоратор", "Шуруповерт", "Молоток", "Краска", "Плитка", "Кирпич", "Доска",
+         "Саморез", "Шпатлевка", "Грунтовка", "Ламинат", "Гипсокартон", "Утеплитель", "Клей",
+         "Дрель", "Болгарка", "Уровень", "Рулетка", "Герметик", "Профиль", "Брус", "Фанера", "Смеситель"]
+ADJECTIVES = ["строительный", "акриловая", "керамическая", "аккумуляторный", "профессиональный",
+              "влагостойкий", "белая", "обрезная", "монтажный", "универсальный", "усиленный", "сетевой"]
+WORDS = ("для внутренних и наружных работ высокая прочность быстрое высыхание морозостойкий "
+         "мешок упаковка ручка корпус мощность комплект поставки гарантия производитель").split()
+CATEGORIES = ["Инструменты", "Электроинструменты", "Строительные материалы", "Пиломатериалы",
+              "Отделочные материалы", "Сантехника", "Электрика", "Крепёж"]
+QUERIES = ["цемент", "перфоратор", "краска белая", "шуруп", "гипсокартон влагостойкий",
+           "цемента", "перфораторы", "дрел", "сантехника", "xyz"]
+SYLLABLES = ["ка", "ро", "ме", "ли", "ту", "ва", "не", "до", "пи", "зу", "ша", "фо", "гре", "стан", "бло"]
+
+def pseudo_words(rng, count, syllables):
+    return ["".join(rng.choice(SYLLABLES) for _ in range(syllables)) for _ in range(count)]
+
+def fill_products(path, count, product_types):
+    # Реалистичная селективность: каждый тип товара встречается примерно в count / product_types строках
+    rng = random.Random(7)
+    nouns = NOUNS + [word.capitalize() for word in pseudo_words(rng, product_types - len(NOUNS), 4)]
+    categories = CATEGORIES + [word.capitalize() for word in pseudo_words(rng, 40, 3)]
+    vocabulary = WORDS + pseudo_words(rng, 5000, 3)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (name, description, price, category, image_url, stock_quantity) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (f"{rng.choice(nouns)} {rng.choice(ADJECTIVES)} {i}",
+             " ".join(rng.choice(vocabulary) for _ in range(25)),
+             round(rng.uniform(0.5, 500), 2), rng.choice(categories), None, rng.randint(0, 1000))
+            for i in range(count)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+async def run(args):
+    async with bench_database() as path:
+        started = time.perf_counter()
+        fill_products(path, args.products, args.product_types)
+        print(f"Inserted and indexed {args.products} products in {time.perf_counter() - started:.1f}s")
+
+        db = await database.connect(path, readonly=True)
+        print(f"{'query':<28}{'matches':>8}{'relaxed':>9}{'p50 ms':>9}{'max ms':>9}")
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows, relaxed = await crud.search_products(db, query, limit=args.limit)
+                timings.append((time.perf_counter() - started) * 1000)
+            terms = crud.search_terms(query, relaxed)
+            async with db.execute(
+                "SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH ?",
+                (crud.build_search_query(terms, relaxed),)
+            ) as cursor:
+                matches = (await cursor.fetchone())[0] if terms else 0
+            print(f"{query:<28}{matches:>8}{str(relaxed):>9}{statistics.median(timings):>9.2f}{max(timings):>9.2f}")
+        await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search latency on a synthetic catalog")
+    parser.add_argument("--products", type=int, default=500_000)
+    parser.add_argument("--product-types", type=int, default=2000,
+                        help="distinct product nouns; controls how many rows a query matches")
+    parser.add_argument("--limit", type=int, default=crud.SEARCH_LIMIT)
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+
+from benchmarks.common import bench_database, percentile
+import crud
+import database
+import maintenance
+
+MODES = ["no maintenance", "maintenance", "maintenance + backup"]
+
+def seed(path: str, products: int, users: int):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO products (sku, name, description, price, category, stock_quantity) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"WAL-{i}", f"Товар {i}", "Описание товара " * 20, random.uniform(10, 5000), f"Категория {i % 30}", 1000)
+         for i in range(products)]
+    )
+    conn.executemany(
+        "INSERT INTO users (email, username, hashed_password) VALUES (?, ?, '')",
+        [(f"wal{i}@example.com", f"wal{i}") for i in range(users)]
+    )
+    # Задачи по расписанию не мешают замеру; копия запускается только в своём режиме
+    conn.execute("UPDATE maintenance_tasks SET next_run = ?", (time.time() + 86400,))
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'wal%'")]
+    conn.close()
+    return user_ids
+
+async def run_mode(mode: str, args) -> dict:
+    async with bench_database() as path:
+        return await measure_mode(path, mode, args)
+
+async def measure_mode(path: str, mode: str, args) -> dict:
+    user_ids = seed(path, args.products, args.writers)
+    await database.open_pool()
+    runner = None
+    if mode != "no maintenance":
+        maintenance.MAINTENANCE_POLL_INTERVAL = args.poll
+        runner = await maintenance.start_maintenance()
+
+    writes, reads = [], []
+    wal_max = 0
+    started = time.perf_counter()
+    deadline = started + args.seconds
+
+    async def writer(user_id):
+        i = 0
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            async with database.write_connection() as db:
+                await crud.add_to_cart(db, user_id, random.randint(1, args.products), 1)
+                await db.execute(
+                    "INSERT INTO feedback (user_id, subject, message, email) VALUES (?, ?, ?, ?)",
+                    (user_id, f"Тема {i}", "Сообщение " * 5, "client@example.com")
+                )
+                await db.commit()
+            writes.append(time.perf_counter() - begin)
+            i += 1
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            async with database.read_connection() as db:
+                await crud.get_product(db, random.randint(1, args.products))
+                async with db.execute(
+                    "SELECT id, name, price FROM products WHERE is_active = TRUE AND category = ? "
+                    "ORDER BY price LIMIT 20",
+                    (f"Категория {random.randint(0, 29)}",)
+                ) as cursor:
+                    await cursor.fetchall()
+            reads.append(time.perf_counter() - begin)
+
+    async def slow_export():
+        # Медленно читаемая выгрузка держит снимок: пока она идёт, WAL не может начаться заново
+        await asyncio.sleep(args.seconds / 4)
+        async with database.read_connection() as db:
+            async with db.execute("SELECT * FROM products ORDER BY id") as cursor:
+                while time.perf_counter() < started + args.seconds * 3 / 4:
+                    if not await cursor.fetchmany(50):
+                        break
+                    await asyncio.sleep(0.05)
+
+    async def backup():
+        await asyncio.sleep(args.seconds / 4)
+        runner.request("backup")
+
+    async def watch_wal():
+        nonlocal wal_max
+        while time.perf_counter() < deadline:
+            wal_max = max(wal_max, maintenance.wal_size(path))
+            await asyncio.sleep(0.05)
+
+    tasks = [writer(user_id) for user_id in user_ids] + [reader() for _ in range(args.readers)] + [watch_wal()]
+    tasks.append(backup() if mode == "maintenance + backup" else slow_export())
+    try:
+        await asyncio.gather(*tasks)
+        wal_end = maintenance.wal_size(path)
+    finally:
+        if runner is not None:
+            await maintenance.stop_maintenance()
+        await database.close_pool()
+
+    conn = sqlite3.connect(path)
+    done = {row[0]: row[1:] for row in conn.execute("SELECT name, seconds, finished_at FROM maintenance_tasks")}
+    conn.close()
+    backups = maintenance.list_backups(path)
+    return {
+        "wps": len(writes) / args.seconds,
+        "write_p99": percentile(writes, 0.99),
+        "read_p50": percentile(reads, 0.5),
+        "read_p99": percentile(reads, 0.99),
+        "wal_max": wal_max / 2**20,
+        "wal_end": wal_end / 2**20,
+        "truncated": "yes" if done["checkpoint"][1] else "no",
+        "backup": f"{done['backup'][0]:.1f} s, {backups[0]['size'] / 2**20:.0f} MiB" if backups else "-",
+    }
+
+async def run(args):
+    # Порог обрезки и journal_size_limit уменьшены, чтобы WAL успел их превысить за время замера
+    maintenance.WAL_TRUNCATE_SIZE = int(args.wal_limit_mb * 2**20)
+    database.CONNECTION_PRAGMAS = tuple(
+        f"PRAGMA journal_size_limit={maintenance.WAL_TRUNCATE_SIZE};" if pragma.startswith("PRAGMA journal_size_limit")
+        else pragma
+        for pragma in database.CONNECTION_PRAGMAS
+    )
+    print(f"{args.writers} writers, {args.readers} readers for {args.seconds:.0f} s; {args.products} products; "
+          f"maintenance every {args.poll} s, WAL truncated above {args.wal_limit_mb:.0f} MiB")
+    print("without backup a slow export holds a snapshot through the middle half of the run")
+    print(f"{'mode':<24}{'writes/s':>10}{'w p99 ms':>10}{'r p50 ms':>10}{'r p99 ms':>10}"
+          f"{'WAL max':>9}{'WAL end':>9}{'TRUNCATE':>10}  backup")
+    for mode in args.modes:
+        result = await run_mode(mode, args)
+        print(f"{mode:<24}{result['wps']:>10.1f}{result['write_p99']:>10.2f}{result['read_p50']:>10.2f}"
+              f"{result['read_p99']:>10.2f}{result['wal_max']:>8.1f}M{result['wal_end']:>8.1f}M"
+              f"{result['truncated']:>10}  {result['backup']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="WAL growth, checkpoints and online backup under read/write load")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between maintenance cycles")
+    parser.add_argument("--wal-limit-mb", type=float, default=8.0)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import httpx
+
+from benchmarks.common import ROOT
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workdir: str, port: int, workers: int, log=None) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=ROOT, DATABASE_URL=os.path.join(workdir, "bench.db"), WORKERS=str(workers))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env, stdout=log, stderr=log
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("server did not start")
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+async def load(base_url: str, paths: list, concurrency: int, seconds: float):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def user(client, offset):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get(paths[i % len(paths)])
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+            i += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        # Каталог доступен только после входа
+        await client.post("/users/login", data={"username": "admin", "password": "admin123"})
+        await asyncio.gather(*(user(client, i) for i in range(concurrency)))
+    return latencies, errors
+
+def client_process(args):
+    return asyncio.run(load(*args))
+
+def run(workdir: str, workers: int, args) -> dict:
+    port = free_port()
+    server = start_server(workdir, port, workers)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        per_client = max(1, args.concurrency // args.clients)
+        # Прогрев: шаблоны, кеши и соединения всех процессов
+        with Pool(args.clients) as pool:
+            pool.map(client_process, [(base_url, args.paths, per_client, 1.0)] * args.clients)
+            started = time.perf_counter()
+            results = pool.map(client_process, [(base_url, args.paths, per_client, args.seconds)] * args.clients)
+            elapsed = time.perf_counter() - started
+    finally:
+        stop_server(server)
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": sum(result[1] for result in results),
+    }
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Throughput of uvicorn with 1..N worker processes")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, max(1, cores // 2), cores}))
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="simultaneous requests in total")
+    parser.add_argument("--clients", type=int, default=2, help="load generator processes")
+    parser.add_argument("--paths", nargs="+", default=["/products/", "/products/1", "/"])
+    args = parser.parse_args()
+
+    # Сервер работает в отдельном каталоге со свежей БД, рабочая construction_store.db не затрагивается
+    workdir = tempfile.mkdtemp(prefix="store-bench-")
+    for name in ("templates", "static"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+
+    print(f"{cores} CPU cores; load generator uses {args.clients} processes on the same machine")
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = run(workdir, workers, args)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>8}{result['rps']:>10.1f}{result['rps'] / baseline:>10.2f}"
+              f"{result['p50']:>10.2f}{result['p99']:>10.2f}{result['errors']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from settings import (
+    CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL, FRAGMENT_CACHE_SIZE,
+    FRAGMENT_CACHE_TTL
+)
+
+MISSING = object()
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after ttl seconds."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is MISSING:
+            value = await loader()
+            self.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Витрина, список категорий с количеством товаров и отдельные товары
+catalog_cache = TTLCache("catalog", CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL)
+# Строки users по username для определения текущего пользователя
+user_cache = TTLCache("users", USER_CACHE_SIZE, USER_CACHE_TTL)
+# Готовая разметка карточек товаров; ключ содержит версию строки, поэтому
+# устаревшие записи не читаются и просто вытесняются
+fragment_cache = TTLCache("fragments", FRAGMENT_CACHE_SIZE, FRAGMENT_CACHE_TTL)
+
+class CatalogVersion:
+    """Counter behind catalog ETags; bumped together with catalog cache invalidation."""
+
+    def __init__(self):
+        self.version = 0
+        self.last_modified = int(time.time())
+
+    def load(self, version: int, last_modified: int):
+        self.version = version
+        self.last_modified = last_modified
+
+    def bump(self):
+        self.version += 1
+        self.last_modified = int(time.time())
+
+catalog_version = CatalogVersion()
+
+def invalidate_catalog():
+    catalog_cache.clear()
+    catalog_version.bump()
+
+def invalidate_products(product_ids):
+    # Остатки отдельных товаров не влияют на витрину и счётчики категорий
+    for product_id in product_ids:
+        catalog_cache.invalidate(("product", product_id))
+    catalog_version.bump()
+
+# Счётчики из БД, с которыми согласованы кеши этого процесса
+_shared_state = None
+
+def apply_shared_state(version: int, updated_at: int, listing_version: int, users_version: int):
+    """Bring caches in line with version counters that triggers bump on every write, from any process."""
+    global _shared_state
+    previous = _shared_state
+    _shared_state = (version, updated_at, listing_version, users_version)
+    # При старте берётся счётчик из catalog_state, поэтому ETag совпадают во всех процессах
+    # и не повторяются после перезапуска
+    catalog_version.load(version, updated_at)
+    if previous is None:
+        return
+    if listing_version != previous[2]:
+        catalog_cache.clear()
+    elif version != previous[0]:
+        # Изменились только остатки неизвестно каких товаров: витрина и счётчики категорий остаются
+        catalog_cache.invalidate_where(lambda key: isinstance(key, tuple) and key[0] == "product")
+    if users_version != previous[3]:
+        user_cache.clear()
+
+def all_caches():
+    return [catalog_cache, user_cache, fragment_cache]
@@ -1,10 +1,14 @@
 from typing import List, Optional
 import aiosqlite
-from schemas import UserCreate, ProductCreate, FeedbackCreate
+import base64
+import json
+import re
+import time
+from schemas import UserCreate, ProductCreate, FeedbackCreate, SQLITE_INTEGER_MIN, SQLITE_INTEGER_MAX
+from cache import catalog_cache
 
 # User operations
-async def create_user(db: aiosqlite.Connection, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+async def create_user(db: aiosqlite.Connection, user: UserCreate, hashed_password: str):
     async with db.execute(
         "INSERT INTO users (email, username, hashed_password, full_name) VALUES (?, ?, ?, ?)",
         (user.email, user.username, hashed_password, user.full_name)
@@ -21,51 +25,245 @@ async def get_user_by_email(db: aiosqlite.Connection, email: str):
         return await cursor.fetchone()
 
 # Product operations
-async def get_products(db: aiosqlite.Connection, skip: int = 0, limit: int = 100, 
-                      category: Optional[str] = None):
+PRODUCTS_PAGE_SIZE = 24
+PRODUCTS_PAGE_MAX = 100
+
+# Колонки карточки товара в каталоге: описание обрезается на стороне БД
+PRODUCT_CARD_COLUMNS = (
+    "id, name, substr(description, 1, 160) AS description, price, category, "
+    "image_url, stock_quantity, created_at, version"
+)
+
+# Сортировка: (колонка ключа или None для id, порядок)
+PRODUCT_SORTS = {
+    "newest": (None, "DESC"),
+    "price_asc": ("price", "ASC"),
+    "price_desc": ("price", "DESC"),
+    "name": ("name", "ASC"),
+}
+
+def _is_bindable(value) -> bool:
+    # Ключ курсора уходит в SQL параметром: объект, слишком большое число или строка с
+    # суррогатами из подделанного курсора дали бы ошибку sqlite вместо "неверный курсор"
+    if isinstance(value, int):
+        return SQLITE_INTEGER_MIN <= value <= SQLITE_INTEGER_MAX
+    if isinstance(value, float):
+        return True
+    if isinstance(value, str):
+        try:
+            value.encode()
+        except UnicodeEncodeError:
+            return False
+        return True
+    return False
+
+def _check_cursor_key(key: list):
+    *values, row_id = key
+    if not (isinstance(row_id, int) and not isinstance(row_id, bool) and _is_bindable(row_id)
+            and all(_is_bindable(value) for value in values)):
+        raise ValueError("Invalid cursor")
+
+def encode_cursor(sort: str, direction: str, row) -> str:
+    column, _ = PRODUCT_SORTS[sort]
+    key = [row[column], row["id"]] if column else [row["id"]]
+    raw = json.dumps([sort, direction] + key, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, direction, *key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    column, _ = PRODUCT_SORTS[sort]
+    if cursor_sort != sort or direction not in ("next", "prev") or len(key) != (2 if column else 1):
+        raise ValueError("Invalid cursor")
+    _check_cursor_key(key)
+    return direction, key
+
+async def get_products_page(db: aiosqlite.Connection, limit: int = PRODUCTS_PAGE_SIZE,
+                            category: Optional[str] = None, sort: str = "newest",
+                            page_cursor: Optional[str] = None):
+    """Keyset-paginated catalog page: returns (products, next_cursor, prev_cursor)."""
+    if sort not in PRODUCT_SORTS:
+        sort = "newest"
+    limit = max(1, min(limit, PRODUCTS_PAGE_MAX))
+    column, order = PRODUCT_SORTS[sort]
+    direction, key = decode_cursor(page_cursor, sort) if page_cursor else ("next", None)
+    
+    # Для предыдущей страницы идём по индексу в обратную сторону
+    backwards = direction == "prev"
+    if backwards:
+        order = "DESC" if order == "ASC" else "ASC"
+    
+    sort_key = f"({column}, id)" if column else "id"
+    conditions = ["is_active = TRUE"]
+    params = []
     if category:
-        async with db.execute(
-            "SELECT * FROM products WHERE is_active = TRUE AND category = ? LIMIT ? OFFSET ?",
-            (category, limit, skip)
-        ) as cursor:
-            return await cursor.fetchall()
+        conditions.append("category = ?")
+        params.append(category)
+    if key is not None:
+        placeholders = "(?, ?)" if column else "?"
+        conditions.append(f"{sort_key} {'>' if order == 'ASC' else '<'} {placeholders}")
+        params.extend(key)
+    order_by = f"{column} {order}, id {order}" if column else f"id {order}"
+    
+    async with db.execute(
+        f"SELECT {PRODUCT_CARD_COLUMNS} FROM products WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {order_by} LIMIT ?",
+        params + [limit + 1]
+    ) as cursor:
+        rows = await cursor.fetchall()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, has_more
     else:
+        has_next, has_prev = has_more, key is not None
+    
+    next_cursor = encode_cursor(sort, "next", rows[-1]) if rows and has_next else None
+    prev_cursor = encode_cursor(sort, "prev", rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+async def get_product(db: aiosqlite.Connection, product_id: int):
+    async def load():
+        async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
+            return await cursor.fetchone()
+    return await catalog_cache.get_or_load(("product", product_id), load)
+
+async def get_featured_products(db: aiosqlite.Connection, limit: int = 6):
+    async def load():
+        async with db.execute("SELECT * FROM products WHERE is_active = TRUE LIMIT ?", (limit,)) as cursor:
+            return await cursor.fetchall()
+    return await catalog_cache.get_or_load(("featured", limit), load)
+
+async def get_category_counts(db: aiosqlite.Connection):
+    async def load():
         async with db.execute(
-            "SELECT * FROM products WHERE is_active = TRUE LIMIT ? OFFSET ?",
-            (limit, skip)
+            "SELECT category, COUNT(*) AS product_count FROM products WHERE is_active = TRUE GROUP BY category"
         ) as cursor:
             return await cursor.fetchall()
+    return await catalog_cache.get_or_load("category_counts", load)
 
-async def get_product(db: aiosqlite.Connection, product_id: int):
-    async with db.execute("SELECT * FROM products WHERE id = ?", (product_id,)) as cursor:
-        return await cursor.fetchone()
+async def get_categories(db: aiosqlite.Connection, limit: Optional[int] = None):
+    categories = [row["category"] for row in await get_category_counts(db)]
+    return categories[:limit] if limit else categories
+
+# Full-text search
+SEARCH_LIMIT = 48
+SEARCH_SNIPPET_WORDS = 16
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+# Границы подсветки; заменяются на <mark> после экранирования в шаблоне
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+def search_terms(text: str, relaxed: bool = False) -> List[str]:
+    # В каталоге принято писать "е" вместо "ё"
+    tokens = [token.lower().replace("ё", "е") for token in SEARCH_TOKEN_RE.findall(text)][:10]
+    if relaxed:
+        # Отбрасываем окончание слова, чтобы найти другие словоформы и опечатки
+        # в конце слова: "цемента" -> "цемен", "перфораторы" -> "перфорато"
+        return [token[:max(3, len(token) - 2)] for token in tokens]
+    return tokens
+
+def build_search_query(terms: List[str], relaxed: bool = False) -> str:
+    return (" OR " if relaxed else " ").join(f'"{term}"*' for term in terms)
+
+def _terms_pattern(terms: List[str]):
+    alternatives = "|".join(re.escape(term).replace("е", "[её]") for term in terms)
+    return re.compile(rf"\b(?:{alternatives})\w*", re.IGNORECASE)
+
+def mark_terms(text: Optional[str], pattern) -> str:
+    if not text:
+        return ""
+    return pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", text)
+
+def make_snippet(text: Optional[str], pattern, size: int = SEARCH_SNIPPET_WORDS) -> str:
+    words = (text or "").split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(0, min(first - size // 4, len(words) - size))
+    fragment = " ".join(words[start:start + size])
+    prefix = "… " if start > 0 else ""
+    suffix = " …" if start + size < len(words) else ""
+    return prefix + mark_terms(fragment, pattern) + suffix
+
+async def search_products(db: aiosqlite.Connection, text: str, limit: int = SEARCH_LIMIT):
+    """Ranked catalog search: returns (products, relaxed) where relaxed marks fuzzy results."""
+    strict_terms = search_terms(text)
+    if not strict_terms:
+        return [], False
+    
+    for relaxed in (False, True):
+        terms = search_terms(text, relaxed) if relaxed else strict_terms
+        if relaxed and terms == strict_terms:
+            break
+        
+        # FTS только ранжирует; строки товаров читаются по первичному ключу
+        async with db.execute('''
+            SELECT rowid FROM products_fts
+            WHERE products_fts MATCH ?
+            ORDER BY bm25(products_fts, 10.0, 1.0, 5.0)
+            LIMIT ?
+        ''', (build_search_query(terms, relaxed), limit)) as cursor:
+            ids = [row[0] for row in await cursor.fetchall()]
+        if not ids:
+            continue
+        
+        placeholders = ", ".join("?" * len(ids))
+        async with db.execute(
+            f"SELECT id, name, description, price, category, image_url, stock_quantity "
+            f"FROM products WHERE id IN ({placeholders}) AND is_active = TRUE",
+            ids
+        ) as cursor:
+            rows = {row["id"]: row for row in await cursor.fetchall()}
+        
+        pattern = _terms_pattern(terms)
+        products = []
+        for product_id in ids:
+            if product_id in rows:
+                product = dict(rows[product_id])
+                product["name_highlight"] = mark_terms(product["name"], pattern)
+                product["snippet"] = make_snippet(product["description"], pattern)
+                products.append(product)
+        return products, relaxed
+    return [], False
 
 # Cart operations
+CART_UPSERT = """
+    INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity
+"""
+
 async def add_to_cart(db: aiosqlite.Connection, user_id: int, product_id: int, quantity: int = 1):
-    # Check if product already in cart
-    async with db.execute(
-        "SELECT * FROM cart WHERE user_id = ? AND product_id = ?",
-        (user_id, product_id)
-    ) as cursor:
-        existing = await cursor.fetchone()
-    
-    if existing:
-        # Update quantity
-        new_quantity = existing["quantity"] + quantity
+    # Один запрос вместо SELECT + UPDATE/INSERT: повторный клик не упирается в UNIQUE
+    async with db.execute(CART_UPSERT, (user_id, product_id, quantity)) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def add_many_to_cart(db: aiosqlite.Connection, user_id: int, items: list):
+    """Add (product_id, quantity) pairs to the cart in one statement batch and one commit."""
+    async with db.executemany(CART_UPSERT, [(user_id, product_id, quantity) for product_id, quantity in items]) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def get_products_for_list(db: aiosqlite.Connection, ids: list, names: list):
+    # Поиск товаров из вставленного списка материалов: по артикулу (id) или точному названию
+    products = []
+    if ids:
+        placeholders = ",".join("?" * len(ids))
         async with db.execute(
-            "UPDATE cart SET quantity = ? WHERE user_id = ? AND product_id = ?",
-            (new_quantity, user_id, product_id)
+            f"SELECT id, name FROM products WHERE is_active = TRUE AND id IN ({placeholders})", ids
         ) as cursor:
-            await db.commit()
-            return cursor.rowcount
-    else:
-        # Add new item
+            products.extend(await cursor.fetchall())
+    if names:
+        placeholders = ",".join("?" * len(names))
         async with db.execute(
-            "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
-            (user_id, product_id, quantity)
+            f"SELECT id, name FROM products WHERE is_active = TRUE AND name IN ({placeholders})", names
         ) as cursor:
-            await db.commit()
-            return cursor.lastrowid
+            products.extend(await cursor.fetchall())
+    return products
 
 async def get_cart_items(db: aiosqlite.Connection, user_id: int):
     async with db.execute('''
@@ -106,25 +304,608 @@ async def clear_cart(db: aiosqlite.Connection, user_id: int):
         return cursor.rowcount
 
 async def create_order(db: aiosqlite.Connection, user_id: int, cart_items: list):
-    # Calculate total amount
+    # Коммит выполняет вызывающий код, заказ пишется в его транзакции
     total = sum(item["price"] * item["quantity"] for item in cart_items)
     
-    # Create order
     async with db.execute(
         "INSERT INTO orders (user_id, total_amount) VALUES (?, ?)",
         (user_id, total)
     ) as cursor:
         order_id = cursor.lastrowid
+    
+    await add_order_items(db, order_id, cart_items)
+    return order_id
+
+async def add_order_items(db: aiosqlite.Connection, order_id: int, items: list):
+    # items - строки корзины или словари с product_id, quantity и price
+    await db.executemany(
+        "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+        [(order_id, item["product_id"], item["quantity"], item["price"]) for item in items]
+    )
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_name: str):
+        super().__init__(product_name)
+        self.product_name = product_name
+
+async def checkout_cart(db: aiosqlite.Connection, user_id: int):
+    """Turn the user's cart into an order in one transaction.
+
+    Returns (order_id, cart_items); order_id is None for an empty cart.
+    Raises InsufficientStockError and leaves nothing changed if any item is short.
+    """
+    # Блок write_connection() уже выполняется в транзакции с блокировкой записи:
+    # корзина, цены и остатки читаются и списываются без вмешательства других процессов
+    try:
+        cart_items = await get_cart_items(db, user_id)
+        if not cart_items:
+            await db.rollback()
+            return None, []
         
-        # Add order items
-        for item in cart_items:
-            await db.execute(
-                "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
-                (order_id, item["product_id"], item["quantity"], item["price"])
-            )
+        # Списание только при достаточном остатке; товары в корзине уникальны,
+        # поэтому каждая строка корзины должна изменить ровно одну строку products
+        async with db.executemany(
+            "UPDATE products SET stock_quantity = stock_quantity - ? WHERE id = ? AND stock_quantity >= ?",
+            [(item["quantity"], item["product_id"], item["quantity"]) for item in cart_items]
+        ) as cursor:
+            updated = cursor.rowcount
+        if updated != len(cart_items):
+            await db.rollback()
+            raise InsufficientStockError(await _first_short_item(db, cart_items))
         
+        order_id = await create_order(db, user_id, cart_items)
+        await db.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+        # Письмо и проверка остатков выполняются в фоне, но задачи фиксируются вместе с заказом
+        await enqueue_job(db, "order_confirmation", {"order_id": order_id})
+        await enqueue_job(db, "stock_check", {"product_ids": [item["product_id"] for item in cart_items]})
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+    return order_id, cart_items
+
+async def _first_short_item(db: aiosqlite.Connection, cart_items: list) -> str:
+    for item in cart_items:
+        async with db.execute("SELECT stock_quantity FROM products WHERE id = ?", (item["product_id"],)) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row["stock_quantity"] < item["quantity"]:
+            return item["name"]
+    return cart_items[0]["name"]
+
+# Admin listings and order history: страницы от новых к старым по (created_at, id)
+ADMIN_PAGE_SIZE = 50
+ADMIN_PAGE_MAX = 500
+ADMIN_SEARCH_MIN_TRIGRAM = 3
+
+def encode_recent_cursor(direction: str, row) -> str:
+    raw = json.dumps([direction, row["created_at"], row["id"]], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_recent_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, created_at, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if direction not in ("next", "prev"):
+        raise ValueError("Invalid cursor")
+    _check_cursor_key([created_at, row_id])
+    return direction, [created_at, row_id]
+
+def _search_condition(fts_table: str, alias: str, columns: List[str], text: str):
+    # Для строк от трёх символов - триграммный индекс, короче - LIKE по колонкам
+    if len(text) >= ADMIN_SEARCH_MIN_TRIGRAM:
+        phrase = '"' + text.replace('"', '""') + '"'
+        return f"{alias}.id IN (SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ?)", [phrase]
+    pattern = "%" + re.sub(r"([\\%_])", r"\\\1", text) + "%"
+    condition = " OR ".join(f"{alias}.{column} LIKE ? ESCAPE '\\'" for column in columns)
+    return f"({condition})", [pattern] * len(columns)
+
+def _date_conditions(alias: str, date_from: Optional[str], date_to: Optional[str]):
+    conditions, params = [], []
+    if date_from:
+        conditions.append(f"{alias}.created_at >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append(f"{alias}.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    return conditions, params
+
+async def _recent_page(db: aiosqlite.Connection, select: str, alias: str, conditions: list, params: list,
+                      limit: int, page_cursor: Optional[str]):
+    """Newest-first keyset page over created_at, id: returns (rows, next_cursor, prev_cursor)."""
+    limit = max(1, min(limit, ADMIN_PAGE_MAX))
+    direction, key = decode_recent_cursor(page_cursor) if page_cursor else ("next", None)
+    backwards = direction == "prev"
+    order = "ASC" if backwards else "DESC"
+    
+    conditions = list(conditions)
+    params = list(params)
+    if key is not None:
+        conditions.append(f"({alias}.created_at, {alias}.id) {'>' if backwards else '<'} (?, ?)")
+        params.extend(key)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    async with db.execute(
+        f"{select} {where} ORDER BY {alias}.created_at {order}, {alias}.id {order} LIMIT ?",
+        params + [limit + 1]
+    ) as cursor:
+        rows = await cursor.fetchall()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, key is not None
+    
+    next_cursor = encode_recent_cursor("next", rows[-1]) if rows and has_next else None
+    prev_cursor = encode_recent_cursor("prev", rows[0]) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
+
+async def get_users_page(db: aiosqlite.Connection, limit: int = ADMIN_PAGE_SIZE, page_cursor: Optional[str] = None,
+                         is_active: Optional[bool] = None, is_superuser: Optional[bool] = None,
+                         search: Optional[str] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None):
+    conditions, params = _date_conditions("u", date_from, date_to)
+    if is_active is not None:
+        conditions.append("u.is_active = ?")
+        params.append(is_active)
+    if is_superuser is not None:
+        conditions.append("u.is_superuser = ?")
+        params.append(is_superuser)
+    if search:
+        condition, search_params = _search_condition("users_fts", "u", ["username", "email"], search)
+        conditions.append(condition)
+        params.extend(search_params)
+    return await _recent_page(db, "SELECT u.* FROM users u", "u", conditions, params, limit, page_cursor)
+
+async def get_feedback_page(db: aiosqlite.Connection, limit: int = ADMIN_PAGE_SIZE, page_cursor: Optional[str] = None,
+                            is_read: Optional[bool] = None, search: Optional[str] = None,
+                            date_from: Optional[str] = None, date_to: Optional[str] = None):
+    conditions, params = _date_conditions("f", date_from, date_to)
+    if is_read is not None:
+        conditions.append("f.is_read = ?")
+        params.append(is_read)
+    if search:
+        condition, search_params = _search_condition("feedback_fts", "f", ["subject", "email"], search)
+        conditions.append(condition)
+        params.extend(search_params)
+    return await _recent_page(
+        db, "SELECT f.*, u.username FROM feedback f LEFT JOIN users u ON f.user_id = u.id", "f",
+        conditions, params, limit, page_cursor
+    )
+
+async def get_feedback(db: aiosqlite.Connection, feedback_id: int):
+    async with db.execute("SELECT * FROM feedback WHERE id = ?", (feedback_id,)) as cursor:
+        return await cursor.fetchone()
+
+async def get_summary_counts(db: aiosqlite.Connection) -> dict:
+    # Поддерживаются триггерами (миграция 7)
+    async with db.execute("SELECT name, value FROM summary_counts") as cursor:
+        return {row["name"]: row["value"] for row in await cursor.fetchall()}
+
+# Admin product management and bulk import (product_io.py)
+PRODUCT_COLUMNS = ["sku", "name", "description", "price", "category", "image_url", "stock_quantity", "is_active"]
+_PRODUCT_UPDATED = [column for column in PRODUCT_COLUMNS if column != "sku"]
+PRODUCT_INSERT = (
+    f"INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})"
+)
+# Добавление без обновления: товар с уже известным артикулом пропускается, пачка не обрывается
+PRODUCT_INSERT_NEW = PRODUCT_INSERT + " ON CONFLICT (sku) DO NOTHING"
+# Обновление по артикулу; неизменённые строки не трогаются, их версия и кеш карточки сохраняются.
+# Версия увеличивается здесь же, без второго UPDATE из триггера products_row_version
+PRODUCT_UPSERT = (
+    PRODUCT_INSERT
+    + " ON CONFLICT (sku) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in _PRODUCT_UPDATED)
+    + ", version = version + 1"
+    + f" WHERE ({', '.join(_PRODUCT_UPDATED)}) IS NOT ({', '.join('excluded.' + c for c in _PRODUCT_UPDATED)})"
+)
+
+def product_row(product: ProductCreate) -> tuple:
+    return tuple(getattr(product, column) for column in PRODUCT_COLUMNS)
+
+async def create_product(db: aiosqlite.Connection, product: ProductCreate) -> int:
+    async with db.execute(PRODUCT_INSERT, product_row(product)) as cursor:
+        await db.commit()
+        return cursor.lastrowid
+
+async def update_product(db: aiosqlite.Connection, product_id: int, product: ProductCreate) -> int:
+    async with db.execute(
+        f"UPDATE products SET {', '.join(f'{column} = ?' for column in PRODUCT_COLUMNS)} WHERE id = ?",
+        product_row(product) + (product_id,)
+    ) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def toggle_product_active(db: aiosqlite.Connection, product_id: int) -> int:
+    # Товары не удаляются: на них ссылаются заказы и сводки продаж
+    async with db.execute("UPDATE products SET is_active = NOT is_active WHERE id = ?", (product_id,)) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def get_admin_products_page(db: aiosqlite.Connection, limit: int = ADMIN_PAGE_SIZE,
+                                  page_cursor: Optional[str] = None, is_active: Optional[bool] = None,
+                                  category: Optional[str] = None, search: Optional[str] = None):
+    conditions, params = [], []
+    if is_active is not None:
+        conditions.append("p.is_active = ?")
+        params.append(is_active)
+    if category:
+        conditions.append("p.category = ?")
+        params.append(category)
+    if search:
+        # Точный артикул или полнотекстовый поиск по названию и описанию
+        terms = search_terms(search)
+        if terms:
+            conditions.append("(p.sku = ? OR p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?))")
+            params.extend([search, build_search_query(terms)])
+        else:
+            conditions.append("p.sku = ?")
+            params.append(search)
+    return await _recent_page(
+        db, "SELECT p.id, p.sku, p.name, p.price, p.category, p.stock_quantity, p.is_active, p.created_at "
+            "FROM products p",
+        "p", conditions, params, limit, page_cursor
+    )
+
+# Product imports (product_io.py): ход импорта виден всем процессам, время в unix-секундах
+async def create_import(db: aiosqlite.Connection, import_id: str, filename: str, fmt: str, mode: str,
+                        started_at: float, lease_until: float, kept: int):
+    await db.execute(
+        "INSERT INTO imports (id, filename, format, mode, started_at, lease_until) VALUES (?, ?, ?, ?, ?, ?)",
+        (import_id, filename, fmt, mode, started_at, lease_until)
+    )
+    # Хранятся последние kept импортов
+    await db.execute(
+        "DELETE FROM imports WHERE started_at < "
+        "(SELECT started_at FROM imports ORDER BY started_at DESC LIMIT 1 OFFSET ?)",
+        (kept - 1,)
+    )
+    await db.commit()
+
+async def save_import(db: aiosqlite.Connection, import_id: str, progress: dict):
+    await db.execute(
+        """UPDATE imports SET status = ?, message = ?, processed = ?, inserted = ?, updated = ?, skipped = ?,
+                  rejected = ?, errors = ?, finished_at = ?, lease_until = ?
+           WHERE id = ?""",
+        (progress["status"], progress["message"], progress["processed"], progress["inserted"],
+         progress["updated"], progress["skipped"], progress["rejected"],
+         json.dumps(progress["errors"], ensure_ascii=False), progress["finished_at"], progress["lease_until"],
+         import_id)
+    )
+    await db.commit()
+
+async def get_import(db: aiosqlite.Connection, import_id: str):
+    async with db.execute("SELECT * FROM imports WHERE id = ?", (import_id,)) as cursor:
+        return await cursor.fetchone()
+
+async def get_recent_imports(db: aiosqlite.Connection, limit: int):
+    async with db.execute("SELECT * FROM imports ORDER BY started_at DESC LIMIT ?", (limit,)) as cursor:
+        return await cursor.fetchall()
+
+# Order history
+ORDERS_PAGE_SIZE = 10
+ORDERS_PAGE_MAX = 100
+
+async def get_orders_page(db: aiosqlite.Connection, user_id: int, limit: int = ORDERS_PAGE_SIZE,
+                          page_cursor: Optional[str] = None):
+    """A page of the user's orders with their items: two queries per page whatever the page size."""
+    orders, next_cursor, prev_cursor = await _recent_page(
+        db, "SELECT o.id, o.total_amount, o.status, o.created_at FROM orders o", "o",
+        ["o.user_id = ?"], [user_id], limit, page_cursor
+    )
+    orders = [dict(order, items=[]) for order in orders]
+    if orders:
+        by_id = {order["id"]: order for order in orders}
+        placeholders = ",".join("?" * len(by_id))
+        # Позиции всех заказов страницы одним запросом по idx_order_items_order_id
+        async with db.execute(
+            f"""SELECT oi.order_id, oi.product_id, oi.quantity, oi.price,
+                       p.name, p.image_url, COALESCE(p.is_active, FALSE) AS is_active
+                FROM order_items oi
+                LEFT JOIN products p ON p.id = oi.product_id
+                WHERE oi.order_id IN ({placeholders})
+                ORDER BY oi.order_id, oi.id""",
+            list(by_id)
+        ) as cursor:
+            async for item in cursor:
+                by_id[item["order_id"]]["items"].append(dict(item))
+    return orders, next_cursor, prev_cursor
+
+async def order_exists(db: aiosqlite.Connection, user_id: int, order_id: int) -> bool:
+    async with db.execute("SELECT 1 FROM orders WHERE id = ? AND user_id = ?", (order_id, user_id)) as cursor:
+        return await cursor.fetchone() is not None
+
+async def reorder(db: aiosqlite.Connection, user_id: int, order_id: int) -> int:
+    """Put every still-active product of a past order back into the cart in one upsert."""
+    async with db.execute(
+        """INSERT INTO cart (user_id, product_id, quantity)
+           SELECT o.user_id, oi.product_id, oi.quantity
+           FROM orders o
+           JOIN order_items oi ON oi.order_id = o.id
+           JOIN products p ON p.id = oi.product_id
+           WHERE o.id = ? AND o.user_id = ? AND p.is_active = TRUE
+           ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = quantity + excluded.quantity""",
+        (order_id, user_id)
+    ) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def get_order_details(db: aiosqlite.Connection, order_id: int):
+    """Order with its buyer's contacts and items, or None."""
+    async with db.execute(
+        """SELECT o.id, o.user_id, o.total_amount, o.created_at, u.email, u.username, u.full_name
+           FROM orders o JOIN users u ON u.id = o.user_id WHERE o.id = ?""",
+        (order_id,)
+    ) as cursor:
+        order = await cursor.fetchone()
+    if order is None:
+        return None
+    async with db.execute(
+        """SELECT oi.product_id, oi.quantity, oi.price, p.name, p.stock_quantity
+           FROM order_items oi LEFT JOIN products p ON p.id = oi.product_id
+           WHERE oi.order_id = ? ORDER BY oi.id""",
+        (order_id,)
+    ) as cursor:
+        items = [dict(row) for row in await cursor.fetchall()]
+    return dict(order, items=items)
+
+# Sales analytics: чтения только из таблиц-сводок (миграция 8), размер
+# которых зависит от числа дней, товаров и категорий, а не заказов
+ANALYTICS_DAYS = 30
+ANALYTICS_WEEKS = 12
+ANALYTICS_TOP_PRODUCTS = 10
+LOW_STOCK_THRESHOLD = 10
+LOW_STOCK_LIMIT = 50
+
+async def get_sales_by_day(db: aiosqlite.Connection, days: int = ANALYTICS_DAYS):
+    async with db.execute(
+        "SELECT day, orders, items, revenue FROM sales_daily "
+        "WHERE day > date('now', ?) ORDER BY day DESC",
+        (f"-{days} days",)
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def get_sales_by_week(db: aiosqlite.Connection, weeks: int = ANALYTICS_WEEKS):
+    async with db.execute(
+        "SELECT week, orders, items, revenue FROM sales_weekly ORDER BY week DESC LIMIT ?",
+        (weeks,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def get_top_products(db: aiosqlite.Connection, limit: int = ANALYTICS_TOP_PRODUCTS):
+    async with db.execute(
+        """SELECT s.product_id, p.name, p.category, s.orders, s.quantity, s.revenue
+           FROM sales_products s
+           LEFT JOIN products p ON p.id = s.product_id
+           ORDER BY s.revenue DESC LIMIT ?""",
+        (limit,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def get_sales_by_category(db: aiosqlite.Connection):
+    async with db.execute(
+        "SELECT category, quantity, revenue FROM sales_categories ORDER BY revenue DESC"
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def get_low_stock_products(db: aiosqlite.Connection, threshold: int = LOW_STOCK_THRESHOLD,
+                                 limit: int = LOW_STOCK_LIMIT):
+    async with db.execute(
+        """SELECT id, name, category, stock_quantity FROM products
+           WHERE is_active = TRUE AND stock_quantity <= ?
+           ORDER BY stock_quantity, id LIMIT ?""",
+        (threshold, limit)
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def count_low_stock_products(db: aiosqlite.Connection, threshold: int = LOW_STOCK_THRESHOLD) -> int:
+    async with db.execute(
+        "SELECT COUNT(*) FROM products WHERE is_active = TRUE AND stock_quantity <= ?",
+        (threshold,)
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+async def get_low_stock_among(db: aiosqlite.Connection, product_ids: list, threshold: int = LOW_STOCK_THRESHOLD):
+    placeholders = ",".join("?" * len(product_ids))
+    async with db.execute(
+        f"""SELECT id, name, stock_quantity FROM products
+            WHERE id IN ({placeholders}) AND is_active = TRUE AND stock_quantity <= ?
+            ORDER BY stock_quantity""",
+        list(product_ids) + [threshold]
+    ) as cursor:
+        return await cursor.fetchall()
+
+def basket_summary(orders: int, items: int, revenue: float) -> dict:
+    return {
+        "orders": orders,
+        "items": items,
+        "revenue": revenue,
+        "avg_order_value": revenue / orders if orders else 0.0,
+        "avg_items": items / orders if orders else 0.0,
+    }
+
+# Background jobs (jobs.py): время в unix-секундах
+JOB_MAX_ATTEMPTS = 5
+JOB_FAILURES_LIMIT = 20
+
+async def enqueue_job(db: aiosqlite.Connection, kind: str, payload: dict, delay: float = 0,
+                      max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+    # Коммит выполняет вызывающий код: задача фиксируется вместе с изменениями, которые её породили
+    now = time.time()
+    async with db.execute(
+        "INSERT INTO jobs (kind, payload, max_attempts, run_at, created_at) VALUES (?, ?, ?, ?, ?)",
+        (kind, json.dumps(payload, ensure_ascii=False), max_attempts, now + delay, now)
+    ) as cursor:
+        return cursor.lastrowid
+
+async def claim_job(db: aiosqlite.Connection, lease: float):
+    """Atomically take the next due job (or one whose lease expired) and mark it running."""
+    now = time.time()
+    async with db.execute(
+        """UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, locked_until = ?
+           WHERE id = COALESCE(
+               (SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ? ORDER BY run_at LIMIT 1),
+               (SELECT id FROM jobs WHERE status = 'running' AND locked_until <= ? LIMIT 1))
+           RETURNING id, kind, payload, attempts, max_attempts, run_at, started_at""",
+        (now, now + lease, now, now)
+    ) as cursor:
+        job = await cursor.fetchone()
+    await db.commit()
+    return job
+
+async def complete_job(db: aiosqlite.Connection, job_id: int):
+    await db.execute(
+        "UPDATE jobs SET status = 'done', finished_at = ?, locked_until = NULL WHERE id = ?",
+        (time.time(), job_id)
+    )
+    await db.commit()
+
+async def fail_job(db: aiosqlite.Connection, job_id: int, error: str, retry_at: Optional[float] = None):
+    # С retry_at задача возвращается в очередь, без него - остаётся в failed до ручного повтора
+    if retry_at is not None:
+        await db.execute(
+            "UPDATE jobs SET status = 'queued', run_at = ?, locked_until = NULL, last_error = ? WHERE id = ?",
+            (retry_at, error, job_id)
+        )
+    else:
+        await db.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, locked_until = NULL, last_error = ? WHERE id = ?",
+            (time.time(), error, job_id)
+        )
+    await db.commit()
+
+async def release_job(db: aiosqlite.Connection, job_id: int):
+    # Прерванная остановкой приложения попытка не считается
+    await db.execute(
+        "UPDATE jobs SET status = 'queued', attempts = attempts - 1, locked_until = NULL "
+        "WHERE id = ? AND status = 'running'",
+        (job_id,)
+    )
+    await db.commit()
+
+async def retry_job(db: aiosqlite.Connection, job_id: int) -> int:
+    async with db.execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, finished_at = NULL "
+        "WHERE id = ? AND status = 'failed'",
+        (time.time(), job_id)
+    ) as cursor:
+        await db.commit()
+        return cursor.rowcount
+
+async def next_job_due(db: aiosqlite.Connection) -> Optional[float]:
+    """When the next queued job becomes due or a running job's lease expires."""
+    async with db.execute(
+        """SELECT MIN(due) FROM (
+               SELECT MIN(run_at) AS due FROM jobs WHERE status = 'queued'
+               UNION ALL
+               SELECT MIN(locked_until) FROM jobs WHERE status = 'running')"""
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+async def delete_finished_jobs(db: aiosqlite.Connection, before: float) -> int:
+    async with db.execute(
+        "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?", (before,)
+    ) as cursor:
         await db.commit()
-        return order_id
+        return cursor.rowcount
+
+async def get_job_stats(db: aiosqlite.Connection, since: float) -> dict:
+    """Queue depth now plus throughput, latency and failures of jobs finished after `since`."""
+    now = time.time()
+    async with db.execute(
+        """SELECT COUNT(*) FILTER (WHERE run_at <= ?) AS due,
+                  COUNT(*) FILTER (WHERE run_at > ?) AS delayed,
+                  COUNT(*) FILTER (WHERE last_error IS NOT NULL) AS retrying,
+                  ? - MIN(run_at) FILTER (WHERE run_at <= ?) AS oldest_due_age
+           FROM jobs WHERE status = 'queued'""",
+        (now, now, now, now)
+    ) as cursor:
+        stats = dict(await cursor.fetchone())
+    async with db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'") as cursor:
+        stats["running"] = (await cursor.fetchone())[0]
+    async with db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'failed'") as cursor:
+        stats["failed"] = (await cursor.fetchone())[0]
+    # Задержка - от момента, когда задачу можно было брать, до начала последней попытки
+    async with db.execute(
+        """SELECT COUNT(*) AS done, AVG(started_at - run_at) AS latency_avg, MAX(started_at - run_at) AS latency_max,
+                  AVG(finished_at - started_at) AS duration_avg
+           FROM jobs WHERE status = 'done' AND finished_at > ?""",
+        (since,)
+    ) as cursor:
+        stats.update(await cursor.fetchone())
+    async with db.execute(
+        "SELECT COUNT(*) FROM jobs WHERE status = 'failed' AND finished_at > ?", (since,)
+    ) as cursor:
+        stats["failed_recent"] = (await cursor.fetchone())[0]
+    for key in ("oldest_due_age", "latency_avg", "latency_max", "duration_avg"):
+        stats[key] = stats[key] or 0.0
+    return stats
+
+async def get_job_kinds(db: aiosqlite.Connection, since: float):
+    async with db.execute(
+        """SELECT kind,
+                  COUNT(*) FILTER (WHERE status = 'queued') AS queued,
+                  COUNT(*) FILTER (WHERE status = 'running') AS running,
+                  COUNT(*) FILTER (WHERE status = 'done') AS done,
+                  COUNT(*) FILTER (WHERE status = 'failed') AS failed
+           FROM jobs WHERE status IN ('queued', 'running') OR (status IN ('done', 'failed') AND finished_at > ?)
+           GROUP BY kind ORDER BY kind""",
+        (since,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+async def get_failed_jobs(db: aiosqlite.Connection, limit: int = JOB_FAILURES_LIMIT):
+    # Окончательно упавшие и ожидающие повтора после ошибки
+    async with db.execute(
+        """SELECT * FROM (
+               SELECT id, kind, payload, status, attempts, max_attempts, run_at, finished_at, last_error
+               FROM jobs WHERE status = 'failed' ORDER BY finished_at DESC LIMIT ?)
+           UNION ALL
+           SELECT * FROM (
+               SELECT id, kind, payload, status, attempts, max_attempts, run_at, finished_at, last_error
+               FROM jobs WHERE status = 'queued' AND last_error IS NOT NULL ORDER BY run_at LIMIT ?)""",
+        (limit, limit)
+    ) as cursor:
+        return await cursor.fetchall()
+
+# Database maintenance (maintenance.py)
+async def claim_maintenance(db: aiosqlite.Connection, name: str, lease: float, force: bool = False) -> bool:
+    """Take a due maintenance task (or any not leased by another process when forced)."""
+    now = time.time()
+    async with db.execute(
+        """UPDATE maintenance_tasks SET locked_until = ?, started_at = ?
+           WHERE name = ? AND (next_run <= ? OR ?) AND (locked_until IS NULL OR locked_until <= ?)""",
+        (now + lease, now, name, now, force, now)
+    ) as cursor:
+        claimed = cursor.rowcount == 1
+    await db.commit()
+    return claimed
+
+async def finish_maintenance(db: aiosqlite.Connection, name: str, next_run: float, seconds: float,
+                             result: Optional[dict] = None, error: Optional[str] = None):
+    # При ошибке остаётся результат последнего успешного запуска
+    await db.execute(
+        """UPDATE maintenance_tasks SET locked_until = NULL, finished_at = ?, next_run = ?, seconds = ?,
+                  result = COALESCE(?, result), last_error = ?
+           WHERE name = ?""",
+        (time.time(), next_run, seconds,
+         json.dumps(result, ensure_ascii=False) if result is not None else None, error, name)
+    )
+    await db.commit()
+
+async def get_database_info(db: aiosqlite.Connection) -> dict:
+    info = {}
+    for pragma in ("page_size", "page_count", "freelist_count"):
+        async with db.execute(f"PRAGMA {pragma}") as cursor:
+            info[pragma] = (await cursor.fetchone())[0]
+    info["size"] = info["page_size"] * info["page_count"]
+    return info
 
-# Import get_password_hash from auth
-from auth import get_password_hash
\ No newline at end of file
+async def get_maintenance_tasks(db: aiosqlite.Connection) -> dict:
+    async with db.execute("SELECT * FROM maintenance_tasks") as cursor:
+        rows = await cursor.fetchall()
+    return {row["name"]: dict(row, result=json.loads(row["result"]) if row["result"] else None) for row in rows}
@@ -1,7 +1,392 @@
 import aiosqlite
-import os
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from typing import Optional
 
-DATABASE_URL = "construction_store.db"
+import cache
+import metrics
+import profiler
+from migrations import migrate
+from settings import DATABASE_URL, DB_POOL_SIZE, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY_MS, WAL_TRUNCATE_SIZE_MB
+
+# Применяются один раз при открытии каждого соединения пула
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA foreign_keys=ON;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-16000;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA busy_timeout=5000;",
+    # После обнуления WAL файл урезается до этого размера, а не остаётся самым большим из бывших
+    f"PRAGMA journal_size_limit={int(WAL_TRUNCATE_SIZE_MB * 1024 * 1024)};",
+)
+
+class InstrumentedConnection(aiosqlite.Connection):
+    """aiosqlite connection that reports every call (query, fetch, commit) to metrics and the SQL profiler."""
+
+    # Все операции aiosqlite, включая курсоры, проходят через _execute
+    async def _execute(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = await super()._execute(fn, *args, **kwargs)
+        except BaseException as e:
+            elapsed = time.perf_counter() - started
+            metrics.observe_db(fn, elapsed)
+            if profiler.SQL_PROFILE:
+                profiler.record(fn, args, None, elapsed, e)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe_db(fn, elapsed)
+        if profiler.SQL_PROFILE:
+            profiler.record(fn, args, result, elapsed)
+        return result
+
+async def connect(path: Optional[str] = None, readonly: bool = False):
+    path = path or DATABASE_URL
+    if metrics.METRICS_ENABLED or profiler.SQL_PROFILE:
+        db = await InstrumentedConnection(lambda: sqlite3.connect(path), iter_chunk_size=64)
+    else:
+        db = await aiosqlite.connect(path)
+    db.row_factory = aiosqlite.Row
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+    if readonly:
+        await db.execute("PRAGMA query_only=ON;")
+    return db
+
+WRITE_BATCH_DELAY = WRITE_BATCH_DELAY_MS / 1000
+
+# Управление транзакцией группы; каждая функция выполняется в потоке соединения
+# за один переход, а не отдельными командами через очередь aiosqlite
+def _group_begin(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("SAVEPOINT write_unit")
+
+def _unit_commit(conn: sqlite3.Connection):
+    conn.execute("RELEASE write_unit")
+    conn.execute("SAVEPOINT write_unit")
+
+def _unit_rollback(conn: sqlite3.Connection):
+    conn.execute("ROLLBACK TO write_unit")
+
+def _unit_end(conn: sqlite3.Connection, rollback: bool, commit_group: bool):
+    if rollback:
+        conn.execute("ROLLBACK TO write_unit")
+    if commit_group:
+        conn.commit()
+
+class WriteUnit:
+    """The writer connection as one write_connection() block sees it: a savepoint in the group transaction.
+
+    commit() and rollback() apply to this block only; the pool commits the whole group.
+    """
+
+    def __init__(self, db: aiosqlite.Connection):
+        self._db = db
+        self.committed = False
+        # Изменений после этой отметки ещё нет ни в одной точке сохранения
+        self.mark = db.total_changes
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    @property
+    def dirty(self) -> bool:
+        return self._db.total_changes != self.mark
+
+    async def commit(self):
+        await self._db._execute(_unit_commit, self._db._conn)
+        self.committed = True
+        self.mark = self._db.total_changes
+
+    async def rollback(self):
+        await self._db._execute(_unit_rollback, self._db._conn)
+        self.mark = self._db.total_changes
+
+class WriteGroup:
+    __slots__ = ("future", "units", "started", "timer")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.units = 0
+        self.started = time.monotonic()
+        self.timer = None
+
+# Счётчики, которые триггеры увеличивают при изменениях каталога и пользователей из любого процесса
+SHARED_STATE_SQL = (
+    "SELECT c.version, c.updated_at, c.listing_version, u.version "
+    "FROM catalog_state c, users_state u WHERE c.id = 1 AND u.id = 1"
+)
+
+class ChangeWatcher:
+    """Notices commits of other connections, other worker processes included, through PRAGMA data_version."""
+
+    def __init__(self, path: str):
+        # Синхронное соединение: в режиме WAL проверка читает только заголовок журнала
+        # и не ждёт блокировок, поэтому выполняется прямо в цикле событий за микросекунды
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA query_only=ON;")
+        self._data_version = None
+
+    def poll(self) -> Optional[tuple]:
+        """Shared version counters if anything was committed since the previous poll, otherwise None."""
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return None
+        self._data_version = data_version
+        return self._db.execute(SHARED_STATE_SQL).fetchone()
+
+    def close(self):
+        self._db.close()
+
+class ConnectionPool:
+    """One writer connection guarded by a lock plus a fixed set of readers.
+
+    Write blocks queue on the lock and run one after another in a shared transaction,
+    each in its own savepoint. The transaction is committed once WRITE_BATCH_SIZE
+    blocks have committed, after WRITE_BATCH_DELAY_MS, or as soon as no other block
+    is waiting; a block returns only after that COMMIT.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        # Семафор отдаёт свободное соединение ожидающим по очереди; у asyncio.Queue
+        # вернувший соединение тут же забирал его снова, и ожидающий мог простоять секунды
+        self._readers = deque()
+        self._readers_free = asyncio.Semaphore(0)
+        self._all_readers = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self.watcher: Optional[ChangeWatcher] = None
+        self._write_lock = asyncio.Lock()
+        self._writers_waiting = 0
+        self._group: Optional[WriteGroup] = None
+        self._flushes = set()
+
+        self.readers_in_use = 0
+        self.reader_acquisitions = 0
+        self.reader_wait_total = 0.0
+        self.reader_wait_max = 0.0
+        self.writer_in_use = False
+        self.writer_acquisitions = 0
+        self.writer_wait_total = 0.0
+        self.writer_wait_max = 0.0
+        self.group_commits = 0
+        self.grouped_units = 0
+
+    async def open(self):
+        self._writer = await connect(self.path)
+        for _ in range(self.size):
+            db = await connect(self.path, readonly=True)
+            self._all_readers.append(db)
+            self._readers.append(db)
+            self._readers_free.release()
+        self.watcher = ChangeWatcher(self.path)
+
+    async def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        for db in self._all_readers:
+            await db.close()
+        self._all_readers.clear()
+        self._readers.clear()
+        self._readers_free = asyncio.Semaphore(0)
+        if self._writer is not None:
+            async with self._write_lock:
+                await self._commit_group()
+            await self._writer.close()
+            self._writer = None
+
+    @asynccontextmanager
+    async def reader(self):
+        started = time.perf_counter()
+        await self._readers_free.acquire()
+        db = self._readers.popleft()
+        waited = time.perf_counter() - started
+        self.reader_acquisitions += 1
+        self.reader_wait_total += waited
+        self.reader_wait_max = max(self.reader_wait_max, waited)
+        self.readers_in_use += 1
+        try:
+            yield db
+        finally:
+            self.readers_in_use -= 1
+            self._readers.append(db)
+            self._readers_free.release()
+
+    @asynccontextmanager
+    async def writer(self, grouped: bool = True):
+        started = time.perf_counter()
+        self._writers_waiting += 1
+        try:
+            await self._write_lock.acquire()
+        finally:
+            self._writers_waiting -= 1
+        waited = time.perf_counter() - started
+        self.writer_acquisitions += 1
+        self.writer_wait_total += waited
+        self.writer_wait_max = max(self.writer_wait_max, waited)
+        self.writer_in_use = True
+        done = None
+        try:
+            if grouped:
+                unit = await self._begin_unit()
+                try:
+                    yield unit
+                finally:
+                    done = await self._end_unit(unit)
+            else:
+                # Своя транзакция с BEGIN IMMEDIATE (импорт прайс-листа): открытая группа фиксируется до неё
+                await self._commit_group()
+                try:
+                    yield self._writer
+                finally:
+                    # Незакоммиченная транзакция не должна достаться следующему запросу
+                    if self._writer.in_transaction:
+                        await self._writer.rollback()
+        finally:
+            self.writer_in_use = False
+            self._write_lock.release()
+        if done is not None:
+            # Изменения блока видны другим соединениям только после COMMIT его группы
+            await done
+
+    async def _begin_unit(self) -> WriteUnit:
+        # Точка сохранения write_unit открыта всё время жизни группы: блок без
+        # незафиксированных изменений оставляет её следующему, и тот начинает без обращения к БД
+        if self._group is None:
+            try:
+                await self._writer._execute(_group_begin, self._writer._conn)
+            except BaseException:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+            self._group = WriteGroup()
+        return WriteUnit(self._writer)
+
+    async def _end_unit(self, unit: WriteUnit) -> Optional[asyncio.Future]:
+        group = self._group
+        if unit.committed:
+            group.units += 1
+        flush = (group.units >= WRITE_BATCH_SIZE or not self._writers_waiting
+                 or time.monotonic() - group.started >= WRITE_BATCH_DELAY)
+        # Изменения после последнего commit() блока отменяются
+        rollback = unit.dirty
+        if rollback or flush:
+            try:
+                await self._writer._execute(_unit_end, self._writer._conn, rollback, flush)
+            except BaseException as e:
+                await self._fail_group(group, e)
+                if unit.committed:
+                    return group.future
+                raise
+        if flush:
+            self._finish_group(group)
+        elif group.timer is None:
+            # Страховка на случай, если ожидавший блок отменён и фиксировать группу больше некому
+            group.timer = asyncio.get_running_loop().call_later(WRITE_BATCH_DELAY, self._flush_later, group)
+        return group.future if unit.committed else None
+
+    async def _commit_group(self):
+        group = self._group
+        if group is None:
+            return
+        try:
+            await self._writer.commit()
+        except BaseException as e:
+            await self._fail_group(group, e)
+            return
+        self._finish_group(group)
+
+    def _finish_group(self, group: WriteGroup):
+        self._group = None
+        if group.timer is not None:
+            group.timer.cancel()
+        if group.units:
+            self.group_commits += 1
+            self.grouped_units += group.units
+            metrics.write_group_units.observe((), group.units)
+        group.future.set_result(None)
+
+    async def _fail_group(self, group: WriteGroup, error: BaseException):
+        # Ошибка COMMIT относится ко всем блокам группы: ни один из них не записан
+        self._group = None
+        if group.timer is not None:
+            group.timer.cancel()
+        if group.units:
+            group.future.set_exception(error)
+        if self._writer.in_transaction:
+            with suppress(Exception):
+                await self._writer.rollback()
+
+    def _flush_later(self, group: WriteGroup):
+        group.timer = None
+        task = asyncio.ensure_future(self._flush_stale(group))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush_stale(self, group: WriteGroup):
+        async with self._write_lock:
+            if self._group is group:
+                await self._commit_group()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "readers_in_use": self.readers_in_use,
+            "reader_utilization": self.readers_in_use / self.size,
+            "reader_acquisitions": self.reader_acquisitions,
+            "reader_wait_avg_ms": self.reader_wait_total / self.reader_acquisitions * 1000
+            if self.reader_acquisitions else 0.0,
+            "reader_wait_max_ms": self.reader_wait_max * 1000,
+            "writer_in_use": self.writer_in_use,
+            "writer_acquisitions": self.writer_acquisitions,
+            "writer_wait_avg_ms": self.writer_wait_total / self.writer_acquisitions * 1000
+            if self.writer_acquisitions else 0.0,
+            "writer_wait_max_ms": self.writer_wait_max * 1000,
+            "group_commits": self.group_commits,
+            "units_per_commit": self.grouped_units / self.group_commits if self.group_commits else 0.0,
+        }
+
+pool: Optional[ConnectionPool] = None
+
+async def open_pool(size: int = DB_POOL_SIZE):
+    global pool
+    pool = ConnectionPool(DATABASE_URL, size)
+    await pool.open()
+    return pool
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+def sync_caches():
+    """Drop in-process cache entries made stale by writes of any process; called once per request."""
+    state = pool.watcher.poll()
+    if state is not None:
+        cache.apply_shared_state(*state)
+
+def read_connection():
+    return pool.reader()
+
+def write_connection(grouped: bool = True):
+    return pool.writer(grouped)
+
+STREAM_CHUNK_SIZE = 500
+
+async def stream_rows(sql: str, params=(), chunk_size: int = STREAM_CHUNK_SIZE):
+    """Yield rows of a read query in chunks; the reader stays borrowed until the iteration ends."""
+    async with read_connection() as db:
+        async with db.execute(sql, params) as cursor:
+            cursor.iter_chunk_size = chunk_size
+            async for row in cursor:
+                yield row
 
 async def init_db():
     async with aiosqlite.connect(DATABASE_URL) as db:
@@ -90,9 +475,11 @@ async def init_db():
             )
         ''')
         
+        await migrate(db)
+        
         # Create default admin user
         from auth import get_password_hash
-        admin_password = get_password_hash("admin123")
+        admin_password = await get_password_hash("admin123")
         
         await db.execute('''
             INSERT OR IGNORE INTO users 
@@ -112,20 +499,16 @@ async def init_db():
             ("Перфоратор", "Мощный перфоратор 800Вт", 120.99, "Электроинструменты", "/static/images/perforator.jpg", 20),
         ]
         
-        await db.executemany('''
-            INSERT OR IGNORE INTO products 
-            (name, description, price, category, image_url, stock_quantity)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', sample_products)
+        # Примеры добавляются только в пустую таблицу; OR IGNORE по артикулу - на случай,
+        # если одновременно стартовавший процесс успел добавить их первым
+        async with db.execute("SELECT EXISTS (SELECT 1 FROM products)") as cursor:
+            has_products = (await cursor.fetchone())[0]
         
-        await db.commit()
-
-async def get_db():
-    db = await aiosqlite.connect(DATABASE_URL)
-    db.row_factory = aiosqlite.Row
-    try:
-        await db.execute("PRAGMA journal_mode=WAL;")
-        await db.execute("PRAGMA foreign_keys=ON;")
-        yield db
-    finally:
-        await db.close()
\ No newline at end of file
+        if not has_products:
+            await db.executemany('''
+                INSERT OR IGNORE INTO products 
+                (sku, name, description, price, category, image_url, stock_quantity)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(f"SKU-{i:06d}",) + product for i, product in enumerate(sample_products, 1)])
+        
+        await db.commit()
\ No newline at end of file
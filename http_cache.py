@@ -0,0 +1,129 @@
+import hashlib
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+
+from cache import catalog_version
+from settings import STATIC_MAX_AGE
+
+STATIC_DIR = "static"
+IMMUTABLE_MAX_AGE = 31536000
+
+# Страницы, содержимое которых зависит только от каталога (и, для вошедших, от корзины)
+CATALOG_PATH_RE = re.compile(r"^/(?:products/(?:\d+|search)?|api/v1/products(?:/\d+|/search)?)?$")
+# Из них только для вошедших пользователей (get_current_active_user)
+LOGIN_CATALOG_PATH_RE = re.compile(r"^/products/")
+
+_fingerprints = {}
+
+def static_fingerprint(relative: str) -> Optional[str]:
+    """Content hash of a file under static/, recomputed only when its mtime changes; None if missing."""
+    full_path = os.path.join(STATIC_DIR, relative)
+    try:
+        mtime = os.stat(full_path).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _fingerprints.get(relative)
+    if cached is None or cached[0] != mtime:
+        with open(full_path, "rb") as f:
+            cached = (mtime, hashlib.blake2b(f.read(), digest_size=6).hexdigest())
+        _fingerprints[relative] = cached
+    return cached[1]
+
+def static_url(path: str) -> str:
+    """Return a /static URL with a content hash, e.g. /static/css/style.css?v=3f2a9c01d4e7."""
+    if not path:
+        return path
+    if path.startswith("/static/"):
+        relative = path[len("/static/"):]
+    elif path.startswith("/") or "://" in path:
+        return path
+    else:
+        relative = path
+
+    fingerprint = static_fingerprint(relative)
+    return f"/static/{relative}?v={fingerprint}" if fingerprint else f"/static/{relative}"
+
+class CachedStaticFiles(StaticFiles):
+    # URL с отпечатком содержимого никогда не меняется, остальные кешируются ненадолго
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if b"v=" in scope.get("query_string", b""):
+                response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            else:
+                response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        return response
+
+def is_catalog_request(request: Request) -> bool:
+    return request.method in ("GET", "HEAD") and CATALOG_PATH_RE.match(request.url.path) is not None
+
+def catalog_validators(request: Request) -> dict:
+    # Без cookie страница одинакова для всех и может храниться в общем кеше прокси.
+    # С cookie в ней навигация пользователя и счётчик корзины - только private.
+    if "access_token" not in request.cookies:
+        return {
+            "ETag": f'W/"c{catalog_version.version}"',
+            "Last-Modified": formatdate(catalog_version.last_modified, usegmt=True),
+            "Cache-Control": "public, no-cache",
+            "Vary": "Cookie",
+        }
+
+    user = getattr(request.state, "current_user", None)
+    personal = f"{user['id']}:{user['is_superuser']}" if user else "-"
+    personal = f"{personal}:{getattr(request.state, 'cart_count', 0)}"
+    digest = hashlib.blake2b(personal.encode(), digest_size=6).hexdigest()
+    return {
+        "ETag": f'W/"c{catalog_version.version}-{digest}"',
+        "Cache-Control": "private, no-cache",
+        "Vary": "Cookie",
+    }
+
+def would_serve(request: Request) -> bool:
+    # 304 до обработки допустим, только если маршрут сам ответил бы 200, а не 401/400
+    if LOGIN_CATALOG_PATH_RE.match(request.url.path):
+        user = getattr(request.state, "current_user", None)
+        return bool(user and user["is_active"])
+    return True
+
+def matches_any(request: Request) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return if_none_match is not None and any(candidate.strip() == "*" for candidate in if_none_match.split(","))
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # "*" здесь не учитывается: он означает "ресурс существует", а это известно только после обработки
+        etag = headers["ETag"].removeprefix("W/")
+        return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and "Last-Modified" in headers:
+        try:
+            return parsedate_to_datetime(if_modified_since).timestamp() >= catalog_version.last_modified
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def conditional_get(request: Request, call_next):
+    if not is_catalog_request(request):
+        return await call_next(request)
+
+    # Версия фиксируется до обработки: если каталог изменится во время рендеринга,
+    # клиент получит устаревший ETag и просто перезапросит страницу
+    headers = catalog_validators(request)
+    if would_serve(request) and is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        if matches_any(request):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return response
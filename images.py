@@ -0,0 +1,207 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, NamedTuple, Optional
+from urllib.parse import quote
+
+import aiosqlite
+
+import metrics
+from crud import enqueue_job
+from http_cache import STATIC_DIR, static_fingerprint, static_url
+from settings import IMAGE_CACHE_DIR, IMAGE_WIDTHS, IMAGE_WORKERS
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow необязателен, без него картинки отдаются исходными файлами
+    Image = None
+
+# Формат копии: (MIME-тип, имя формата в Pillow, параметры кодирования).
+# Порядок - порядок <source> в <picture>: браузер берёт первый поддерживаемый, JPEG - для <img>
+IMAGE_FORMATS = {
+    "avif": ("image/avif", "AVIF", {"quality": 55, "speed": 6}),
+    "webp": ("image/webp", "WEBP", {"quality": 78, "method": 4}),
+    "jpg": ("image/jpeg", "JPEG", {"quality": 80, "optimize": True, "progressive": True}),
+}
+if Image is None or not features.check("avif"):
+    # AVIF есть в Pillow начиная с 11.3
+    IMAGE_FORMATS.pop("avif")
+SOURCE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff", ".avif")
+# Ширина <img src> для браузеров без srcset
+FALLBACK_WIDTH = 480
+EXIF_ORIENTATION = 0x0112
+
+class SourceImage(NamedTuple):
+    relative: str
+    path: str
+    fingerprint: str
+    width: int
+    height: int
+
+# relative -> (отпечаток, ширина, высота): размеры читаются из заголовка файла один раз
+_sources: Dict[str, tuple] = {}
+
+def source_image(path: Optional[str]) -> Optional[SourceImage]:
+    """Local raster image under static/ for an image_url; None for external URLs and missing files."""
+    if Image is None or not path:
+        return None
+    relative = path[len("/static/"):] if path.startswith("/static/") else path
+    if relative.startswith("/") or "://" in relative or not relative.lower().endswith(SOURCE_EXTENSIONS):
+        return None
+    # Путь приходит и из URL копии: за пределы static/ он не выходит
+    relative = os.path.normpath(relative)
+    if relative.startswith(".."):
+        return None
+    fingerprint = static_fingerprint(relative)
+    if fingerprint is None:
+        return None
+
+    cached = _sources.get(relative)
+    if cached is None or cached[0] != fingerprint:
+        try:
+            with Image.open(os.path.join(STATIC_DIR, relative)) as image:
+                width, height = image.size
+                # Фото с телефона хранится повёрнутым, поворот записан в EXIF
+                if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                    width, height = height, width
+        except (OSError, ValueError):
+            return None
+        cached = _sources[relative] = (fingerprint, width, height)
+    return SourceImage(relative, os.path.join(STATIC_DIR, relative), *cached)
+
+def variant_widths(source: SourceImage) -> list:
+    # Копии крупнее исходника не нужны: самая большая - исходная ширина
+    return sorted({min(width, source.width) for width in IMAGE_WIDTHS})
+
+def variant_url(source: SourceImage, width: int, fmt: str) -> str:
+    return f"/images/{width}/{quote(source.relative)}.{fmt}?v={source.fingerprint}"
+
+def variant_path(source: SourceImage, width: int, fmt: str) -> str:
+    # Отпечаток исходника в имени: изменённый файл получает новые копии
+    return os.path.join(IMAGE_CACHE_DIR, str(width), f"{source.relative}.{source.fingerprint}.{fmt}")
+
+def responsive_image(path: Optional[str]) -> dict:
+    """srcset of every format for <picture> plus a JPEG <img> fallback; a plain static URL if not resizable."""
+    source = source_image(path)
+    if source is None:
+        return {"src": static_url(path), "srcset": "", "sources": [], "width": None, "height": None}
+    widths = variant_widths(source)
+    srcsets = {fmt: ", ".join(f"{variant_url(source, width, fmt)} {width}w" for width in widths)
+               for fmt in IMAGE_FORMATS}
+    fallback = min(widths, key=lambda width: abs(width - FALLBACK_WIDTH))
+    return {
+        "src": variant_url(source, fallback, "jpg"),
+        "srcset": srcsets["jpg"],
+        "sources": [{"type": IMAGE_FORMATS[fmt][0], "srcset": srcsets[fmt]} for fmt in IMAGE_FORMATS if fmt != "jpg"],
+        "width": source.width,
+        "height": source.height,
+    }
+
+def render_variant(source_path: str, target_path: str, width: int, fmt: str) -> int:
+    """Resize and encode one copy; runs in a pool process. Returns the size of the written file."""
+    _, pillow_format, params = IMAGE_FORMATS[fmt]
+    with Image.open(source_path) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе (до 1/8): для фото в несколько
+        # мегабайт это большая часть экономии времени
+        rotated = image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8)
+        scale = width / (image.height if rotated else image.width)
+        if scale < 1:
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha and fmt == "jpg":
+            # У JPEG нет прозрачности: фон белый
+            image = Image.alpha_composite(Image.new("RGBA", image.size, "white"), image.convert("RGBA")).convert("RGB")
+        else:
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                 Image.Resampling.LANCZOS, reducing_gap=3.0)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Запись во временный файл и переименование: другой процесс не прочитает недописанную копию
+        partial = f"{target_path}.{os.getpid()}.partial"
+        image.save(partial, pillow_format, **params)
+    os.replace(partial, target_path)
+    return os.path.getsize(target_path)
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Копии, которые сейчас кодируются в этом процессе: одновременные запросы ждут одно кодирование
+_pending: Dict[str, asyncio.Future] = {}
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: в процессе сервера работают потоки aiosqlite и хеширования паролей,
+        # а унаследованная копия чужой блокировки может навсегда остановить дочерний процесс
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def stop_images():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def _render(source: SourceImage, target: str, width: int, fmt: str) -> str:
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_pool(), render_variant, source.path, target, width, fmt)
+    except BrokenProcessPool:
+        # Процесс пула упал (например, по памяти на огромном файле); следующий запрос создаст пул заново
+        stop_images()
+        raise
+    metrics.image_render_duration.observe((fmt,), time.perf_counter() - started)
+    metrics.image_variants.inc((fmt, "generated"))
+    return target
+
+async def get_variant(path: str, width: int, fmt: str) -> str:
+    """Path of a resized copy on disk, encoding it in the process pool on first use."""
+    source = source_image(path)
+    if source is None or fmt not in IMAGE_FORMATS or width not in variant_widths(source):
+        raise LookupError(path)
+    target = variant_path(source, width, fmt)
+    if os.path.exists(target):
+        metrics.image_variants.inc((fmt, "cached"))
+        return target
+
+    future = _pending.get(target)
+    if future is None:
+        future = _pending[target] = asyncio.ensure_future(_render(source, target, width, fmt))
+
+        def done(future):
+            _pending.pop(target, None)
+            # Ошибку получат ожидающие запросы; без них она не должна попасть в лог как необработанная
+            if not future.cancelled():
+                future.exception()
+
+        future.add_done_callback(done)
+    # Отмена одного запроса не прерывает кодирование, которого ждут другие
+    return await asyncio.shield(future)
+
+def missing_variants(source: SourceImage) -> list:
+    return [(width, fmt) for width in variant_widths(source) for fmt in IMAGE_FORMATS
+            if not os.path.exists(variant_path(source, width, fmt))]
+
+async def generate_variants(path: str) -> int:
+    """Create every copy of an image ahead of the first page view; returns how many were missing."""
+    source = source_image(path)
+    if source is None:
+        return 0
+    missing = missing_variants(source)
+    await asyncio.gather(*(get_variant(path, width, fmt) for width, fmt in missing))
+    return len(missing)
+
+async def enqueue_variants(db: aiosqlite.Connection, paths: Iterable[Optional[str]]) -> int:
+    # Коммит выполняет вызывающий код, как и у enqueue_job
+    count = 0
+    for path in dict.fromkeys(paths):
+        source = source_image(path)
+        if source is not None and missing_variants(source):
+            await enqueue_job(db, "image_variants", {"path": path})
+            count += 1
+    return count
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import random
+import time
+from contextlib import suppress
+from typing import Awaitable, Callable, Dict, Optional
+
+import images
+import mailer
+from database import read_connection, write_connection
+from crud import (
+    claim_job, complete_job, fail_job, release_job, next_job_due, delete_finished_jobs,
+    get_order_details, get_feedback, get_low_stock_among, LOW_STOCK_THRESHOLD
+)
+from settings import (
+    JOB_CONCURRENCY, JOB_POLL_INTERVAL, JOB_TIMEOUT, JOB_RETRY_BASE, JOB_RETRY_MAX, JOB_RETENTION
+)
+
+# Аренда заметно длиннее таймаута: живой процесс всегда успевает завершить попытку сам
+JOB_LEASE = JOB_TIMEOUT * 2 + 30
+JOB_CLEANUP_INTERVAL = 3600
+JOB_SHUTDOWN_TIMEOUT = 10
+JOB_STATS_WINDOW = 3600
+
+JOB_HANDLERS: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+
+def job_handler(kind: str):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+def retry_delay(attempts: int) -> float:
+    # Экспоненциальная задержка со случайной половиной, чтобы повторы не шли пачкой
+    delay = min(JOB_RETRY_BASE * 2 ** (attempts - 1), JOB_RETRY_MAX)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class JobRunner:
+    """Claims due jobs from the jobs table and runs at most `concurrency` of them at once."""
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: Dict[int, asyncio.Task] = {}
+        self._last_cleanup = 0.0
+
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._dispatcher
+            self._dispatcher = None
+        # Начатые задачи получают время завершиться, остальные возвращаются в очередь
+        if self._running:
+            _, pending = await asyncio.wait(list(self._running.values()), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            self._wakeup.clear()
+            try:
+                async with write_connection() as db:
+                    job = await claim_job(db, JOB_LEASE)
+            except Exception as e:
+                self._slots.release()
+                print(f"Job queue error: {e}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+            if job is None:
+                self._slots.release()
+                await self._idle()
+                continue
+            self._running[job["id"]] = asyncio.create_task(self._execute(job))
+
+    async def _idle(self):
+        now = time.time()
+        if now - self._last_cleanup > JOB_CLEANUP_INTERVAL:
+            self._last_cleanup = now
+            async with write_connection() as db:
+                await delete_finished_jobs(db, now - JOB_RETENTION)
+        async with read_connection() as db:
+            due = await next_job_due(db)
+        timeout = JOB_POLL_INTERVAL if due is None else min(max(due - time.time(), 0), JOB_POLL_INTERVAL)
+        with suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    async def _execute(self, job):
+        try:
+            await self._run_job(job)
+        except Exception as e:
+            # Сюда попадают только ошибки записи результата; задача вернётся по истечении аренды
+            print(f"Job {job['id']} ({job['kind']}): {e}")
+        finally:
+            self._running.pop(job["id"], None)
+            self._slots.release()
+
+    async def _run_job(self, job):
+        handler = JOB_HANDLERS.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            if job["attempts"] > job["max_attempts"]:
+                # Процесс упал во время последней попытки
+                raise RuntimeError("lease expired on the last attempt")
+            await asyncio.wait_for(handler(json.loads(job["payload"])), JOB_TIMEOUT)
+        except asyncio.CancelledError:
+            async with write_connection() as db:
+                await release_job(db, job["id"])
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retry = handler is not None and job["attempts"] < job["max_attempts"]
+            async with write_connection() as db:
+                await fail_job(db, job["id"], error, time.time() + retry_delay(job["attempts"]) if retry else None)
+            if retry:
+                self.retried += 1
+            else:
+                self.failed += 1
+                print(f"Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {error}")
+            return
+        async with write_connection() as db:
+            await complete_job(db, job["id"])
+        self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "running": len(self._running),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+runner: Optional[JobRunner] = None
+
+def start_jobs(concurrency: int = JOB_CONCURRENCY) -> JobRunner:
+    global runner
+    runner = JobRunner(concurrency)
+    runner.start()
+    return runner
+
+async def stop_jobs():
+    global runner
+    if runner is not None:
+        await runner.stop()
+        runner = None
+
+def wake_jobs():
+    # Вызывается после коммита транзакции с новой задачей, чтобы не ждать опроса
+    if runner is not None:
+        runner.wake()
+
+@job_handler("order_confirmation")
+async def send_order_confirmation(payload: dict):
+    async with read_connection() as db:
+        order = await get_order_details(db, payload["order_id"])
+    if order is None:
+        return
+    lines = [f"Здравствуйте, {order['full_name'] or order['username']}!", "",
+             f"Заказ №{order['id']} от {order['created_at']} оформлен:"]
+    lines += [f"  {item['name'] or 'товар #%d' % item['product_id']} × {item['quantity']} - "
+              f"{item['price'] * item['quantity']:.2f} ₽" for item in order["items"]]
+    lines += ["", f"Итого: {order['total_amount']:.2f} ₽"]
+    await mailer.send_email(order["email"], f"Заказ №{order['id']} оформлен", "\n".join(lines))
+
+@job_handler("stock_check")
+async def notify_low_stock(payload: dict):
+    async with read_connection() as db:
+        products = await get_low_stock_among(db, payload["product_ids"])
+    if products:
+        lines = [f"  {product['name']}: осталось {product['stock_quantity']}" for product in products]
+        await mailer.send_email(mailer.ADMIN_EMAIL, f"Заканчиваются товары ({len(products)})",
+                                f"Остаток не больше {LOW_STOCK_THRESHOLD} шт.:\n" + "\n".join(lines))
+
+@job_handler("feedback_notification")
+async def notify_feedback(payload: dict):
+    async with read_connection() as db:
+        message = await get_feedback(db, payload["feedback_id"])
+    if message is not None:
+        await mailer.send_email(mailer.ADMIN_EMAIL, f"Обратная связь: {message['subject']}",
+                                f"От: {message['email']}\n\n{message['message']}")
+
+@job_handler("image_variants")
+async def make_image_variants(payload: dict):
+    # Копии картинки товара создаются заранее, чтобы первый посетитель страницы не ждал кодирования
+    await images.generate_variants(payload["path"])
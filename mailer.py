@@ -0,0 +1,24 @@
+import asyncio
+import smtplib
+from email.message import EmailMessage
+from settings import SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_TIMEOUT, MAIL_FROM, ADMIN_EMAIL
+
+def _send(message: EmailMessage):
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+        if SMTP_USER:
+            smtp.starttls()
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        smtp.send_message(message)
+
+async def send_email(to: str, subject: str, body: str):
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    if not SMTP_HOST:
+        # Без настроенного SMTP письма только пишутся в лог
+        print(f"Email to {to}: {subject}")
+        return
+    # smtplib блокирующий; ошибки доходят до очереди задач и приводят к повтору
+    await asyncio.to_thread(_send, message)
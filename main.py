@@ -1,17 +1,27 @@
-from fastapi import FastAPI, Depends, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-import aiosqlite
+import time
 
-from database import init_db
-from routers import users, products, feedback, admin, cart
-from auth import get_current_user
+from fastapi import FastAPI, Depends, Request, HTTPException
+from fastapi.responses import HTMLResponse, PlainTextResponse
+
+from database import init_db, open_pool, close_pool, read_connection, sync_caches
+from jobs import start_jobs, stop_jobs, JOB_STATS_WINDOW
+from maintenance import start_maintenance, stop_maintenance
+from images import stop_images
+from product_io import stop_imports
+from routers import users, products, feedback, admin, cart, api, debug, images
+from auth import resolve_identity
+from crud import get_featured_products, get_categories, get_job_stats
+from http_cache import CachedStaticFiles, conditional_get
+from templating import templates, precompile_templates
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, METRICS_TOKEN, registry, collect_app_state, middleware_errors
+from profiler import QueryProfilerMiddleware, SQL_PROFILE
+from settings import HOST, PORT, WORKERS, MAINTENANCE_ENABLED
 
 app = FastAPI(title="Construction Store", version="1.0.0")
 
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # Include routers
 app.include_router(users.router)
@@ -19,46 +29,62 @@ app.include_router(products.router)
 app.include_router(feedback.router)
 app.include_router(admin.router)
 app.include_router(cart.router)
-
-templates = Jinja2Templates(directory="templates")
-
-# Добавляем функции min и range в окружение Jinja2
-templates.env.globals.update(min=min, range=range)
+app.include_router(api.router)
+app.include_router(images.router)
+# Трассы SQL последних запросов - только в режиме профилирования
+if SQL_PROFILE:
+    app.include_router(debug.router)
 
 @app.on_event("startup")
 async def on_startup():
+    precompile_templates()
     await init_db()
+    await open_pool()
+    sync_caches()
+    start_jobs()
+    if MAINTENANCE_ENABLED:
+        await start_maintenance()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Задачи и импорты дописывают результат через пул, поэтому останавливаются первыми
+    await stop_jobs()
+    await stop_maintenance()
+    await stop_imports()
+    stop_images()
+    await close_pool()
+
+# Условные GET для каталога; регистрируется раньше, поэтому выполняется
+# внутри add_user_to_request и видит уже определённого пользователя
+app.middleware("http")(conditional_get)
 
 # Middleware для добавления информации о пользователе в запрос
 @app.middleware("http")
 async def add_user_to_request(request: Request, call_next):
-    # Получаем пользователя из токена
-    try:
-        current_user = await get_current_user(request)
-        request.state.current_user = current_user
-        
-        # Получаем количество товаров в корзине
-        cart_count = 0
-        if current_user:
-            async with aiosqlite.connect("construction_store.db") as db:
-                db.row_factory = aiosqlite.Row
-                async with db.execute(
-                    "SELECT SUM(quantity) as total FROM cart WHERE user_id = ?", 
-                    (current_user["id"],)
-                ) as cursor:
-                    result = await cursor.fetchone()
-                    cart_count = result["total"] if result and result["total"] else 0
-        
-        request.state.cart_count = cart_count
-    except Exception as e:
-        # Если произошла ошибка, устанавливаем значения по умолчанию
-        request.state.current_user = None
-        request.state.cart_count = 0
-        print(f"Error in middleware: {e}")
+    if not request.url.path.startswith(("/static", "/images")):
+        # Записи других процессов (воркеров, скриптов) сбрасывают устаревшие записи кешей
+        sync_caches()
+        try:
+            await resolve_identity(request)
+        except Exception as e:
+            # Если произошла ошибка, устанавливаем значения по умолчанию
+            request.state.current_user = None
+            request.state.cart_count = 0
+            request.state.identity_resolved = True
+            middleware_errors.inc()
+            print(f"Error in middleware: {e}")
     
     response = await call_next(request)
     return response
 
+if SQL_PROFILE:
+    app.add_middleware(QueryProfilerMiddleware)
+
+# Сжатие оборачивает всё приложение, кроме учёта метрик
+app.add_middleware(CompressionMiddleware)
+# Метрики снаружи сжатия: время запроса включает сжатие и отправку тела
+app.add_middleware(MetricsMiddleware)
+
 # Функция для добавления cart_count во все шаблоны
 def add_cart_count_to_templates(request: Request, context: dict):
     context.update({
@@ -69,16 +95,9 @@ def add_cart_count_to_templates(request: Request, context: dict):
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        
-        # Get featured products
-        async with db.execute("SELECT * FROM products WHERE is_active = TRUE LIMIT 6") as cursor:
-            featured_products = await cursor.fetchall()
-        
-        # Get categories
-        async with db.execute("SELECT DISTINCT category FROM products WHERE is_active = TRUE LIMIT 5") as cursor:
-            categories = [row[0] for row in await cursor.fetchall()]
+    async with read_connection() as db:
+        featured_products = await get_featured_products(db)
+        categories = await get_categories(db, limit=5)
     
     context = {
         "request": request,
@@ -89,6 +108,16 @@ async def read_root(request: Request):
     
     return templates.TemplateResponse("index.html", context)
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    async with read_connection() as db:
+        job_stats = await get_job_stats(db, time.time() - JOB_STATS_WINDOW)
+    collect_app_state(job_stats)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Для нескольких процессов uvicorn нужна строка импорта, а не объект приложения
+    uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS)
\ No newline at end of file
@@ -0,0 +1,293 @@
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import suppress
+from typing import Optional
+
+import database
+import metrics
+from database import read_connection, write_connection
+from crud import claim_maintenance, finish_maintenance, get_maintenance_tasks
+from settings import (
+    MAINTENANCE_POLL_INTERVAL, WAL_TRUNCATE_INTERVAL, WAL_TRUNCATE_SIZE_MB, ANALYZE_INTERVAL, ANALYZE_LIMIT,
+    BACKUP_DIR, BACKUP_INTERVAL, BACKUP_KEEP, BACKUP_STEP_PAGES, BACKUP_STEP_PAUSE_MS
+)
+
+WAL_TRUNCATE_SIZE = int(WAL_TRUNCATE_SIZE_MB * 1024 * 1024)
+# Сколько TRUNCATE ждёт читателей старых снимков; всё это время запись в БД стоит
+CHECKPOINT_BUSY_TIMEOUT_MS = 250
+# После неудачной (busy) обрезки по размеру следующая попытка - не раньше
+TRUNCATE_RETRY = 60
+# Аренда задачи: после падения процесса её подхватит другой не раньше, чем истечёт аренда
+MAINTENANCE_LEASE = {"checkpoint": 600, "analyze": 600, "backup": 6 * 3600}
+# Повтор задачи после ошибки
+MAINTENANCE_RETRY = 600
+# Интервалы по расписанию; порядок - порядок проверки в каждом цикле
+MAINTENANCE_SCHEDULE = {
+    "checkpoint": WAL_TRUNCATE_INTERVAL,
+    "analyze": ANALYZE_INTERVAL,
+    "backup": BACKUP_INTERVAL,
+}
+
+def next_run(interval: float, delay: float) -> float:
+    # Отключённая задача (интервал 0) ждёт ручного запуска
+    return time.time() + (delay if interval > 0 else 365 * 86400)
+
+def wal_size(path: str) -> int:
+    try:
+        return os.path.getsize(path + "-wal")
+    except OSError:
+        return 0
+
+def backup_dir(path: str) -> str:
+    return BACKUP_DIR or os.path.join(os.path.dirname(os.path.abspath(path)), "backups")
+
+def list_backups(path: str) -> list:
+    """Finished backups of the database at `path`, newest first."""
+    directory = backup_dir(path)
+    prefix = os.path.splitext(os.path.basename(path))[0] + "-"
+    try:
+        names = [name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(".db")]
+    except FileNotFoundError:
+        return []
+    backups = []
+    for name in names:
+        stat = os.stat(os.path.join(directory, name))
+        backups.append({"name": name, "path": os.path.join(directory, name),
+                        "size": stat.st_size, "created_at": stat.st_mtime})
+    backups.sort(key=lambda backup: backup["name"], reverse=True)
+    return backups
+
+def copy_database(source_path: str, target_path: str, progress=None) -> int:
+    """Online copy through the SQLite backup API in BACKUP_STEP_PAGES steps; returns pages copied."""
+    source = sqlite3.connect(source_path, isolation_level=None)
+    try:
+        # Открытая транзакция чтения фиксирует снимок: без неё каждый COMMIT другого
+        # соединения начинает копирование заново, и при постоянной записи копия не заканчивается.
+        # Читатели и писатели снимку не мешают, checkpoint лишь не переносит кадры новее него
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        target = sqlite3.connect(target_path)
+        pages = 0
+
+        def step(status, remaining, total):
+            nonlocal pages
+            pages = total
+            if progress is not None:
+                progress(total - remaining, total)
+            # Пауза между шагами отдаёт диск и ядро запросам
+            time.sleep(BACKUP_STEP_PAUSE_MS / 1000)
+
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=step)
+            source.execute("COMMIT")
+            # Копия - один самодостаточный файл без -wal, её можно просто переносить
+            target.execute("PRAGMA journal_mode=DELETE")
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            if check != "ok":
+                raise RuntimeError(f"backup failed quick_check: {check}")
+        except BaseException:
+            target.close()
+            # Недописанная копия удаляется здесь: поток переживает отменённую задачу
+            for leftover in (target_path, target_path + "-journal"):
+                with suppress(OSError):
+                    os.remove(leftover)
+            raise
+        target.close()
+        return pages
+    finally:
+        source.close()
+
+class Maintenance:
+    """Background WAL checkpoints, planner statistics and online backups of the database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._backup_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._requested = set()
+        self._stopping = False
+
+        # Последний checkpoint PASSIVE этого процесса
+        self.last_checkpoint: Optional[dict] = None
+        self.checkpoints = 0
+        # Ход резервного копирования, если оно идёт в этом процессе
+        self.backup_progress: Optional[dict] = None
+
+    async def start(self):
+        self._db = await database.connect(self.path)
+        await self._db.execute(f"PRAGMA busy_timeout={CHECKPOINT_BUSY_TIMEOUT_MS};")
+        self._loop_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Поток копирования прерывается на следующем шаге, а не дописывает копию при остановке
+        self._stopping = True
+        for task in (self._loop_task, self._backup_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        self._loop_task = self._backup_task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    def request(self, name: str):
+        """Run a task on the next cycle regardless of its schedule."""
+        self._requested.add(name)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._cycle()
+            except Exception as e:
+                print(f"Maintenance error: {e}")
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), MAINTENANCE_POLL_INTERVAL)
+
+    async def _cycle(self):
+        passive = await self.passive_checkpoint()
+        async with read_connection() as db:
+            tasks = await get_maintenance_tasks(db)
+        now = time.time()
+        backup = tasks["backup"]
+        # Снимок копии не даёт обрезать WAL: TRUNCATE только ждал бы и держал запись
+        backup_running = self._backup_task is not None or (backup["locked_until"] or 0) > now
+        for name, interval in MAINTENANCE_SCHEDULE.items():
+            task = tasks[name]
+            requested = name in self._requested
+            force = requested
+            if name == "checkpoint" and not requested:
+                # Пока PASSIVE не перенёс все кадры, их держит чей-то снимок (выгрузка, копия):
+                # TRUNCATE простоял бы весь busy_timeout с заблокированной записью и не обрезал бы WAL
+                if backup_running or passive["checkpointed_frames"] < passive["log_frames"]:
+                    continue
+                last = task["result"] or {}
+                force = (wal_size(self.path) > WAL_TRUNCATE_SIZE
+                         and not (last.get("busy") and (task["finished_at"] or 0) > now - TRUNCATE_RETRY))
+            if name == "backup" and self._backup_task is not None:
+                continue
+            if not force and (interval <= 0 or task["next_run"] > now):
+                continue
+            self._requested.discard(name)
+            async with write_connection() as db:
+                if not await claim_maintenance(db, name, MAINTENANCE_LEASE[name], force):
+                    continue
+            if name == "backup":
+                # Копия большой БД идёт долго; цикл тем временем продолжает checkpoint
+                self._backup_task = asyncio.create_task(self._execute(name, interval, self.backup))
+            elif name == "checkpoint":
+                await self._execute(name, interval, self.truncate_checkpoint)
+            else:
+                await self._execute(name, interval, self.analyze)
+
+    async def _execute(self, name: str, interval: float, run):
+        started = time.perf_counter()
+        try:
+            result = await run()
+        except asyncio.CancelledError:
+            # Прерванную остановкой задачу выполнит следующий процесс, не дожидаясь конца аренды
+            async with write_connection() as db:
+                await finish_maintenance(db, name, time.time(), time.perf_counter() - started,
+                                         error="interrupted by shutdown")
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Maintenance {name} failed: {error}")
+            async with write_connection() as db:
+                await finish_maintenance(db, name, next_run(interval, min(interval, MAINTENANCE_RETRY)),
+                                         time.perf_counter() - started, error=error)
+            return
+        finally:
+            if name == "backup":
+                self._backup_task = None
+                self.backup_progress = None
+        seconds = time.perf_counter() - started
+        metrics.maintenance_duration.observe((name,), seconds)
+        async with write_connection() as db:
+            await finish_maintenance(db, name, next_run(interval, interval), seconds, result)
+
+    async def passive_checkpoint(self) -> dict:
+        # PASSIVE не ждёт ни читателей, ни писателей: переносит те кадры, которые уже можно
+        started = time.perf_counter()
+        async with self._db.execute("PRAGMA wal_checkpoint(PASSIVE)") as cursor:
+            busy, log, checkpointed = await cursor.fetchone()
+        seconds = time.perf_counter() - started
+        metrics.maintenance_duration.observe(("passive_checkpoint",), seconds)
+        self.checkpoints += 1
+        self.last_checkpoint = {
+            "at": time.time(), "seconds": seconds, "busy": bool(busy),
+            "log_frames": log, "checkpointed_frames": checkpointed, "wal_size": wal_size(self.path),
+        }
+        return self.last_checkpoint
+
+    async def truncate_checkpoint(self) -> dict:
+        wal_before = wal_size(self.path)
+        # TRUNCATE дожидается читателей старых снимков и на это время не пускает писателей.
+        # Блокировка пула ставит записи этого процесса в очередь, а не в ожидание busy_timeout
+        async with write_connection(grouped=False):
+            async with self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)") as cursor:
+                busy, log, checkpointed = await cursor.fetchone()
+        return {"busy": bool(busy), "log_frames": log, "checkpointed_frames": checkpointed,
+                "wal_before": wal_before, "wal_after": wal_size(self.path)}
+
+    async def analyze(self) -> dict:
+        # PRAGMA optimize в этой версии SQLite смотрит только таблицы, которые читало само
+        # соединение, а пишущее почти не читает; ANALYZE с analysis_limit короткий и на больших таблицах
+        async with write_connection(grouped=False) as db:
+            await db.execute(f"PRAGMA analysis_limit={ANALYZE_LIMIT};")
+            await db.execute("ANALYZE")
+            await db.commit()
+            async with db.execute("SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1") as cursor:
+                tables = (await cursor.fetchone())[0]
+        return {"tables": tables}
+
+    async def backup(self) -> dict:
+        directory = backup_dir(self.path)
+        os.makedirs(directory, exist_ok=True)
+        name = f"{os.path.splitext(os.path.basename(self.path))[0]}-{time.strftime('%Y%m%d-%H%M%S')}.db"
+        target = os.path.join(directory, name)
+        partial = target + ".partial"
+        self.backup_progress = {"name": name, "started": time.time(), "copied": 0, "total": 0}
+
+        def progress(copied, total):
+            if self._stopping:
+                raise RuntimeError("backup interrupted by shutdown")
+            self.backup_progress["copied"] = copied
+            self.backup_progress["total"] = total
+
+        pages = await asyncio.to_thread(copy_database, self.path, partial, progress)
+        os.replace(partial, target)
+        # Старые копии сверх BACKUP_KEEP удаляются
+        for old in list_backups(self.path)[max(BACKUP_KEEP, 1):]:
+            with suppress(OSError):
+                os.remove(old["path"])
+        return {"name": name, "pages": pages, "size": os.path.getsize(target)}
+
+    def stats(self) -> dict:
+        return {
+            "wal_size": wal_size(self.path),
+            "wal_truncate_size": WAL_TRUNCATE_SIZE,
+            "checkpoints": self.checkpoints,
+            "last_checkpoint": self.last_checkpoint,
+            "backup_progress": self.backup_progress,
+        }
+
+runner: Optional[Maintenance] = None
+
+async def start_maintenance() -> Maintenance:
+    global runner
+    runner = Maintenance(database.pool.path)
+    await runner.start()
+    return runner
+
+async def stop_maintenance():
+    global runner
+    if runner is not None:
+        await runner.stop()
+        runner = None
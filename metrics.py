@@ -0,0 +1,285 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cache import all_caches
+from settings import METRICS_ENABLED, METRICS_TOKEN
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+MAINTENANCE_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 300.0, 1800.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter; label values are passed as a tuple in labelnames order."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, labels: Tuple = (), value: float = 0):
+        # Для счётчиков, которые ведутся в другом модуле и только переносятся сюда при выдаче
+        self._values[labels] = value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and three additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам (последняя - +Inf), сумма]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (self.name + "_bucket",
+                       _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"'), cumulative)
+            yield self.name + "_sum", _format_labels(self.labelnames, labels), total
+            yield self.name + "_count", _format_labels(self.labelnames, labels), cumulative
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "Time until the last byte of the response", ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "Requests being processed")
+http_db_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("route",), QUERY_COUNT_BUCKETS)
+http_db_duration = registry.histogram(
+    "http_request_db_seconds", "Time spent waiting for SQLite per request", ("route",), DB_BUCKETS)
+db_operations = registry.counter(
+    "db_operations_total", "aiosqlite calls by kind: query, fetch, commit, close", ("operation",))
+db_duration = registry.histogram(
+    "db_operation_duration_seconds", "aiosqlite call latency including the connection thread queue",
+    ("operation",), DB_BUCKETS)
+write_group_units = registry.histogram(
+    "db_write_group_units", "Write blocks committed together by one group COMMIT", (), QUERY_COUNT_BUCKETS)
+maintenance_duration = registry.histogram(
+    "db_maintenance_duration_seconds", "WAL checkpoints, ANALYZE and backups run by this process",
+    ("task",), MAINTENANCE_BUCKETS)
+template_duration = registry.histogram(
+    "template_render_seconds", "Jinja template rendering; streamed pages include their row fetches",
+    ("template",), DB_BUCKETS)
+image_variants = registry.counter(
+    "image_variants_total", "Resized image lookups by format: served from the disk cache or generated",
+    ("format", "result"))
+image_render_duration = registry.histogram(
+    "image_render_seconds", "Resizing and encoding one image variant, including the process pool queue",
+    ("format",))
+
+middleware_errors = registry.counter(
+    "http_middleware_errors_total", "Requests whose user could not be resolved and were served anonymously")
+
+# Состояние кешей, пула и очереди задач переносится в метрики при каждой выдаче /metrics
+cache_hits = registry.counter("cache_hits_total", "In-process cache hits", ("cache",))
+cache_misses = registry.counter("cache_misses_total", "In-process cache misses", ("cache",))
+cache_evictions = registry.counter("cache_evictions_total", "In-process cache LRU evictions", ("cache",))
+cache_entries = registry.gauge("cache_entries", "Entries in the in-process cache", ("cache",))
+cache_hit_ratio = registry.gauge("cache_hit_ratio", "Hits over lookups since start", ("cache",))
+pool_readers_in_use = registry.gauge("db_pool_readers_in_use", "Reader connections currently borrowed")
+pool_size = registry.gauge("db_pool_readers", "Reader connections in the pool")
+pool_writer_in_use = registry.gauge("db_pool_writer_in_use", "1 while the writer connection is borrowed")
+pool_wait = registry.gauge(
+    "db_pool_wait_seconds_avg", "Average wait for a pooled connection since start", ("connection",))
+pool_wait_max = registry.gauge(
+    "db_pool_wait_seconds_max", "Longest wait for a pooled connection since start", ("connection",))
+wal_bytes = registry.gauge("db_wal_bytes", "Size of the database -wal file")
+backup_progress = registry.gauge("db_backup_progress_ratio", "Share of pages copied by a backup running in this process")
+jobs_queued = registry.gauge("jobs_queued", "Queued background jobs by readiness", ("state",))
+jobs_running = registry.gauge("jobs_running", "Background jobs being executed by any process")
+jobs_failed = registry.gauge("jobs_failed", "Background jobs that exhausted their attempts")
+jobs_oldest_due = registry.gauge("jobs_oldest_due_age_seconds", "How long the oldest due job has been waiting")
+jobs_processed = registry.counter(
+    "jobs_processed_total", "Background job attempts finished by this process", ("result",))
+
+def collect_app_state(job_stats: Optional[dict] = None):
+    # database, jobs и maintenance сами импортируют этот модуль
+    import database
+    import jobs
+    import maintenance
+
+    for cache in all_caches():
+        stats = cache.stats()
+        labels = (stats["name"],)
+        cache_hits.set(labels, stats["hits"])
+        cache_misses.set(labels, stats["misses"])
+        cache_evictions.set(labels, stats["evictions"])
+        cache_entries.set(labels, stats["size"])
+        cache_hit_ratio.set(labels, stats["hit_rate"])
+    if database.pool is not None:
+        stats = database.pool.stats()
+        pool_size.set((), stats["size"])
+        pool_readers_in_use.set((), stats["readers_in_use"])
+        pool_writer_in_use.set((), int(stats["writer_in_use"]))
+        for connection in ("reader", "writer"):
+            pool_wait.set((connection,), stats[f"{connection}_wait_avg_ms"] / 1000)
+            pool_wait_max.set((connection,), stats[f"{connection}_wait_max_ms"] / 1000)
+    if maintenance.runner is not None:
+        stats = maintenance.runner.stats()
+        wal_bytes.set((), stats["wal_size"])
+        progress = stats["backup_progress"]
+        backup_progress.set((), progress["copied"] / progress["total"] if progress and progress["total"] else 0)
+    if jobs.runner is not None:
+        stats = jobs.runner.stats()
+        for result in ("completed", "retried", "failed"):
+            jobs_processed.set((result,), stats[result])
+    if job_stats is not None:
+        jobs_queued.set(("due",), job_stats["due"])
+        jobs_queued.set(("delayed",), job_stats["delayed"])
+        jobs_running.set((), job_stats["running"])
+        jobs_failed.set((), job_stats["failed"])
+        jobs_oldest_due.set((), job_stats["oldest_due_age"])
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Объект изменяется на месте, поэтому задачи, запущенные внутри запроса, пишут в него же
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+# aiosqlite выполняет всё через Connection._execute(fn, ...); вид операции - по имени fn.
+# close - закрытие курсора при выходе из async with, тоже переход в поток соединения
+DB_OPERATIONS = {
+    "execute": "query", "executemany": "query", "executescript": "query",
+    "_execute_insert": "query", "_execute_fetchall": "query",
+    "fetchone": "fetch", "fetchmany": "fetch", "fetchall": "fetch",
+    "commit": "commit", "rollback": "commit", "close": "close",
+    "_group_begin": "commit", "_unit_commit": "commit", "_unit_rollback": "commit", "_unit_end": "commit",
+}
+
+def observe_db(fn, seconds: float):
+    operation = DB_OPERATIONS.get(getattr(fn, "__name__", ""), "other")
+    labels = (operation,)
+    db_operations.inc(labels)
+    db_duration.observe(labels, seconds)
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+        if operation == "query":
+            stats.queries += 1
+
+def observe_template(name: Optional[str], seconds: float):
+    template_duration.observe((name or "<string>",), seconds)
+
+def route_name(scope, path: str) -> str:
+    # Шаблон пути вместо самого пути: /products/{product_id}, а не /products/17.
+    # Mount заменяет scope["path"] остатком пути, поэтому исходный путь передаётся отдельно
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "") or "unmatched"
+    if path.startswith("/static/"):
+        return "/static"
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Counts requests, latency and per-request DB work by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        path = scope["path"]
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            current_request.reset(token)
+            method = scope["method"]
+            route = route_name(scope, path)
+            http_requests.inc((method, route, str(status)))
+            http_duration.observe((method, route), time.perf_counter() - started)
+            if route != "/static":
+                http_db_queries.observe((route,), stats.queries)
+                http_db_duration.observe((route,), stats.db_seconds)
@@ -0,0 +1,517 @@
+import aiosqlite
+
+# Упорядоченный список миграций: (версия, описание, шаги).
+# Шаг - SQL-строка или корутина, принимающая соединение.
+MIGRATIONS = [
+    (1, "Indexes for catalog filters, admin listings and order items", [
+        "CREATE INDEX IF NOT EXISTS idx_products_active_category ON products (is_active, category)",
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_created_at ON feedback (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_is_read ON feedback (is_read)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+    ]),
+    (2, "Keyset pagination indexes for catalog sorts", [
+        "CREATE INDEX IF NOT EXISTS idx_products_active ON products (is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_products_active_price ON products (is_active, price)",
+        "CREATE INDEX IF NOT EXISTS idx_products_active_name ON products (is_active, name)",
+        "CREATE INDEX IF NOT EXISTS idx_products_active_category_price ON products (is_active, category, price)",
+        "CREATE INDEX IF NOT EXISTS idx_products_active_category_name ON products (is_active, category, name)",
+    ]),
+    (3, "Full-text search index over products", [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, description, category,
+            content='products', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+        END
+        ''',
+        # Изменения остатков и цен не трогают поисковый индекс
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description, category ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ]),
+    (4, "Catalog version counter for HTTP validators", [
+        # Одна строка; версия растёт при любом изменении products, включая остатки
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+        ''',
+        "INSERT OR IGNORE INTO catalog_state (id) VALUES (1)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_state_insert AFTER INSERT ON products BEGIN
+            UPDATE catalog_state SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_state_update AFTER UPDATE ON products BEGIN
+            UPDATE catalog_state SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_state_delete AFTER DELETE ON products BEGIN
+            UPDATE catalog_state SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+    ]),
+    (5, "Per-product row version for fragment caching", [
+        "ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        # Любое изменение строки, кроме самой версии, увеличивает версию
+        '''
+        CREATE TRIGGER IF NOT EXISTS products_row_version AFTER UPDATE ON products
+        WHEN new.version = old.version BEGIN
+            UPDATE products SET version = old.version + 1 WHERE id = new.id;
+        END
+        ''',
+    ]),
+    (6, "Admin listing filter indexes and trigram search over users and feedback", [
+        "CREATE INDEX IF NOT EXISTS idx_users_active_created ON users (is_active, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_superuser_created ON users (is_superuser, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_feedback_read_created ON feedback (is_read, created_at)",
+        # trigram ищет по подстроке без полного сканирования таблицы
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, email, content='users', content_rowid='id', tokenize='trigram'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, username, email) VALUES (new.id, new.username, new.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, email ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username, email) VALUES ('delete', old.id, old.username, old.email);
+            INSERT INTO users_fts (rowid, username, email) VALUES (new.id, new.username, new.email);
+        END
+        ''',
+        "INSERT INTO users_fts (users_fts) VALUES ('rebuild')",
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS feedback_fts USING fts5(
+            subject, email, content='feedback', content_rowid='id', tokenize='trigram'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS feedback_fts_insert AFTER INSERT ON feedback BEGIN
+            INSERT INTO feedback_fts (rowid, subject, email) VALUES (new.id, new.subject, new.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS feedback_fts_delete AFTER DELETE ON feedback BEGIN
+            INSERT INTO feedback_fts (feedback_fts, rowid, subject, email) VALUES ('delete', old.id, old.subject, old.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS feedback_fts_update AFTER UPDATE OF subject, email ON feedback BEGIN
+            INSERT INTO feedback_fts (feedback_fts, rowid, subject, email) VALUES ('delete', old.id, old.subject, old.email);
+            INSERT INTO feedback_fts (rowid, subject, email) VALUES (new.id, new.subject, new.email);
+        END
+        ''',
+        "INSERT INTO feedback_fts (feedback_fts) VALUES ('rebuild')",
+    ]),
+    (7, "Summary counters for the admin dashboard", [
+        '''
+        CREATE TABLE IF NOT EXISTS summary_counts (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT OR REPLACE INTO summary_counts (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active
+        UNION ALL SELECT 'products', COUNT(*) FROM products
+        UNION ALL SELECT 'feedback', COUNT(*) FROM feedback
+        UNION ALL SELECT 'unread_feedback', COUNT(*) FROM feedback WHERE NOT is_read
+        ''',
+        # Счётчики поддерживаются триггерами, COUNT(*) больше не выполняется
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_users_insert AFTER INSERT ON users BEGIN
+            UPDATE summary_counts SET value = value + CASE name WHEN 'users' THEN 1 ELSE (new.is_active <> 0) END
+            WHERE name IN ('users', 'active_users');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_users_delete AFTER DELETE ON users BEGIN
+            UPDATE summary_counts SET value = value - CASE name WHEN 'users' THEN 1 ELSE (old.is_active <> 0) END
+            WHERE name IN ('users', 'active_users');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_users_update AFTER UPDATE OF is_active ON users BEGIN
+            UPDATE summary_counts SET value = value + (new.is_active <> 0) - (old.is_active <> 0)
+            WHERE name = 'active_users';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_products_insert AFTER INSERT ON products BEGIN
+            UPDATE summary_counts SET value = value + 1 WHERE name = 'products';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_products_delete AFTER DELETE ON products BEGIN
+            UPDATE summary_counts SET value = value - 1 WHERE name = 'products';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_feedback_insert AFTER INSERT ON feedback BEGIN
+            UPDATE summary_counts SET value = value + CASE name WHEN 'feedback' THEN 1 ELSE (new.is_read = 0) END
+            WHERE name IN ('feedback', 'unread_feedback');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_feedback_delete AFTER DELETE ON feedback BEGIN
+            UPDATE summary_counts SET value = value - CASE name WHEN 'feedback' THEN 1 ELSE (old.is_read = 0) END
+            WHERE name IN ('feedback', 'unread_feedback');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS summary_feedback_update AFTER UPDATE OF is_read ON feedback BEGIN
+            UPDATE summary_counts SET value = value + (new.is_read = 0) - (old.is_read = 0)
+            WHERE name = 'unread_feedback';
+        END
+        ''',
+    ]),
+    (8, "Sales rollups for the admin analytics page", [
+        '''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            day TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        # Неделя обозначается датой её понедельника
+        '''
+        CREATE TABLE IF NOT EXISTS sales_weekly (
+            week TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            items INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sales_products (
+            product_id INTEGER PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_sales_products_revenue ON sales_products (revenue)",
+        '''
+        CREATE TABLE IF NOT EXISTS sales_categories (
+            category TEXT PRIMARY KEY,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_products_active_stock ON products (is_active, stock_quantity)",
+        # Перенос уже существующих заказов
+        '''
+        INSERT OR REPLACE INTO sales_daily (day, orders, items, revenue)
+        SELECT date(o.created_at), COUNT(*), COALESCE(SUM(i.items), 0), SUM(o.total_amount)
+        FROM orders o
+        LEFT JOIN (SELECT order_id, SUM(quantity) AS items FROM order_items GROUP BY order_id) i ON i.order_id = o.id
+        GROUP BY date(o.created_at)
+        ''',
+        '''
+        INSERT OR REPLACE INTO sales_weekly (week, orders, items, revenue)
+        SELECT date(day, 'weekday 0', '-6 days'), SUM(orders), SUM(items), SUM(revenue)
+        FROM sales_daily GROUP BY date(day, 'weekday 0', '-6 days')
+        ''',
+        '''
+        INSERT OR REPLACE INTO sales_products (product_id, orders, quantity, revenue)
+        SELECT product_id, COUNT(*), SUM(quantity), SUM(quantity * price)
+        FROM order_items GROUP BY product_id
+        ''',
+        '''
+        INSERT OR REPLACE INTO sales_categories (category, quantity, revenue)
+        SELECT p.category, SUM(oi.quantity), SUM(oi.quantity * oi.price)
+        FROM order_items oi JOIN products p ON p.id = oi.product_id
+        GROUP BY p.category
+        ''',
+        '''
+        INSERT OR REPLACE INTO summary_counts (name, value)
+        SELECT 'orders', COUNT(*) FROM orders
+        UNION ALL SELECT 'items_sold', COALESCE(SUM(quantity), 0) FROM order_items
+        UNION ALL SELECT 'revenue', COALESCE(SUM(total_amount), 0) FROM orders
+        ''',
+        # Дальше всё считается триггерами в транзакции оформления заказа.
+        # Заказы в приложении не удаляются, поэтому триггеров на DELETE нет
+        '''
+        CREATE TRIGGER IF NOT EXISTS sales_orders_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO sales_daily (day, orders, revenue) VALUES (date(new.created_at), 1, new.total_amount)
+            ON CONFLICT (day) DO UPDATE SET orders = orders + 1, revenue = revenue + excluded.revenue;
+            INSERT INTO sales_weekly (week, orders, revenue)
+            VALUES (date(new.created_at, 'weekday 0', '-6 days'), 1, new.total_amount)
+            ON CONFLICT (week) DO UPDATE SET orders = orders + 1, revenue = revenue + excluded.revenue;
+            UPDATE summary_counts SET value = value + CASE name WHEN 'orders' THEN 1 ELSE new.total_amount END
+            WHERE name IN ('orders', 'revenue');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS sales_order_items_insert AFTER INSERT ON order_items BEGIN
+            UPDATE sales_daily SET items = items + new.quantity
+            WHERE day = (SELECT date(created_at) FROM orders WHERE id = new.order_id);
+            UPDATE sales_weekly SET items = items + new.quantity
+            WHERE week = (SELECT date(created_at, 'weekday 0', '-6 days') FROM orders WHERE id = new.order_id);
+            INSERT INTO sales_products (product_id, orders, quantity, revenue)
+            VALUES (new.product_id, 1, new.quantity, new.quantity * new.price)
+            ON CONFLICT (product_id) DO UPDATE SET
+                orders = orders + 1, quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue;
+            INSERT INTO sales_categories (category, quantity, revenue)
+            SELECT category, new.quantity, new.quantity * new.price FROM products WHERE id = new.product_id
+            ON CONFLICT (category) DO UPDATE SET
+                quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue;
+            UPDATE summary_counts SET value = value + new.quantity WHERE name = 'items_sold';
+        END
+        ''',
+    ]),
+    (9, "Product SKUs for bulk import and admin listing index", [
+        "ALTER TABLE products ADD COLUMN sku TEXT",
+        "UPDATE products SET sku = printf('SKU-%06d', id)",
+        # NULL в уникальном индексе не конфликтуют, поэтому артикул необязателен
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products (sku)",
+        "CREATE INDEX IF NOT EXISTS idx_products_created_at ON products (created_at)",
+        # UPDATE OF срабатывает, даже если значения не изменились, а загрузка
+        # прайс-листа перезаписывает названия вместе с ценами
+        "DROP TRIGGER IF EXISTS products_fts_update",
+        '''
+        CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description, category ON products
+        WHEN new.name IS NOT old.name OR new.description IS NOT old.description
+            OR new.category IS NOT old.category BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.id, old.name, old.description, old.category);
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+    ]),
+    (10, "Persistent background job queue", [
+        # Время - unix-секунды: сравнения и задержки повторов без разбора дат.
+        # run_at - когда задачу можно брать, locked_until - аренда выполняющей задачи:
+        # после падения процесса задача с истёкшей арендой берётся заново
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            locked_until REAL,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            last_error TEXT
+        )
+        ''',
+        # Выбор следующей задачи: status = 'queued' ORDER BY run_at
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)",
+        # Статистика за последний час, список ошибок и очистка выполненных
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_finished ON jobs (status, finished_at)",
+    ]),
+    (11, "Shared cache versions for multi-process deployments", [
+        # version растёт при любом изменении products, listing_version - только при тех,
+        # что видны в витрине и счётчиках категорий; изменение одних остатков
+        # сбрасывает в других процессах лишь кеш отдельных товаров
+        "ALTER TABLE catalog_state ADD COLUMN listing_version INTEGER NOT NULL DEFAULT 1",
+        "DROP TRIGGER IF EXISTS catalog_state_insert",
+        '''
+        CREATE TRIGGER catalog_state_insert AFTER INSERT ON products BEGIN
+            UPDATE catalog_state SET version = version + 1, listing_version = listing_version + 1,
+                updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        "DROP TRIGGER IF EXISTS catalog_state_delete",
+        '''
+        CREATE TRIGGER catalog_state_delete AFTER DELETE ON products BEGIN
+            UPDATE catalog_state SET version = version + 1, listing_version = listing_version + 1,
+                updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_state_listing
+        AFTER UPDATE OF sku, name, description, price, category, image_url, is_active ON products BEGIN
+            UPDATE catalog_state SET listing_version = listing_version + 1;
+        END
+        ''',
+        # Любое изменение пользователя сбрасывает кеш пользователей во всех процессах;
+        # новые пользователи в кеш ещё не попадали
+        '''
+        CREATE TABLE IF NOT EXISTS users_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        "INSERT OR IGNORE INTO users_state (id) VALUES (1)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_state_update AFTER UPDATE ON users BEGIN
+            UPDATE users_state SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS users_state_delete AFTER DELETE ON users BEGIN
+            UPDATE users_state SET version = version + 1;
+        END
+        ''',
+    ]),
+    (12, "Schedule of database maintenance tasks", [
+        # Строка на задачу; next_run и аренда locked_until - как у jobs, чтобы при
+        # нескольких процессах задачу выполнял один. result - JSON последнего успешного запуска
+        '''
+        CREATE TABLE IF NOT EXISTS maintenance_tasks (
+            name TEXT PRIMARY KEY,
+            next_run REAL NOT NULL DEFAULT 0,
+            locked_until REAL,
+            started_at REAL,
+            finished_at REAL,
+            seconds REAL,
+            result TEXT,
+            last_error TEXT
+        )
+        ''',
+        "INSERT OR IGNORE INTO maintenance_tasks (name) VALUES ('checkpoint'), ('analyze'), ('backup')",
+    ]),
+    (13, "Row triggers that a bulk import transaction can switch off without DDL", [
+        # Импорт прайс-листа ставит флаг внутри своей транзакции и делает работу этих триггеров
+        # одним запросом на пачку. Флаг сбрасывается до COMMIT, поэтому другие соединения
+        # его никогда не видят, а схема (и подготовленные запросы) не меняется
+        "ALTER TABLE catalog_state ADD COLUMN bulk_import INTEGER NOT NULL DEFAULT 0",
+        "DROP TRIGGER IF EXISTS products_fts_insert",
+        '''
+        CREATE TRIGGER products_fts_insert AFTER INSERT ON products
+        WHEN (SELECT bulk_import FROM catalog_state WHERE id = 1) = 0 BEGIN
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.id, new.name, new.description, new.category);
+        END
+        ''',
+        "DROP TRIGGER IF EXISTS summary_products_insert",
+        '''
+        CREATE TRIGGER summary_products_insert AFTER INSERT ON products
+        WHEN (SELECT bulk_import FROM catalog_state WHERE id = 1) = 0 BEGIN
+            UPDATE summary_counts SET value = value + 1 WHERE name = 'products';
+        END
+        ''',
+        "DROP TRIGGER IF EXISTS catalog_state_insert",
+        '''
+        CREATE TRIGGER catalog_state_insert AFTER INSERT ON products
+        WHEN (SELECT bulk_import FROM catalog_state WHERE id = 1) = 0 BEGIN
+            UPDATE catalog_state SET version = version + 1, listing_version = listing_version + 1,
+                updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        "DROP TRIGGER IF EXISTS catalog_state_update",
+        '''
+        CREATE TRIGGER catalog_state_update AFTER UPDATE ON products
+        WHEN (SELECT bulk_import FROM catalog_state WHERE id = 1) = 0 BEGIN
+            UPDATE catalog_state SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER);
+        END
+        ''',
+        "DROP TRIGGER IF EXISTS catalog_state_listing",
+        '''
+        CREATE TRIGGER catalog_state_listing
+        AFTER UPDATE OF sku, name, description, price, category, image_url, is_active ON products
+        WHEN (SELECT bulk_import FROM catalog_state WHERE id = 1) = 0 BEGIN
+            UPDATE catalog_state SET listing_version = listing_version + 1;
+        END
+        ''',
+    ]),
+    (14, "Product import progress shared by all worker processes", [
+        # Импорт выполняется в процессе, принявшем файл, а его ход пишется сюда: страницу импорта
+        # и опрос прогресса обслуживает любой процесс. lease_until продлевается с каждой пачкой:
+        # запись 'running' с истёкшей арендой осталась от упавшего процесса
+        '''
+        CREATE TABLE IF NOT EXISTS imports (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            format TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            message TEXT,
+            processed INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            rejected INTEGER NOT NULL DEFAULT 0,
+            errors TEXT NOT NULL DEFAULT '[]',
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            lease_until REAL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_imports_started ON imports (started_at)",
+    ]),
+]
+
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    async with db.execute("SELECT MAX(version) FROM schema_version") as cursor:
+        row = await cursor.fetchone()
+        return row[0] or 0
+
+async def migrate(db: aiosqlite.Connection):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.commit()
+
+    current = await get_schema_version(db)
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+
+        # Каждая миграция применяется целиком в одной транзакции. Несколько процессов
+        # стартуют одновременно: IMMEDIATE сразу берёт блокировку записи, а версия
+        # перечитывается под ней - миграцию мог уже применить другой процесс
+        await db.execute("BEGIN IMMEDIATE")
+        if await get_schema_version(db) >= version:
+            await db.rollback()
+            continue
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+from argon2 import PasswordHasher as _Argon2
+from argon2.exceptions import InvalidHashError, VerificationError
+from settings import (
+    PASSWORD_SCHEME, ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM, BCRYPT_ROUNDS,
+    PASSWORD_HASH_WORKERS
+)
+
+LEGACY_SALT = "construction_store_salt"
+
+class PasswordHasher:
+    scheme = ""
+
+    def identify(self, hashed: str) -> bool:
+        raise NotImplementedError
+
+    def hash(self, password: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, password: str, hashed: str) -> bool:
+        raise NotImplementedError
+
+    def needs_update(self, hashed: str) -> bool:
+        return False
+
+class Argon2Hasher(PasswordHasher):
+    scheme = "argon2"
+
+    def __init__(self, time_cost: int = ARGON2_TIME_COST, memory_cost: int = ARGON2_MEMORY_COST,
+                 parallelism: int = ARGON2_PARALLELISM):
+        self._hasher = _Argon2(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+    def identify(self, hashed: str) -> bool:
+        return hashed.startswith("$argon2")
+
+    def hash(self, password: str) -> str:
+        return self._hasher.hash(password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        try:
+            return self._hasher.verify(hashed, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_update(self, hashed: str) -> bool:
+        return self._hasher.check_needs_rehash(hashed)
+
+class BcryptHasher(PasswordHasher):
+    scheme = "bcrypt"
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    @staticmethod
+    def _encode(password: str) -> bytes:
+        # bcrypt учитывает только первые 72 байта пароля
+        return password.encode()[:72]
+
+    def identify(self, hashed: str) -> bool:
+        return hashed.startswith(("$2a$", "$2b$", "$2y$"))
+
+    def hash(self, password: str) -> str:
+        return bcrypt.hashpw(self._encode(password), bcrypt.gensalt(self.rounds)).decode()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        try:
+            return bcrypt.checkpw(self._encode(password), hashed.encode())
+        except ValueError:
+            return False
+
+    def needs_update(self, hashed: str) -> bool:
+        return int(hashed.split("$")[2]) != self.rounds
+
+class LegacySha256Hasher(PasswordHasher):
+    """Single salted SHA-256 used before argon2/bcrypt; verify only."""
+
+    scheme = "sha256"
+
+    def identify(self, hashed: str) -> bool:
+        return len(hashed) == 64 and all(c in "0123456789abcdef" for c in hashed)
+
+    def hash(self, password: str) -> str:
+        return hashlib.sha256(f"{password}{LEGACY_SALT}".encode()).hexdigest()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return hmac.compare_digest(self.hash(password), hashed)
+
+    def needs_update(self, hashed: str) -> bool:
+        return True
+
+HASHERS = {
+    "argon2": Argon2Hasher,
+    "bcrypt": BcryptHasher,
+}
+
+def get_hasher(scheme: str = PASSWORD_SCHEME, **params) -> PasswordHasher:
+    if scheme not in HASHERS:
+        raise ValueError(f"Unknown password scheme: {scheme}")
+    return HASHERS[scheme](**params)
+
+hasher = get_hasher()
+_known_hashers = [Argon2Hasher(), BcryptHasher(), LegacySha256Hasher()]
+
+# Хеширование занимает десятки миллисекунд CPU, поэтому выполняется
+# в ограниченном пуле потоков, а не в цикле событий
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def _verify_and_update(password: str, hashed: str, current: PasswordHasher) -> Tuple[bool, Optional[str]]:
+    if current.identify(hashed):
+        if not current.verify(password, hashed):
+            return False, None
+        return True, current.hash(password) if current.needs_update(hashed) else None
+
+    for candidate in _known_hashers:
+        if candidate.identify(hashed):
+            if not candidate.verify(password, hashed):
+                return False, None
+            # Хеш другой схемы прозрачно переводится на текущую
+            return True, current.hash(password)
+    return False, None
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, hasher.hash, password)
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Return (is_valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _verify_and_update, password, hashed, hasher)
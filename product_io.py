@@ -0,0 +1,375 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+from cache import invalidate_catalog
+from database import write_connection, stream_rows
+from images import enqueue_variants
+from jobs import wake_jobs
+from schemas import ProductCreate
+from crud import PRODUCT_COLUMNS, PRODUCT_INSERT_NEW, PRODUCT_UPSERT, product_row, create_import, save_import
+
+# Разбор и проверка идут пачками в отдельном потоке, запись - короткими транзакциями:
+# блокировка записи освобождается между ними, корзины, заказы и другие процессы не ждут весь импорт
+IMPORT_CHUNK_ROWS = 1000
+IMPORT_TRANSACTION_ROWS = 5000
+# Пауза между транзакциями, пока пишет другой процесс: его писатель ждёт блокировку в busy_timeout,
+# проверяя её раз в 100 мс (после первых 250 мс ожидания), и без паузы не успевает между COMMIT и BEGIN.
+# Писатели этого процесса паузы не требуют: блокировка пула отдаётся им по очереди
+IMPORT_TRANSACTION_PAUSE = 0.1
+# Другой процесс считается пишущим столько секунд (как busy_timeout) после того, как BEGIN ждал
+# дольше IMPORT_BUSY_WAIT или между транзакциями импорта изменилась PRAGMA data_version
+IMPORT_CONTENTION_WINDOW = 5.0
+IMPORT_BUSY_WAIT = 0.005
+IMPORT_MAX_ERRORS = 100
+IMPORT_JOBS_KEPT = 20
+# Аренда записи в imports продлевается после каждой пачки; запас - на ожидание блокировки записи
+IMPORT_LEASE = 300
+IMPORT_MODES = ("insert", "upsert")
+# Сколько разных картинок импорта получают копии заранее; остальные создаются при первом показе
+IMPORT_IMAGES_MAX = 1000
+IMAGE_URL_INDEX = PRODUCT_COLUMNS.index("image_url")
+JSON_READ_SIZE = 65536
+JSON_MAX_RECORD = 1 << 20
+EXPORT_BUFFER_SIZE = 65536
+EXPORT_COLUMNS = ["id"] + PRODUCT_COLUMNS
+
+_product_list = TypeAdapter(List[ProductCreate])
+
+def detect_format(filename: str) -> str:
+    return "json" if os.path.splitext(filename or "")[1].lower() in (".json", ".jsonl", ".ndjson") else "csv"
+
+def iter_csv_records(f):
+    header = f.readline()
+    # Разделитель по заголовку: Excel в русской локали сохраняет CSV через ";"
+    delimiter = max(",;\t", key=header.count)
+    fieldnames = [name.strip().lower() for name in next(csv.reader([header], delimiter=delimiter))]
+    for row in csv.DictReader(f, fieldnames=fieldnames, delimiter=delimiter):
+        # Пустые ячейки - значения по умолчанию; лишние колонки отбрасываются
+        yield {key: value for key, value in row.items() if key and isinstance(value, str) and value != ""}
+
+def iter_json_records(f):
+    """Yield objects of a JSON array without loading the whole file; JSON Lines is read line by line."""
+    head = f.read(JSON_READ_SIZE)
+    buffer = head.lstrip()
+    if not buffer.startswith("["):
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Строку отклонит проверка, остальные записи импортируются
+                    yield None
+        return
+
+    decoder = json.JSONDecoder()
+    pos = 1
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Запись не поместилась в буфер: дочитываем файл
+            more = "" if eof else f.read(JSON_READ_SIZE)
+            if not more or len(buffer) - pos > JSON_MAX_RECORD:
+                raise ValueError(f"Invalid JSON near position {pos}")
+            eof = len(more) < JSON_READ_SIZE
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+        yield record
+        pos = end
+
+def validate_chunk(records: list, first_row: int, mode: str):
+    """Validate a chunk in one pydantic call; returns (rows, rejected_count, messages)."""
+    try:
+        products = _product_list.validate_python(records)
+        bad = {}
+    except ValidationError as e:
+        bad = {}
+        for error in e.errors():
+            index, *field = error["loc"]
+            bad.setdefault(index, []).append(f"{'.'.join(map(str, field)) or 'запись'}: {error['msg']}")
+        products = _product_list.validate_python([record for i, record in enumerate(records) if i not in bad])
+
+    rows = []
+    good_indexes = [i for i in range(len(records)) if i not in bad]
+    for index, product in zip(good_indexes, products):
+        if mode == "upsert" and not product.sku:
+            bad[index] = ["sku: обязателен при обновлении по артикулу"]
+            continue
+        rows.append(product_row(product))
+    messages = [f"строка {first_row + index}: {'; '.join(errors)}" for index, errors in sorted(bad.items())]
+    return rows, len(bad), messages
+
+def read_chunk(records, first_row: int, mode: str):
+    chunk = list(islice(records, IMPORT_CHUNK_ROWS))
+    if not chunk:
+        return None
+    return (len(chunk),) + validate_chunk(chunk, first_row, mode)
+
+class ImportJob:
+    def __init__(self, filename: str, fmt: str, mode: str):
+        self.id = secrets.token_hex(6)
+        self.filename = filename
+        self.format = fmt
+        self.mode = mode
+        self.status = "running"
+        self.message = None
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.errors = []
+        # Картинки записанных товаров, без повторов
+        self.images = OrderedDict()
+        self.started = time.time()
+        self.finished = None
+        self.task = None
+        # Последняя замеченная запись другого процесса и data_version соединения после прошлой пачки
+        self.contended = 0.0
+        self.data_version = None
+
+    def pause(self) -> float:
+        return IMPORT_TRANSACTION_PAUSE if time.time() - self.contended < IMPORT_CONTENTION_WINDOW else 0
+
+    def add_errors(self, messages: list):
+        self.errors.extend(messages[:IMPORT_MAX_ERRORS - len(self.errors)])
+
+    def progress(self) -> dict:
+        return {
+            "status": self.status,
+            "message": self.message,
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "finished_at": self.finished,
+            "lease_until": time.time() + IMPORT_LEASE if self.status == "running" else None,
+        }
+
+    async def save(self):
+        async with write_connection() as db:
+            await save_import(db, self.id, self.progress())
+
+def import_stats(row) -> dict:
+    """Progress of an import from its row in the imports table, as shown on the admin pages."""
+    stats = dict(row)
+    stats["errors"] = json.loads(stats["errors"])
+    lease_until = stats.pop("lease_until")
+    if stats["status"] == "running" and lease_until is not None and lease_until < time.time():
+        # Процесс, выполнявший импорт, упал; записанные до этого пачки остаются
+        stats["status"] = "failed"
+        stats["message"] = "Импорт прерван: процесс приложения остановлен"
+        stats["finished_at"] = max(stats["started_at"], lease_until - IMPORT_LEASE)
+    elapsed = (stats["finished_at"] or time.time()) - stats["started_at"]
+    stats["elapsed"] = elapsed
+    stats["rows_per_second"] = stats["processed"] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+# Выполняющиеся в этом процессе импорты: ссылка держит задачу до завершения
+_import_tasks = set()
+
+async def save_upload(upload) -> str:
+    # Файл формы закрывается вместе с запросом, а импорт идёт в фоне - нужна своя копия
+    fd, path = tempfile.mkstemp(prefix="store-import-")
+    with os.fdopen(fd, "wb") as out:
+        await asyncio.to_thread(shutil.copyfileobj, upload.file, out, 1 << 20)
+    return path
+
+async def start_import(path: str, filename: str, fmt: str, mode: str) -> ImportJob:
+    job = ImportJob(filename, fmt, mode)
+    # Запись создаётся до ответа: страницу импорта может открыть любой процесс
+    async with write_connection() as db:
+        await create_import(db, job.id, filename, fmt, mode, job.started, job.started + IMPORT_LEASE,
+                            IMPORT_JOBS_KEPT)
+    job.task = asyncio.create_task(run_import(job, path))
+    _import_tasks.add(job.task)
+    job.task.add_done_callback(_import_tasks.discard)
+    return job
+
+async def stop_imports():
+    # Прерванный остановкой импорт отмечается в БД, пока пул соединений ещё открыт
+    for task in list(_import_tasks):
+        task.cancel()
+    await asyncio.gather(*_import_tasks, return_exceptions=True)
+
+async def data_version(db) -> int:
+    # Меняется только от COMMIT других соединений, то есть других процессов
+    async with db.execute("PRAGMA data_version") as cursor:
+        return (await cursor.fetchone())[0]
+
+async def write_batch(job: ImportJob, chunks: list):
+    sql = PRODUCT_UPSERT if job.mode == "upsert" else PRODUCT_INSERT_NEW
+    total = sum(len(rows) for rows in chunks)
+    async with write_connection(grouped=False) as db:
+        version = await data_version(db)
+        started = time.perf_counter()
+        await db.execute("BEGIN IMMEDIATE")
+        if time.perf_counter() - started > IMPORT_BUSY_WAIT or version != job.data_version:
+            job.contended = time.time()
+        job.data_version = version
+        try:
+            async with db.execute("SELECT COALESCE(MAX(id), 0) FROM products") as cursor:
+                last_id = (await cursor.fetchone())[0]
+            # Построчные триггеры поиска, счётчиков и версий каталога выключены флагом только
+            # в этой транзакции (миграция 13); их работа делается ниже одним запросом на пачку
+            await db.execute("UPDATE catalog_state SET bulk_import = 1 WHERE id = 1")
+            changed = 0
+            for rows in chunks:
+                async with db.executemany(sql, rows) as cursor:
+                    changed += cursor.rowcount
+            
+            # Новые строки получили id больше прежнего максимума (AUTOINCREMENT)
+            await db.execute(
+                "INSERT INTO products_fts (rowid, name, description, category) "
+                "SELECT id, name, description, category FROM products WHERE id > ?",
+                (last_id,)
+            )
+            async with db.execute("SELECT COUNT(*) FROM products WHERE id > ?", (last_id,)) as cursor:
+                inserted = (await cursor.fetchone())[0]
+            await db.execute("UPDATE summary_counts SET value = value + ? WHERE name = 'products'", (inserted,))
+            await db.execute(
+                "UPDATE catalog_state SET version = version + 1, listing_version = listing_version + 1, "
+                "bulk_import = 0, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1"
+            )
+            await db.commit()
+        except BaseException:
+            await db.rollback()
+            raise
+    job.inserted += inserted
+    job.updated += changed - inserted
+    for rows in chunks:
+        for row in rows:
+            if len(job.images) >= IMPORT_IMAGES_MAX:
+                break
+            if row[IMAGE_URL_INDEX]:
+                job.images[row[IMAGE_URL_INDEX]] = None
+    # Пропущены: уже существующие артикулы при добавлении или строки без изменений при обновлении
+    job.skipped += total - changed
+
+async def read_batches(job: ImportJob, records, first_row: int, queue: asyncio.Queue):
+    # Следующая пачка разбирается, пока предыдущая пишется в БД.
+    # Ошибка разбора передаётся через очередь и завершает импорт
+    try:
+        done = False
+        while not done:
+            chunks, batch_rows = [], 0
+            while batch_rows < IMPORT_TRANSACTION_ROWS:
+                result = await asyncio.to_thread(read_chunk, records, first_row + job.processed, job.mode)
+                if result is None:
+                    done = True
+                    break
+                count, rows, rejected, messages = result
+                job.processed += count
+                job.rejected += rejected
+                job.add_errors(messages)
+                if rows:
+                    chunks.append(rows)
+                    batch_rows += len(rows)
+            await queue.put(chunks)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(None)
+
+async def run_import(job: ImportJob, path: str):
+    reader = None
+    try:
+        # Отсчёт для data_version: запись другого процесса за время разбора первой пачки тоже видна
+        async with write_connection() as db:
+            job.data_version = await data_version(db)
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            records = iter_json_records(f) if job.format == "json" else iter_csv_records(f)
+            # Номера строк в сообщениях как в файле: у CSV первая строка - заголовок
+            first_row = 2 if job.format == "csv" else 1
+            queue = asyncio.Queue(maxsize=1)
+            reader = asyncio.create_task(read_batches(job, records, first_row, queue))
+            while (chunks := await queue.get()) is not None:
+                if isinstance(chunks, Exception):
+                    raise chunks
+                if chunks:
+                    await write_batch(job, chunks)
+                await job.save()
+                await asyncio.sleep(job.pause())
+        job.status = "done"
+    except asyncio.CancelledError:
+        job.status = "failed"
+        job.message = "Импорт прерван остановкой приложения"
+        raise
+    except Exception as e:
+        job.status = "failed"
+        job.message = str(e)
+    finally:
+        if reader is not None:
+            reader.cancel()
+        job.finished = time.time()
+        os.unlink(path)
+        try:
+            await job.save()
+        except Exception as e:
+            # Без итоговой записи импорт покажется прерванным, когда истечёт аренда
+            print(f"Import {job.id}: status not saved: {e}")
+        # Уже записанные транзакции остаются и при ошибке
+        invalidate_catalog()
+        if job.images:
+            try:
+                async with write_connection() as db:
+                    if await enqueue_variants(db, job.images):
+                        await db.commit()
+                wake_jobs()
+            except Exception as e:
+                print(f"Import {job.id}: image variants not queued: {e}")
+    print(f"Import {job.id} ({job.filename}): {job.status}, {job.processed} rows, "
+          f"{job.inserted} inserted, {job.updated} updated, {job.rejected} rejected "
+          f"in {job.finished - job.started:.1f}s")
+
+async def export_products(fmt: str):
+    """Stream the whole catalog as CSV or a JSON array, in import-compatible columns."""
+    rows = stream_rows(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM products ORDER BY id")
+    if fmt == "json":
+        parts, size, separator = ["[\n"], 2, ""
+        async for row in rows:
+            line = separator + orjson.dumps(dict(row)).decode()
+            separator = ",\n"
+            parts.append(line)
+            size += len(line)
+            if size >= EXPORT_BUFFER_SIZE:
+                yield "".join(parts)
+                parts, size = [], 0
+        parts.append("\n]\n")
+        yield "".join(parts)
+        return
+
+    buffer = io.StringIO()
+    # BOM, чтобы Excel открыл UTF-8 без выбора кодировки
+    buffer.write("\ufeff")
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for row in rows:
+        writer.writerow(tuple(row))
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
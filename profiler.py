@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import sqlite3
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+
+from metrics import route_name
+from settings import SQL_PROFILE, SQL_SLOW_MS, SQL_REPEAT_THRESHOLD, SQL_PROFILE_HISTORY
+
+QUERY_CALLS = {"execute", "executemany", "executescript", "_execute_insert", "_execute_fetchall"}
+FETCH_CALLS = {"fetchone", "fetchmany", "fetchall"}
+
+def params_shape(params, many: bool = False) -> str:
+    """Types of the bound parameters, never their values."""
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return "many × ?"
+        return f"{len(params)} × {params_shape(params[0]) if params else '()'}"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in params or ()) + ")"
+
+class Statement:
+    __slots__ = ("sql", "params", "shape", "many", "rows", "seconds", "error")
+
+    def __init__(self, sql: str, params, many: bool):
+        self.sql = " ".join(sql.split())
+        # Значения нужны только для EXPLAIN медленного запроса и отбрасываются в конце HTTP-запроса
+        self.params = params
+        self.shape = params_shape(params, many)
+        self.many = many
+        self.rows = 0
+        self.seconds = 0.0
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "params": self.shape,
+            "rows": self.rows,
+            "ms": round(self.seconds * 1000, 3),
+            "error": self.error,
+        }
+
+class RequestTrace:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started = time.time()
+        self.seconds = 0.0
+        self.statements = []
+        self.repeated = []
+        self.slow = []
+        self.flagged = False
+        self.finished = False
+        # Курсор -> запрос, которому засчитываются последующие выборки строк
+        self._cursors = {}
+
+    def record(self, fn, args, result, seconds: float, error: Optional[BaseException]):
+        name = getattr(fn, "__name__", "")
+        if name in QUERY_CALLS and args:
+            statement = Statement(args[0], args[1] if len(args) > 1 else (), name == "executemany")
+            statement.seconds = seconds
+            if error is not None:
+                statement.error = f"{type(error).__name__}: {error}"
+            elif isinstance(result, sqlite3.Cursor):
+                # Для INSERT/UPDATE/DELETE - затронутые строки, для SELECT -1 и строки считаются при выборке
+                statement.rows = max(result.rowcount, 0)
+                self._cursors[result] = statement
+            elif name == "_execute_fetchall":
+                statement.rows = len(result)
+            elif name == "_execute_insert":
+                statement.rows = 1
+            self.statements.append(statement)
+        elif name in FETCH_CALLS:
+            statement = self._cursors.get(getattr(fn, "__self__", None))
+            if statement is not None:
+                statement.seconds += seconds
+                if isinstance(result, list):
+                    statement.rows += len(result)
+                elif result is not None:
+                    statement.rows += 1
+
+    def finish(self, route: str, status: int, seconds: float) -> list:
+        """Close the trace; returns its slow statements, whose parameters are kept for EXPLAIN."""
+        self.route = route
+        self.status = status
+        self.seconds = seconds
+        self.finished = True
+        self._cursors.clear()
+        counts = Counter(statement.sql for statement in self.statements if not statement.many)
+        self.repeated = [
+            {"sql": sql, "count": count,
+             "ms": round(sum(s.seconds for s in self.statements if s.sql == sql) * 1000, 3)}
+            for sql, count in counts.items() if count >= SQL_REPEAT_THRESHOLD
+        ]
+        slow = []
+        for statement in self.statements:
+            if statement.seconds * 1000 >= SQL_SLOW_MS:
+                slow.append(statement)
+            else:
+                statement.params = None
+        self.flagged = bool(self.repeated or slow)
+        return slow
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "flagged": self.flagged,
+            "started": self.started,
+            "ms": round(self.seconds * 1000, 3),
+            "queries": len(self.statements),
+            "db_ms": round(sum(statement.seconds for statement in self.statements) * 1000, 3),
+            "repeated": self.repeated,
+            "slow": self.slow,
+            "statements": [statement.to_dict() for statement in self.statements],
+        }
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+recent_traces = deque(maxlen=SQL_PROFILE_HISTORY)
+# Ссылки на фоновые отчёты, чтобы задачи не собрал сборщик мусора до завершения
+_reports = set()
+
+def record(fn, args, result, seconds: float, error: Optional[BaseException] = None):
+    trace = current_trace.get()
+    # Задачи, запущенные из запроса (импорт прайс-листа), наследуют его контекст и переживают его
+    if trace is not None and not trace.finished:
+        trace.record(fn, args, result, seconds, error)
+
+async def explain(statement: Statement):
+    # database сам импортирует этот модуль
+    from database import read_connection
+
+    params = statement.params
+    if statement.many:
+        params = params[0] if isinstance(params, (list, tuple)) and params else None
+    if params is None:
+        return ["parameters unavailable"]
+    try:
+        async with read_connection() as db:
+            async with db.execute("EXPLAIN QUERY PLAN " + statement.sql, params) as cursor:
+                return [row["detail"] for row in await cursor.fetchall()]
+    except Exception as e:
+        return [f"EXPLAIN failed: {e}"]
+
+async def report(trace: RequestTrace, slow: list):
+    where = f"{trace.method} {trace.route or trace.path}"
+    for repeated in trace.repeated:
+        print(f"N+1 in {where}: {repeated['count']} × {repeated['sql']} ({repeated['ms']} ms)")
+    for statement in slow:
+        plan = await explain(statement)
+        trace.slow.append(dict(statement.to_dict(), plan=plan))
+        print(f"Slow query in {where}: {statement.seconds * 1000:.1f} ms, {statement.rows} rows: {statement.sql}")
+        for line in plan:
+            print(f"    {line}")
+        statement.params = None
+
+class QueryProfilerMiddleware:
+    """Collects every SQL statement of a request; logs slow queries with their plans and N+1 loops."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path.startswith(("/static/", "/debug/")):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        trace = RequestTrace(scope["method"], path)
+        token = current_trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_trace.reset(token)
+            slow = trace.finish(route_name(scope, path), status, time.perf_counter() - started)
+            recent_traces.append(trace)
+            if trace.flagged:
+                # EXPLAIN выполняется после ответа и вне контекста запроса, чтобы не попасть в его же трассу
+                task = asyncio.create_task(report(trace, slow), context=contextvars.Context())
+                _reports.add(task)
+                task.add_done_callback(_reports.discard)
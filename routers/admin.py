@@ -1,85 +1,263 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, JSONResponse
 from fastapi.requests import Request
-import aiosqlite
+from datetime import date
+from typing import Optional
+from urllib.parse import urlencode, urlsplit
+from pydantic import ValidationError
+import sqlite3
+import time
 
-from auth import get_current_admin_user
+import database
+import jobs
+import maintenance
+import product_io
+from images import enqueue_variants
+from cache import all_caches, invalidate_catalog
+from schemas import ProductCreate
+from templating import templates, stream_template
+from database import read_connection, write_connection
+from auth import get_current_admin_user, invalidate_user
+from crud import (
+    get_users_page, get_feedback_page, get_summary_counts, ADMIN_PAGE_SIZE, ADMIN_PAGE_MAX,
+    get_sales_by_day, get_sales_by_week, get_top_products, get_sales_by_category,
+    get_low_stock_products, count_low_stock_products, basket_summary, LOW_STOCK_THRESHOLD,
+    get_admin_products_page, get_categories, get_product, create_product, update_product, toggle_product_active,
+    get_job_stats, get_job_kinds, get_failed_jobs, retry_job, get_database_info, get_maintenance_tasks,
+    get_import, get_recent_imports
+)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/", response_class=HTMLResponse)
 async def admin_dashboard(
     request: Request,
     admin: dict = Depends(get_current_admin_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        
-        # Get stats
-        async with db.execute("SELECT COUNT(*) FROM users") as cursor:
-            user_count = (await cursor.fetchone())[0]
-        
-        async with db.execute("SELECT COUNT(*) FROM products") as cursor:
-            product_count = (await cursor.fetchone())[0]
-        
-        async with db.execute("SELECT COUNT(*) FROM feedback WHERE is_read = FALSE") as cursor:
-            unread_feedback = (await cursor.fetchone())[0]
+    async with read_connection() as db:
+        counts = await get_summary_counts(db)
+        low_stock_count = await count_low_stock_products(db)
+        job_stats = await get_job_stats(db, time.time() - jobs.JOB_STATS_WINDOW)
+        maintenance_tasks = await get_maintenance_tasks(db)
     
     context = {
         "request": request,
-        "user_count": user_count,
-        "product_count": product_count,
-        "unread_feedback": unread_feedback,
+        "user_count": counts.get("users", 0),
+        "product_count": counts.get("products", 0),
+        "unread_feedback": counts.get("unread_feedback", 0),
+        "sales": basket_summary(counts.get("orders", 0), counts.get("items_sold", 0), counts.get("revenue", 0)),
+        "low_stock_count": low_stock_count,
+        "pool_stats": database.pool.stats(),
+        "cache_stats": [cache.stats() for cache in all_caches()],
+        "job_stats": job_stats,
+        "wal_size": maintenance.wal_size(database.pool.path),
+        "maintenance_tasks": maintenance_tasks,
+        "now": time.time(),
         "current_user": admin,
         "cart_count": getattr(request.state, 'cart_count', 0)
     }
     
     return templates.TemplateResponse("admin/dashboard.html", context)
 
+@router.get("/analytics", response_class=HTMLResponse)
+async def admin_analytics(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    async with read_connection() as db:
+        counts = await get_summary_counts(db)
+        days = await get_sales_by_day(db)
+        weeks = await get_sales_by_week(db)
+        top_products = await get_top_products(db)
+        categories = await get_sales_by_category(db)
+        low_stock = await get_low_stock_products(db)
+        low_stock_count = await count_low_stock_products(db)
+    
+    context = {
+        "request": request,
+        "sales": basket_summary(counts.get("orders", 0), counts.get("items_sold", 0), counts.get("revenue", 0)),
+        "days": [dict(row, **basket_summary(row["orders"], row["items"], row["revenue"])) for row in days],
+        "weeks": [dict(row, **basket_summary(row["orders"], row["items"], row["revenue"])) for row in weeks],
+        "top_products": top_products,
+        "categories": categories,
+        "low_stock": low_stock,
+        "low_stock_count": low_stock_count,
+        "low_stock_threshold": LOW_STOCK_THRESHOLD,
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    
+    return templates.TemplateResponse("admin/analytics.html", context)
+
+@router.get("/jobs", response_class=HTMLResponse)
+async def admin_jobs(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    since = time.time() - jobs.JOB_STATS_WINDOW
+    async with read_connection() as db:
+        job_stats = await get_job_stats(db, since)
+        kinds = await get_job_kinds(db, since)
+        failures = await get_failed_jobs(db)
+    
+    context = {
+        "request": request,
+        "job_stats": job_stats,
+        "runner_stats": jobs.runner.stats() if jobs.runner else None,
+        "kinds": kinds,
+        "failures": failures,
+        "now": time.time(),
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    
+    return templates.TemplateResponse("admin/jobs.html", context)
+
+@router.post("/jobs/{job_id}/retry")
+async def admin_retry_job(
+    job_id: int,
+    admin: dict = Depends(get_current_admin_user)
+):
+    async with write_connection() as db:
+        if not await retry_job(db, job_id):
+            raise HTTPException(status_code=404, detail="Failed job not found")
+    jobs.wake_jobs()
+    return RedirectResponse(url="/admin/jobs", status_code=303)
+
+@router.get("/database", response_class=HTMLResponse)
+async def admin_database(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    async with read_connection() as db:
+        info = await get_database_info(db)
+        tasks = await get_maintenance_tasks(db)
+    
+    context = {
+        "request": request,
+        "info": info,
+        "tasks": [dict(tasks[name], interval=interval) for name, interval in maintenance.MAINTENANCE_SCHEDULE.items()],
+        "runner_stats": maintenance.runner.stats() if maintenance.runner else None,
+        "wal_size": maintenance.wal_size(database.pool.path),
+        "wal_truncate_size": maintenance.WAL_TRUNCATE_SIZE,
+        "backups": maintenance.list_backups(database.pool.path),
+        "now": time.time(),
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    
+    return templates.TemplateResponse("admin/database.html", context)
+
+@router.post("/database/{task}/run")
+async def admin_run_maintenance(
+    task: str,
+    admin: dict = Depends(get_current_admin_user)
+):
+    if task not in maintenance.MAINTENANCE_SCHEDULE:
+        raise HTTPException(status_code=404, detail="Unknown maintenance task")
+    if maintenance.runner is None:
+        raise HTTPException(status_code=409, detail="Maintenance is disabled in this process")
+    maintenance.runner.request(task)
+    return RedirectResponse(url="/admin/database", status_code=303)
+
+def parse_flag(value: Optional[str], true_value: str, false_value: str) -> Optional[bool]:
+    return {true_value: True, false_value: False}.get(value)
+
+def parse_date(value: Optional[str]) -> Optional[str]:
+    try:
+        return date.fromisoformat(value).isoformat() if value else None
+    except ValueError:
+        return None
+
+def back_to_listing(request: Request, path: str) -> str:
+    # После действия возвращаемся на ту же страницу списка с теми же фильтрами
+    referer = urlsplit(request.headers.get("referer", ""))
+    if referer.path == path and referer.query:
+        return f"{path}?{referer.query}"
+    return path
+
+def listing_url(path: str, filters: dict, limit: int, cursor: Optional[str] = None) -> str:
+    params = dict(filters, limit=limit if limit != ADMIN_PAGE_SIZE else None, cursor=cursor)
+    query = urlencode({key: value for key, value in params.items() if value})
+    return f"{path}?{query}" if query else path
+
 @router.get("/users", response_class=HTMLResponse)
 async def admin_users(
     request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_MAX),
+    status: Optional[str] = None,
+    role: Optional[str] = None,
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
     admin: dict = Depends(get_current_admin_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM users ORDER BY created_at DESC") as cursor:
-            users = await cursor.fetchall()
+    filters = {"status": status, "role": role, "q": (q or "").strip() or None,
+               "date_from": parse_date(date_from), "date_to": parse_date(date_to)}
+    query = dict(
+        is_active=parse_flag(status, "active", "inactive"),
+        is_superuser=parse_flag(role, "admin", "user"),
+        search=filters["q"], date_from=filters["date_from"], date_to=filters["date_to"],
+    )
+    async with read_connection() as db:
+        try:
+            users, next_cursor, prev_cursor = await get_users_page(db, limit=limit, page_cursor=cursor, **query)
+        except ValueError:
+            users, next_cursor, prev_cursor = await get_users_page(db, limit=limit, **query)
+        counts = await get_summary_counts(db)
     
     context = {
         "request": request,
         "users": users,
+        "filters": filters,
+        "counts": counts,
+        "next_url": listing_url("/admin/users", filters, limit, next_cursor) if next_cursor else None,
+        "prev_url": listing_url("/admin/users", filters, limit, prev_cursor) if prev_cursor else None,
         "current_user": admin,
         "cart_count": getattr(request.state, 'cart_count', 0)
     }
     
-    return templates.TemplateResponse("admin/users.html", context)
+    return StreamingResponse(stream_template("admin/users.html", context), media_type="text/html")
 
 @router.get("/feedback", response_class=HTMLResponse)
 async def admin_feedback(
     request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_MAX),
+    status: Optional[str] = None,
+    q: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
     admin: dict = Depends(get_current_admin_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            """SELECT f.*, u.username 
-               FROM feedback f 
-               LEFT JOIN users u ON f.user_id = u.id 
-               ORDER BY f.created_at DESC"""
-        ) as cursor:
-            feedback_messages = await cursor.fetchall()
+    filters = {"status": status, "q": (q or "").strip() or None,
+               "date_from": parse_date(date_from), "date_to": parse_date(date_to)}
+    query = dict(
+        is_read=parse_flag(status, "read", "unread"),
+        search=filters["q"], date_from=filters["date_from"], date_to=filters["date_to"],
+    )
+    async with read_connection() as db:
+        try:
+            feedback_messages, next_cursor, prev_cursor = await get_feedback_page(
+                db, limit=limit, page_cursor=cursor, **query
+            )
+        except ValueError:
+            feedback_messages, next_cursor, prev_cursor = await get_feedback_page(db, limit=limit, **query)
+        counts = await get_summary_counts(db)
     
     context = {
         "request": request,
         "feedback_messages": feedback_messages,
+        "filters": filters,
+        "counts": counts,
+        "next_url": listing_url("/admin/feedback", filters, limit, next_cursor) if next_cursor else None,
+        "prev_url": listing_url("/admin/feedback", filters, limit, prev_cursor) if prev_cursor else None,
         "current_user": admin,
         "cart_count": getattr(request.state, 'cart_count', 0)
     }
     
-    return templates.TemplateResponse("admin/feedback.html", context)
+    return StreamingResponse(stream_template("admin/feedback.html", context), media_type="text/html")
 
 @router.post("/users/{user_id}/toggle")
 async def toggle_user_status(
@@ -87,8 +265,8 @@ async def toggle_user_status(
     request: Request,
     admin: dict = Depends(get_current_admin_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        async with db.execute("SELECT is_active FROM users WHERE id = ?", (user_id,)) as cursor:
+    async with write_connection() as db:
+        async with db.execute("SELECT username, is_active FROM users WHERE id = ?", (user_id,)) as cursor:
             user = await cursor.fetchone()
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
@@ -97,7 +275,8 @@ async def toggle_user_status(
             await db.execute("UPDATE users SET is_active = ? WHERE id = ?", (new_status, user_id))
             await db.commit()
     
-    return RedirectResponse(url="/admin/users", status_code=303)
+    invalidate_user(user["username"])
+    return RedirectResponse(url=back_to_listing(request, "/admin/users"), status_code=303)
 
 @router.post("/feedback/{feedback_id}/mark-read")
 async def mark_feedback_read(
@@ -105,8 +284,224 @@ async def mark_feedback_read(
     request: Request,
     admin: dict = Depends(get_current_admin_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
+    async with write_connection() as db:
         await db.execute("UPDATE feedback SET is_read = TRUE WHERE id = ?", (feedback_id,))
         await db.commit()
     
-    return RedirectResponse(url="/admin/feedback", status_code=303)
\ No newline at end of file
+    return RedirectResponse(url=back_to_listing(request, "/admin/feedback"), status_code=303)
+
+@router.get("/products", response_class=HTMLResponse)
+async def admin_products(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_MAX),
+    status: Optional[str] = None,
+    category: Optional[str] = None,
+    q: Optional[str] = None,
+    admin: dict = Depends(get_current_admin_user)
+):
+    filters = {"status": status, "category": category or None, "q": (q or "").strip() or None}
+    query = dict(is_active=parse_flag(status, "active", "inactive"), category=filters["category"], search=filters["q"])
+    async with read_connection() as db:
+        try:
+            products, next_cursor, prev_cursor = await get_admin_products_page(
+                db, limit=limit, page_cursor=cursor, **query
+            )
+        except ValueError:
+            products, next_cursor, prev_cursor = await get_admin_products_page(db, limit=limit, **query)
+        counts = await get_summary_counts(db)
+        categories = await get_categories(db)
+    
+    context = {
+        "request": request,
+        "products": products,
+        "categories": categories,
+        "filters": filters,
+        "counts": counts,
+        "next_url": listing_url("/admin/products", filters, limit, next_cursor) if next_cursor else None,
+        "prev_url": listing_url("/admin/products", filters, limit, prev_cursor) if prev_cursor else None,
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    
+    return templates.TemplateResponse("admin/products.html", context)
+
+def product_form_context(request: Request, admin: dict, product, errors=None) -> dict:
+    return {
+        "request": request,
+        "product": product,
+        "errors": errors or [],
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+
+async def parse_product_form(request: Request):
+    form_data = await request.form()
+    values = {field: form_data.get(field) for field in ProductCreate.model_fields if field != "is_active"}
+    values["is_active"] = form_data.get("is_active") is not None
+    try:
+        # Пустые поля формы - значения по умолчанию
+        return ProductCreate(**{key: value for key, value in values.items() if value not in (None, "")}), values, []
+    except ValidationError as e:
+        return None, values, [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+
+@router.get("/products/new", response_class=HTMLResponse)
+async def new_product_form(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    return templates.TemplateResponse("admin/product_form.html", product_form_context(request, admin, None))
+
+@router.post("/products/new")
+async def create_product_route(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    product, values, errors = await parse_product_form(request)
+    if product:
+        try:
+            async with write_connection() as db:
+                await create_product(db, product)
+                # Копии картинки готовятся в фоне, до первого показа товара
+                if await enqueue_variants(db, [product.image_url]):
+                    await db.commit()
+        except sqlite3.IntegrityError:
+            errors = ["sku: товар с таким артикулом уже есть"]
+    if errors:
+        return templates.TemplateResponse(
+            "admin/product_form.html", product_form_context(request, admin, values, errors), status_code=400
+        )
+    
+    invalidate_catalog()
+    jobs.wake_jobs()
+    return RedirectResponse(url="/admin/products", status_code=303)
+
+async def recent_imports() -> list:
+    async with read_connection() as db:
+        rows = await get_recent_imports(db, product_io.IMPORT_JOBS_KEPT)
+    return [product_io.import_stats(row) for row in rows]
+
+@router.get("/products/import", response_class=HTMLResponse)
+async def product_import_form(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    context = {
+        "request": request,
+        "jobs": await recent_imports(),
+        "error": None,
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    return templates.TemplateResponse("admin/product_import.html", context)
+
+@router.post("/products/import")
+async def start_product_import(
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    form_data = await request.form()
+    upload = form_data.get("file")
+    mode = form_data.get("mode", "insert")
+    if not getattr(upload, "filename", None) or mode not in product_io.IMPORT_MODES:
+        context = {
+            "request": request,
+            "jobs": await recent_imports(),
+            "error": "Выберите файл CSV или JSON и режим импорта",
+            "current_user": admin,
+            "cart_count": getattr(request.state, 'cart_count', 0)
+        }
+        return templates.TemplateResponse("admin/product_import.html", context, status_code=400)
+    
+    fmt = form_data.get("format") or product_io.detect_format(upload.filename)
+    path = await product_io.save_upload(upload)
+    job = await product_io.start_import(path, upload.filename, "json" if fmt == "json" else "csv", mode)
+    return RedirectResponse(url=f"/admin/products/import/{job.id}", status_code=303)
+
+@router.get("/products/import/{job_id}", response_class=HTMLResponse)
+async def product_import_status(
+    job_id: str,
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    # Импорт идёт в процессе, принявшем файл; ход читается из БД и виден любому процессу
+    async with read_connection() as db:
+        row = await get_import(db, job_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Import not found")
+    job = product_io.import_stats(row)
+    if "application/json" in request.headers.get("accept", ""):
+        return JSONResponse(job)
+    
+    context = {
+        "request": request,
+        "job": job,
+        "current_user": admin,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    return templates.TemplateResponse("admin/product_import_job.html", context)
+
+@router.get("/products/export")
+async def export_products(
+    format: str = "csv",
+    admin: dict = Depends(get_current_admin_user)
+):
+    fmt = "json" if format == "json" else "csv"
+    media_type = "application/json" if fmt == "json" else "text/csv"
+    return StreamingResponse(
+        product_io.export_products(fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{fmt}"'}
+    )
+
+@router.get("/products/{product_id}/edit", response_class=HTMLResponse)
+async def edit_product_form(
+    product_id: int,
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    async with read_connection() as db:
+        product = await get_product(db, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    return templates.TemplateResponse("admin/product_form.html", product_form_context(request, admin, product))
+
+@router.post("/products/{product_id}/edit")
+async def update_product_route(
+    product_id: int,
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    product, values, errors = await parse_product_form(request)
+    values["id"] = product_id
+    if product:
+        try:
+            async with write_connection() as db:
+                if not await update_product(db, product_id, product):
+                    raise HTTPException(status_code=404, detail="Product not found")
+                if await enqueue_variants(db, [product.image_url]):
+                    await db.commit()
+        except sqlite3.IntegrityError:
+            errors = ["sku: товар с таким артикулом уже есть"]
+    if errors:
+        return templates.TemplateResponse(
+            "admin/product_form.html", product_form_context(request, admin, values, errors), status_code=400
+        )
+    
+    invalidate_catalog()
+    jobs.wake_jobs()
+    return RedirectResponse(url=back_to_listing(request, "/admin/products"), status_code=303)
+
+@router.post("/products/{product_id}/toggle")
+async def toggle_product(
+    product_id: int,
+    request: Request,
+    admin: dict = Depends(get_current_admin_user)
+):
+    async with write_connection() as db:
+        if not await toggle_product_active(db, product_id):
+            raise HTTPException(status_code=404, detail="Product not found")
+    
+    invalidate_catalog()
+    return RedirectResponse(url=back_to_listing(request, "/admin/products"), status_code=303)
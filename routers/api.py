@@ -0,0 +1,134 @@
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import ORJSONResponse
+from typing import Optional
+
+from cache import invalidate_products
+from jobs import wake_jobs
+from database import read_connection, write_connection
+from auth import get_current_active_user
+from schemas import (
+    Product, ProductPage, ProductSearch, Cart, CartItemCreate, CartItemUpdate, OrderCreated, OrderPage,
+    SQLITE_INTEGER_MAX
+)
+from crud import (
+    get_products_page, get_product, search_products, get_cart_items, add_to_cart,
+    update_cart_item, remove_from_cart, checkout_cart, InsufficientStockError,
+    get_orders_page, order_exists, reorder,
+    PRODUCTS_PAGE_SIZE, PRODUCTS_PAGE_MAX, HIGHLIGHT_START, HIGHLIGHT_END, ORDERS_PAGE_SIZE, ORDERS_PAGE_MAX
+)
+
+# JSON-версия каталога и корзины; HTML-маршруты остаются без изменений
+router = APIRouter(prefix="/api/v1", tags=["api"], default_response_class=ORJSONResponse)
+
+def cart_response(cart_items) -> dict:
+    return {
+        "items": [dict(item) for item in cart_items],
+        "total": sum(item["price"] * item["quantity"] for item in cart_items),
+        "count": sum(item["quantity"] for item in cart_items),
+    }
+
+@router.get("/products", response_model=ProductPage)
+async def api_list_products(
+    cursor: Optional[str] = None,
+    limit: int = Query(PRODUCTS_PAGE_SIZE, ge=1, le=PRODUCTS_PAGE_MAX),
+    category: Optional[str] = None,
+    sort: str = "newest"
+):
+    async with read_connection() as db:
+        try:
+            rows, next_cursor, prev_cursor = await get_products_page(
+                db, limit=limit, category=category, sort=sort, page_cursor=cursor
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor or sort")
+    return {"items": [dict(row) for row in rows], "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+@router.get("/products/search", response_model=ProductSearch)
+async def api_search_products(q: str = Query(..., min_length=1, max_length=200)):
+    async with read_connection() as db:
+        products, relaxed = await search_products(db, q)
+    for product in products:
+        product["snippet"] = product["snippet"].replace(HIGHLIGHT_START, "").replace(HIGHLIGHT_END, "")
+    return {"query": q, "relaxed": relaxed, "items": products}
+
+@router.get("/products/{product_id}", response_model=Product)
+async def api_get_product(product_id: int = Path(ge=1, le=SQLITE_INTEGER_MAX)):
+    async with read_connection() as db:
+        product = await get_product(db, product_id)
+    if not product or not product["is_active"]:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return dict(product)
+
+@router.get("/cart", response_model=Cart)
+async def api_get_cart(current_user: dict = Depends(get_current_active_user)):
+    async with read_connection() as db:
+        return cart_response(await get_cart_items(db, current_user["id"]))
+
+@router.post("/cart/items", response_model=Cart)
+async def api_add_to_cart(item: CartItemCreate, current_user: dict = Depends(get_current_active_user)):
+    async with write_connection() as db:
+        # Снятый с продажи товар недоступен и в корзине, как и в GET /products/{id}
+        product = await get_product(db, item.product_id)
+        if not product or not product["is_active"]:
+            raise HTTPException(status_code=404, detail="Product not found")
+        await add_to_cart(db, current_user["id"], item.product_id, item.quantity)
+        return cart_response(await get_cart_items(db, current_user["id"]))
+
+@router.put("/cart/items/{product_id}", response_model=Cart)
+async def api_update_cart_item(
+    item: CartItemUpdate,
+    product_id: int = Path(ge=1, le=SQLITE_INTEGER_MAX),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with write_connection() as db:
+        await update_cart_item(db, current_user["id"], product_id, item.quantity)
+        return cart_response(await get_cart_items(db, current_user["id"]))
+
+@router.delete("/cart/items/{product_id}", response_model=Cart)
+async def api_remove_from_cart(
+    product_id: int = Path(ge=1, le=SQLITE_INTEGER_MAX),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with write_connection() as db:
+        await remove_from_cart(db, current_user["id"], product_id)
+        return cart_response(await get_cart_items(db, current_user["id"]))
+
+@router.post("/cart/checkout", response_model=OrderCreated, status_code=201)
+async def api_checkout(current_user: dict = Depends(get_current_active_user)):
+    try:
+        async with write_connection() as db:
+            order_id, cart_items = await checkout_cart(db, current_user["id"])
+    except InsufficientStockError as e:
+        raise HTTPException(status_code=409, detail=f"Недостаточно товара '{e.product_name}' в наличии")
+    if order_id is None:
+        raise HTTPException(status_code=400, detail="Корзина пуста")
+
+    invalidate_products(item["product_id"] for item in cart_items)
+    wake_jobs()
+    return {"order_id": order_id, "total": sum(item["price"] * item["quantity"] for item in cart_items)}
+
+@router.get("/orders", response_model=OrderPage)
+async def api_list_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_PAGE_MAX),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with read_connection() as db:
+        try:
+            orders, next_cursor, prev_cursor = await get_orders_page(
+                db, current_user["id"], limit=limit, page_cursor=cursor
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": orders, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+@router.post("/orders/{order_id}/reorder", response_model=Cart)
+async def api_reorder(
+    order_id: int = Path(ge=1, le=SQLITE_INTEGER_MAX),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with write_connection() as db:
+        if not await order_exists(db, current_user["id"], order_id):
+            raise HTTPException(status_code=404, detail="Order not found")
+        await reorder(db, current_user["id"], order_id)
+        return cart_response(await get_cart_items(db, current_user["id"]))
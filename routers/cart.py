@@ -1,20 +1,23 @@
+import re
+
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-import aiosqlite
 
+from cache import invalidate_products
+from jobs import wake_jobs
+from templating import templates
+from database import read_connection, write_connection
 from auth import get_current_active_user
+from schemas import CART_QUANTITY_MAX
 
 router = APIRouter(prefix="/cart", tags=["cart"])
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/", response_class=HTMLResponse)
 async def view_cart(
     request: Request,
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
+    async with read_connection() as db:
         cart_items = await get_cart_items(db, current_user["id"])
         
         total = sum(item["price"] * item["quantity"] for item in cart_items)
@@ -38,10 +41,10 @@ async def add_to_cart(
     form_data = await request.form()
     quantity = int(form_data.get("quantity", 1))
     
-    async with aiosqlite.connect("construction_store.db") as db:
+    async with write_connection() as db:
         # Check if product exists
         product = await get_product(db, product_id)
-        if not product:
+        if not product or not product["is_active"]:
             raise HTTPException(status_code=404, detail="Product not found")
         
         # Add to cart
@@ -49,6 +52,74 @@ async def add_to_cart(
     
     return RedirectResponse(url="/cart/", status_code=303)
 
+# Строка списка материалов: "название или артикул [; x -] количество [шт]"
+MATERIALS_LINE_RE = re.compile(r"^(?P<key>.+?)(?:\s*[;,\t]\s*|\s+[×xх*-]?\s*)(?P<quantity>\d+)\s*(?:шт\.?|pcs)?$", re.I)
+MATERIALS_LIST_MAX_LINES = 200
+# Артикул длиннее не поместится в целое SQLite (19 знаков - уже не всякое число)
+PRODUCT_ID_MAX_DIGITS = 18
+
+def is_product_id(key: str) -> bool:
+    # isdigit() пропускает "²" и другие символы, которые int() не принимает
+    return key.isascii() and key.isdecimal()
+
+def parse_materials_list(text: str):
+    """Quantities by name or id, plus lines with an impossible id or quantity."""
+    wanted = {}
+    invalid = []
+    for line in text.splitlines()[:MATERIALS_LIST_MAX_LINES]:
+        line = line.strip().lstrip("#")
+        if not line:
+            continue
+        match = MATERIALS_LINE_RE.match(line)
+        key, quantity = (match.group("key").strip(), match.group("quantity")) if match else (line, "1")
+        # Длина проверяется до int(): огромное число дало бы ошибку SQLite или int()
+        if len(quantity) > len(str(CART_QUANTITY_MAX)) or int(quantity) > CART_QUANTITY_MAX \
+                or (is_product_id(key) and len(key) > PRODUCT_ID_MAX_DIGITS):
+            invalid.append(line)
+            continue
+        if int(quantity) > 0:
+            wanted[key] = wanted.get(key, 0) + int(quantity)
+    return wanted, invalid
+
+@router.post("/bulk-add", response_class=HTMLResponse)
+async def bulk_add_to_cart(
+    request: Request,
+    current_user: dict = Depends(get_current_active_user)
+):
+    form_data = await request.form()
+    wanted, invalid = parse_materials_list(form_data.get("items", ""))
+    
+    async with write_connection() as db:
+        products = await get_products_for_list(
+            db,
+            ids=[int(key) for key in wanted if is_product_id(key)],
+            names=[key for key in wanted if not is_product_id(key)]
+        )
+        quantities = {}
+        found = set()
+        for product in products:
+            for key in (str(product["id"]), product["name"]):
+                if key in wanted and key not in found:
+                    found.add(key)
+                    quantities[product["id"]] = quantities.get(product["id"], 0) + wanted[key]
+        if quantities:
+            await add_many_to_cart(db, current_user["id"], list(quantities.items()))
+        cart_items = await get_cart_items(db, current_user["id"])
+    
+    # Строки с невозможным артикулом или количеством показываются вместе с ненайденными
+    missing = invalid + [key for key in wanted if key not in found]
+    context = {
+        "request": request,
+        "cart_items": cart_items,
+        "total": sum(item["price"] * item["quantity"] for item in cart_items),
+        "current_user": current_user,
+        "cart_count": sum(item["quantity"] for item in cart_items),
+        "message": f"Добавлено позиций: {len(quantities)}" if quantities else None,
+        "error": f"Не найдены товары: {', '.join(missing)}" if missing else None,
+        "materials_list": "\n".join(missing)
+    }
+    return templates.TemplateResponse("cart.html", context)
+
 @router.post("/update/{product_id}")
 async def update_cart_item(
     product_id: int,
@@ -58,7 +129,7 @@ async def update_cart_item(
     form_data = await request.form()
     quantity = int(form_data.get("quantity", 1))
     
-    async with aiosqlite.connect("construction_store.db") as db:
+    async with write_connection() as db:
         await update_cart_item(db, current_user["id"], product_id, quantity)
     
     return RedirectResponse(url="/cart/", status_code=303)
@@ -68,7 +139,7 @@ async def remove_from_cart(
     product_id: int,
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
+    async with write_connection() as db:
         await remove_from_cart(db, current_user["id"], product_id)
     
     return RedirectResponse(url="/cart/", status_code=303)
@@ -77,7 +148,7 @@ async def remove_from_cart(
 async def clear_cart(
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
+    async with write_connection() as db:
         await clear_cart(db, current_user["id"])
     
     return RedirectResponse(url="/cart/", status_code=303)
@@ -87,51 +158,35 @@ async def checkout(
     request: Request,
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        
-        # Get cart items
-        cart_items = await get_cart_items(db, current_user["id"])
-        
-        if not cart_items:
-            context = {
-                "request": request,
-                "cart_items": [],
-                "total": 0,
-                "current_user": current_user,
-                "cart_count": getattr(request.state, 'cart_count', 0),
-                "error": "Корзина пуста"
-            }
-            return templates.TemplateResponse("cart.html", context)
-        
-        # Check stock availability
-        for item in cart_items:
-            if item["quantity"] > item["stock_quantity"]:
-                context = {
-                    "request": request,
-                    "cart_items": cart_items,
-                    "total": sum(item["price"] * item["quantity"] for item in cart_items),
-                    "current_user": current_user,
-                    "cart_count": getattr(request.state, 'cart_count', 0),
-                    "error": f"Недостаточно товара '{item['name']}' в наличии"
-                }
-                return templates.TemplateResponse("cart.html", context)
-        
-        # Create order
-        order_id = await create_order(db, current_user["id"], cart_items)
-        
-        # Update product stock
-        for item in cart_items:
-            new_stock = item["stock_quantity"] - item["quantity"]
-            await db.execute(
-                "UPDATE products SET stock_quantity = ? WHERE id = ?",
-                (new_stock, item["product_id"])
-            )
-        
-        # Clear cart
-        await clear_cart(db, current_user["id"])
-        
-        await db.commit()
+    try:
+        async with write_connection() as db:
+            order_id, cart_items = await checkout_cart(db, current_user["id"])
+    except InsufficientStockError as e:
+        async with read_connection() as db:
+            cart_items = await get_cart_items(db, current_user["id"])
+        context = {
+            "request": request,
+            "cart_items": cart_items,
+            "total": sum(item["price"] * item["quantity"] for item in cart_items),
+            "current_user": current_user,
+            "cart_count": getattr(request.state, 'cart_count', 0),
+            "error": f"Недостаточно товара '{e.product_name}' в наличии"
+        }
+        return templates.TemplateResponse("cart.html", context)
+    
+    if order_id is None:
+        context = {
+            "request": request,
+            "cart_items": [],
+            "total": 0,
+            "current_user": current_user,
+            "cart_count": getattr(request.state, 'cart_count', 0),
+            "error": "Корзина пуста"
+        }
+        return templates.TemplateResponse("cart.html", context)
+    
+    invalidate_products(item["product_id"] for item in cart_items)
+    wake_jobs()
     
     context = {
         "request": request,
@@ -144,4 +199,4 @@ async def checkout(
     return templates.TemplateResponse("cart.html", context)
 
 # Import functions from crud
-from crud import get_cart_items, add_to_cart, update_cart_item, remove_from_cart, clear_cart, create_order, get_product
\ No newline at end of file
+from crud import get_cart_items, add_to_cart, add_many_to_cart, get_products_for_list, update_cart_item, remove_from_cart, clear_cart, get_product, checkout_cart, InsufficientStockError
\ No newline at end of file
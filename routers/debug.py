@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import ORJSONResponse
+from typing import Optional
+
+import profiler
+from auth import get_current_admin_user
+
+# Подключается в main.py только при SQL_PROFILE=1
+router = APIRouter(prefix="/debug", tags=["debug"], default_response_class=ORJSONResponse)
+
+@router.get("/queries")
+async def debug_queries(
+    limit: int = Query(20, ge=1, le=max(profiler.SQL_PROFILE_HISTORY, 1)),
+    route: Optional[str] = None,
+    flagged: bool = False,
+    admin: dict = Depends(get_current_admin_user)
+):
+    # Новые запросы первыми; flagged - только с медленными запросами или циклами N+1
+    traces = [
+        trace for trace in reversed(profiler.recent_traces)
+        if (route is None or trace.route == route) and (trace.flagged or not flagged)
+    ]
+    return {
+        "slow_ms": profiler.SQL_SLOW_MS,
+        "repeat_threshold": profiler.SQL_REPEAT_THRESHOLD,
+        "requests": [trace.to_dict() for trace in traces[:limit]],
+    }
@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-import aiosqlite
 
 from schemas import FeedbackCreate
+from templating import templates
+from database import write_connection
+from crud import enqueue_job
+from jobs import wake_jobs
 from auth import get_current_active_user
 
 router = APIRouter(prefix="/feedback", tags=["feedback"])
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/", response_class=HTMLResponse)
 async def feedback_form(request: Request):
@@ -33,12 +34,16 @@ async def create_feedback_message(
     
     user_id = current_user["id"] if current_user else None
     
-    async with aiosqlite.connect("construction_store.db") as db:
-        await db.execute(
+    async with write_connection() as db:
+        async with db.execute(
             "INSERT INTO feedback (user_id, subject, message, email) VALUES (?, ?, ?, ?)",
             (user_id, feedback_data.subject, feedback_data.message, feedback_data.email)
-        )
+        ) as cursor:
+            feedback_id = cursor.lastrowid
+        # Уведомление администратору уходит в фоне, ответ не ждёт почтового сервера
+        await enqueue_job(db, "feedback_notification", {"feedback_id": feedback_id})
         await db.commit()
+    wake_jobs()
     
     context = {
         "request": request,
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.requests import Request
+from fastapi.responses import FileResponse
+
+import images
+from http_cache import IMMUTABLE_MAX_AGE
+from settings import STATIC_MAX_AGE
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+@router.get("/{width}/{path:path}", include_in_schema=False)
+async def read_image(width: int, path: str, request: Request):
+    # /images/320/images/hammer.jpg.webp - static/images/hammer.jpg шириной 320 px в WebP
+    source, _, fmt = path.rpartition(".")
+    try:
+        target = await images.get_variant(source, width, fmt)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Как и у /static: URL с отпечатком исходника никогда не меняется
+    if "v" in request.query_params:
+        cache_control = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        cache_control = f"public, max-age={STATIC_MAX_AGE}"
+    return FileResponse(target, media_type=images.IMAGE_FORMATS[fmt][0], headers={"Cache-Control": cache_control})
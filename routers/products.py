@@ -1,53 +1,104 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-import aiosqlite
+from typing import Optional
+from urllib.parse import urlencode
 
+from templating import templates
+from database import read_connection
 from auth import get_current_active_user
+from crud import (
+    get_products_page, get_product, get_category_counts, search_products, PRODUCT_SORTS, PRODUCTS_PAGE_SIZE, PRODUCTS_PAGE_MAX
+)
 
 router = APIRouter(prefix="/products", tags=["products"])
-templates = Jinja2Templates(directory="templates")
+
+SORT_LABELS = {
+    "newest": "Сначала новые",
+    "price_asc": "Сначала дешевле",
+    "price_desc": "Сначала дороже",
+    "name": "По названию",
+}
+
+def products_url(category: Optional[str], sort: str, limit: int, cursor: Optional[str] = None) -> str:
+    params = {
+        "category": category,
+        "sort": sort if sort != "newest" else None,
+        "limit": limit if limit != PRODUCTS_PAGE_SIZE else None,
+        "cursor": cursor,
+    }
+    query = urlencode({key: value for key, value in params.items() if value})
+    return f"/products/?{query}" if query else "/products/"
 
 @router.get("/", response_class=HTMLResponse)
 async def read_products(
     request: Request,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: str = Query(None),
+    limit: int = Query(PRODUCTS_PAGE_SIZE, ge=1, le=PRODUCTS_PAGE_MAX),
     category: str = Query(None),
+    sort: str = Query("newest"),
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
-        
-        if category:
-            products = await get_products(db, skip=skip, limit=limit, category=category)
-        else:
-            products = await get_products(db, skip=skip, limit=limit)
+    if sort not in PRODUCT_SORTS:
+        sort = "newest"
+    
+    async with read_connection() as db:
+        try:
+            products, next_cursor, prev_cursor = await get_products_page(
+                db, limit=limit, category=category, sort=sort, page_cursor=cursor
+            )
+        except ValueError:
+            # Некорректный курсор - показываем первую страницу
+            products, next_cursor, prev_cursor = await get_products_page(
+                db, limit=limit, category=category, sort=sort
+            )
         
-        # Get unique categories for filter
-        async with db.execute("SELECT DISTINCT category FROM products WHERE is_active = TRUE") as cursor:
-            categories = [row[0] for row in await cursor.fetchall()]
+        categories = await get_category_counts(db)
     
     context = {
         "request": request,
         "products": products,
         "categories": categories,
         "selected_category": category,
+        "sort": sort,
+        "sort_labels": SORT_LABELS,
+        "next_url": products_url(category, sort, limit, next_cursor) if next_cursor else None,
+        "prev_url": products_url(category, sort, limit, prev_cursor) if prev_cursor else None,
         "current_user": current_user,
         "cart_count": getattr(request.state, 'cart_count', 0)
     }
     
     return templates.TemplateResponse("products.html", context)
 
+@router.get("/search", response_class=HTMLResponse)
+async def search(
+    request: Request,
+    q: str = Query("", max_length=200),
+    current_user: dict = Depends(get_current_active_user)
+):
+    products, relaxed = [], False
+    if q.strip():
+        async with read_connection() as db:
+            products, relaxed = await search_products(db, q)
+    
+    context = {
+        "request": request,
+        "query": q,
+        "products": products,
+        "relaxed": relaxed,
+        "current_user": current_user,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    
+    return templates.TemplateResponse("search.html", context)
+
 @router.get("/{product_id}", response_class=HTMLResponse)
 async def read_product(
     request: Request,
     product_id: int,
     current_user: dict = Depends(get_current_active_user)
 ):
-    async with aiosqlite.connect("construction_store.db") as db:
-        db.row_factory = aiosqlite.Row
+    async with read_connection() as db:
         product = await get_product(db, product_id)
         
     if not product:
@@ -60,7 +111,4 @@ async def read_product(
         "cart_count": getattr(request.state, 'cart_count', 0)
     }
     
-    return templates.TemplateResponse("product_detail.html", context)
-
-# Import functions from crud
-from crud import get_products, get_product
\ No newline at end of file
+    return templates.TemplateResponse("product_detail.html", context)
\ No newline at end of file
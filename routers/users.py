@@ -1,17 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
-import aiosqlite
+import sqlite3
 from datetime import timedelta
+from typing import Optional
 
 from schemas import UserCreate
-from auth import authenticate_user, create_access_token, get_current_active_user, get_password_hash
-from database import get_db
-from crud import create_user as crud_create_user, get_user_by_username, get_user_by_email
+from auth import (
+    authenticate_user, create_access_token, get_current_active_user, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from templating import templates
+from database import read_connection, write_connection
+from crud import (
+    create_user as crud_create_user, get_user_by_username, get_user_by_email,
+    get_orders_page, order_exists, reorder, ORDERS_PAGE_SIZE, ORDERS_PAGE_MAX
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
-templates = Jinja2Templates(directory="templates")
 
 @router.get("/register", response_class=HTMLResponse)
 async def register_form(request: Request):
@@ -23,7 +28,7 @@ async def register_form(request: Request):
     return templates.TemplateResponse("register.html", context)
 
 @router.post("/register")
-async def register(request: Request, db: aiosqlite.Connection = Depends(get_db)):
+async def register(request: Request):
     form_data = await request.form()
     
     user_data = UserCreate(
@@ -33,8 +38,11 @@ async def register(request: Request, db: aiosqlite.Connection = Depends(get_db))
         password=form_data.get("password")
     )
     
+    async with read_connection() as db:
+        existing_user = await get_user_by_username(db, user_data.username)
+        existing_email = None if existing_user else await get_user_by_email(db, user_data.email)
+    
     # Check if username exists
-    existing_user = await get_user_by_username(db, user_data.username)
     if existing_user:
         context = {
             "request": request,
@@ -45,7 +53,6 @@ async def register(request: Request, db: aiosqlite.Connection = Depends(get_db))
         return templates.TemplateResponse("register.html", context)
     
     # Check if email exists
-    existing_email = await get_user_by_email(db, user_data.email)
     if existing_email:
         context = {
             "request": request,
@@ -55,10 +62,23 @@ async def register(request: Request, db: aiosqlite.Connection = Depends(get_db))
         }
         return templates.TemplateResponse("register.html", context)
     
-    user_id = await crud_create_user(db, user_data)
+    # Хеш вычисляется до записи, чтобы не держать блокировку записи десятки миллисекунд
+    hashed_password = await get_password_hash(user_data.password)
+    try:
+        async with write_connection() as db:
+            await crud_create_user(db, user_data, hashed_password)
+    except sqlite3.IntegrityError:
+        # Те же имя или email успели зарегистрировать между проверкой и записью
+        context = {
+            "request": request,
+            "current_user": getattr(request.state, 'current_user', None),
+            "cart_count": getattr(request.state, 'cart_count', 0),
+            "error": "Username or email already registered"
+        }
+        return templates.TemplateResponse("register.html", context)
     
     # Auto login after registration
-    access_token_expires = timedelta(minutes=30)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user_data.username}, expires_delta=access_token_expires
     )
@@ -92,7 +112,7 @@ async def login_for_access_token(request: Request):
         }
         return templates.TemplateResponse("login.html", context)
     
-    access_token_expires = timedelta(minutes=30)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["username"]}, expires_delta=access_token_expires
     )
@@ -114,6 +134,43 @@ async def read_users_me(
     }
     return templates.TemplateResponse("profile.html", context)
 
+@router.get("/orders", response_class=HTMLResponse)
+async def order_history(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(ORDERS_PAGE_SIZE, ge=1, le=ORDERS_PAGE_MAX),
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with read_connection() as db:
+        try:
+            orders, next_cursor, prev_cursor = await get_orders_page(
+                db, current_user["id"], limit=limit, page_cursor=cursor
+            )
+        except ValueError:
+            orders, next_cursor, prev_cursor = await get_orders_page(db, current_user["id"], limit=limit)
+    
+    suffix = f"&limit={limit}" if limit != ORDERS_PAGE_SIZE else ""
+    context = {
+        "request": request,
+        "orders": orders,
+        "next_url": f"/users/orders?cursor={next_cursor}{suffix}" if next_cursor else None,
+        "prev_url": f"/users/orders?cursor={prev_cursor}{suffix}" if prev_cursor else None,
+        "current_user": current_user,
+        "cart_count": getattr(request.state, 'cart_count', 0)
+    }
+    return templates.TemplateResponse("orders.html", context)
+
+@router.post("/orders/{order_id}/reorder")
+async def reorder_order(
+    order_id: int,
+    current_user: dict = Depends(get_current_active_user)
+):
+    async with write_connection() as db:
+        if not await order_exists(db, current_user["id"], order_id):
+            raise HTTPException(status_code=404, detail="Order not found")
+        await reorder(db, current_user["id"], order_id)
+    return RedirectResponse(url="/cart/", status_code=303)
+
 @router.get("/logout")
 async def logout():
     response = RedirectResponse(url="/", status_code=303)
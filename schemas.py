@@ -1,7 +1,12 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import List, Optional
 from datetime import datetime
 
+# Границы целого SQLite: большее число не передать параметром запроса (OverflowError)
+SQLITE_INTEGER_MIN, SQLITE_INTEGER_MAX = -2**63, 2**63 - 1
+# Наибольшее количество одного товара в корзине
+CART_QUANTITY_MAX = 100000
+
 class UserBase(BaseModel):
     email: str
     username: str
@@ -25,9 +30,34 @@ class ProductBase(BaseModel):
     price: float
     category: str
     image_url: Optional[str] = None
+    sku: Optional[str] = None
 
 class ProductCreate(ProductBase):
-    stock_quantity: int = 0
+    # Используется формой админки и импортом прайс-листов, поэтому проверки строже
+    name: str = Field(min_length=1, max_length=200)
+    price: float = Field(ge=0)
+    category: str = Field(min_length=1, max_length=100)
+    sku: Optional[str] = Field(None, max_length=64)
+    stock_quantity: int = Field(0, ge=0)
+    is_active: bool = True
+    
+    class Config:
+        str_strip_whitespace = True
+    
+    @field_validator("price", mode="before")
+    @classmethod
+    def decimal_comma(cls, value):
+        # Прайс-листы из Excel приходят с запятой: "1 250,50"
+        if isinstance(value, str):
+            return value.replace(",", ".").replace(" ", "").replace("\xa0", "")
+        return value
+    
+    @field_validator("sku", "description", "image_url", mode="before")
+    @classmethod
+    def empty_to_none(cls, value):
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
 
 class Product(ProductBase):
     id: int
@@ -38,6 +68,74 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+# Ответы JSON API (/api/v1)
+class ProductCard(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    price: float
+    category: str
+    image_url: Optional[str] = None
+    stock_quantity: int
+
+class ProductPage(BaseModel):
+    items: List[ProductCard]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+class ProductSearchResult(ProductCard):
+    snippet: str
+
+class ProductSearch(BaseModel):
+    query: str
+    relaxed: bool
+    items: List[ProductSearchResult]
+
+class CartItemCreate(BaseModel):
+    product_id: int = Field(ge=1, le=SQLITE_INTEGER_MAX)
+    quantity: int = Field(1, gt=0, le=CART_QUANTITY_MAX)
+
+class CartItemUpdate(BaseModel):
+    # 0 и меньше убирает товар из корзины
+    quantity: int = Field(le=CART_QUANTITY_MAX)
+
+class CartItem(BaseModel):
+    product_id: int
+    name: str
+    price: float
+    image_url: Optional[str] = None
+    quantity: int
+    stock_quantity: int
+
+class Cart(BaseModel):
+    items: List[CartItem]
+    total: float
+    count: int
+
+class OrderCreated(BaseModel):
+    order_id: int
+    total: float
+
+class OrderItem(BaseModel):
+    product_id: int
+    name: Optional[str] = None
+    image_url: Optional[str] = None
+    quantity: int
+    price: float
+    is_active: bool
+
+class Order(BaseModel):
+    id: int
+    total_amount: float
+    status: str
+    created_at: datetime
+    items: List[OrderItem]
+
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
 class FeedbackBase(BaseModel):
     subject: str
     message: str
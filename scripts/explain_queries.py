@@ -0,0 +1,291 @@
+import argparse
+import ast
+import asyncio
+import glob
+import importlib
+import os
+import re
+import sqlite3
+import sys
+from functools import partial
+
+import crud
+from schemas import ProductCreate
+from settings import DATABASE_URL
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = ["crud.py", "product_io.py", "main.py", "auth.py", "routers/*.py"]
+EXECUTE_METHODS = {"execute", "executemany", "execute_fetchall", "execute_insert"}
+STATEMENT_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|REPLACE)\b", re.I)
+READ_RE = re.compile(r"^\s*(SELECT|WITH|PRAGMA)\b", re.I)
+TABLE_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.I)
+SCAN_RE = re.compile(r"^SCAN (\w+)$")
+SQL_KEYWORDS = {"WHERE", "JOIN", "LEFT", "INNER", "ON", "SET", "ORDER", "GROUP", "LIMIT", "VALUES", "SELECT"}
+
+def resolve_sql(node, module, assigned) -> list:
+    """Possible SQL strings of an execute() argument; empty if it is built at run time."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.Name):
+        if node.id in assigned:
+            return resolve_sql(assigned[node.id], module, {})
+        value = getattr(module, node.id, None)
+        return [value] if isinstance(value, str) else []
+    if isinstance(node, ast.IfExp):
+        # sql = PRODUCT_UPSERT if ... else PRODUCT_INSERT_NEW - проверяются обе ветки
+        body, orelse = resolve_sql(node.body, module, assigned), resolve_sql(node.orelse, module, assigned)
+        return body + orelse if body and orelse else []
+    return []
+
+def collect_statements():
+    """SQL literals and module constants passed to execute(); call sites built at run time are returned apart."""
+    statements = []
+    dynamic = []
+    seen = set()
+    for pattern in SOURCES:
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+            rel = os.path.relpath(path, ROOT)
+            # Константы вроде PRODUCT_UPSERT собираются выражениями: их значения берутся из модуля
+            module = importlib.import_module(rel[:-3].replace(os.sep, "."))
+            with open(path, encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+            # Сначала вложенные функции, модуль последним: вызов относится к ближайшей функции и её присваиваниям
+            scopes = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            for scope in scopes[::-1] + [tree]:
+                assigned = {}
+                if scope is not tree:
+                    for node in ast.walk(scope):
+                        if isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                                and isinstance(node.targets[0], ast.Name):
+                            assigned[node.targets[0].id] = node.value
+                for node in ast.walk(scope):
+                    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                            and node.func.attr in EXECUTE_METHODS and node.args):
+                        continue
+                    location = f"{rel}:{node.lineno}"
+                    if location in seen:
+                        continue
+                    seen.add(location)
+                    sqls = resolve_sql(node.args[0], module, assigned)
+                    if not sqls:
+                        dynamic.append(location)
+                    for sql in sqls:
+                        if STATEMENT_RE.match(sql):
+                            statements.append((rel, node.lineno, location, sql, None))
+    statements.sort(key=lambda statement: statement[:2])
+    return [(location, sql, params) for _, _, location, sql, params in statements], dynamic
+
+class RecordedCursor:
+    # Ответ db.execute(): ожидается через await или используется в async with, как у aiosqlite
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.rowcount = cursor.rowcount if cursor is not None else 0
+        self.lastrowid = None
+
+    def __await__(self):
+        async def itself():
+            return self
+        return itself().__await__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    async def fetchone(self):
+        return self.cursor.fetchone() if self.cursor is not None else None
+
+    async def fetchmany(self, size: int = 1):
+        return self.cursor.fetchmany(size) if self.cursor is not None else []
+
+    async def fetchall(self):
+        return self.cursor.fetchall() if self.cursor is not None else []
+
+class RecordingConnection:
+    """Stands in for the aiosqlite connection in crud functions: runs reads on the read-only database,
+    records every statement with its parameters and call site, and never writes."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.statements = []
+
+    def _record(self, sql: str, params) -> RecordedCursor:
+        # Место вызова - первая строка кода приложения в стеке, как в collect_statements()
+        frame = sys._getframe(2)
+        while frame is not None and (not frame.f_code.co_filename.startswith(ROOT + os.sep)
+                                     or frame.f_code.co_filename == os.path.abspath(__file__)):
+            frame = frame.f_back
+        location = f"{os.path.relpath(frame.f_code.co_filename, ROOT)}:{frame.f_lineno}" if frame else "?"
+        self.statements.append((location, sql, tuple(params)))
+        # Чтения выполняются по-настоящему: от найденных строк зависят следующие запросы функции
+        return RecordedCursor(self.conn.execute(sql, params) if READ_RE.match(sql) else None)
+
+    def execute(self, sql: str, params=()):
+        return self._record(sql, params)
+
+    def executemany(self, sql: str, rows):
+        rows = list(rows)
+        return self._record(sql, rows[0] if rows else ())
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+def sample_calls(conn: sqlite3.Connection):
+    """Representative calls of the crud functions that build SQL at run time: every filter and both cursor directions."""
+    def one(sql, default):
+        row = conn.execute(sql).fetchone()
+        return row[0] if row and row[0] is not None else default
+
+    category = one("SELECT category FROM products WHERE is_active = TRUE LIMIT 1", "Инструменты")
+    product_id = one("SELECT id FROM products ORDER BY id LIMIT 1", 1)
+    name = one("SELECT name FROM products ORDER BY id LIMIT 1", "Молоток")
+    sku = one("SELECT sku FROM products WHERE sku IS NOT NULL LIMIT 1", "SKU-000001")
+    user_id = one("SELECT user_id FROM orders ORDER BY id DESC LIMIT 1", 1)
+    word = (crud.search_terms(name) or ["молоток"])[0]
+    # Курсоры собираются из условной строки: план запроса со страницы N не зависит от данных
+    row = {"id": product_id, "price": 100.0, "name": name, "created_at": "2024-01-01 00:00:00"}
+    product = ProductCreate(sku=sku, name=name, price=100, category=category, stock_quantity=10)
+
+    calls = [("first page", partial(crud.get_products_page)),
+             ("category", partial(crud.get_products_page, category=category))]
+    for sort in crud.PRODUCT_SORTS:
+        for direction in ("next", "prev"):
+            cursor = crud.encode_cursor(sort, direction, row)
+            calls.append((f"sort={sort} {direction}", partial(crud.get_products_page, sort=sort, page_cursor=cursor)))
+            calls.append((f"category sort={sort} {direction}",
+                          partial(crud.get_products_page, category=category, sort=sort, page_cursor=cursor)))
+    calls += [
+        ("search", partial(crud.search_products, text=name)),
+        # Без точных совпадений поиск повторяется с усечёнными словами
+        ("relaxed search", partial(crud.search_products, text=word + "ыыы")),
+        ("materials list", partial(crud.get_products_for_list, ids=[product_id], names=[name])),
+        ("update", partial(crud.update_product, product_id=product_id, product=product)),
+        ("low stock", partial(crud.get_low_stock_among, product_ids=[product_id])),
+        ("orders", partial(crud.get_orders_page, user_id=user_id)),
+    ]
+    for direction in ("next", "prev"):
+        cursor = crud.encode_recent_cursor(direction, row)
+        calls += [
+            (f"orders {direction}", partial(crud.get_orders_page, user_id=user_id, page_cursor=cursor)),
+            (f"users {direction}", partial(crud.get_users_page, page_cursor=cursor)),
+            (f"feedback {direction}", partial(crud.get_feedback_page, page_cursor=cursor)),
+            (f"admin products {direction}", partial(crud.get_admin_products_page, page_cursor=cursor)),
+        ]
+    calls += [
+        ("users filters", partial(crud.get_users_page, is_active=True, is_superuser=False,
+                                  date_from="2024-01-01", date_to="2024-12-31")),
+        ("users search", partial(crud.get_users_page, search="user12")),
+        ("users short search", partial(crud.get_users_page, search="us")),
+        ("feedback filters", partial(crud.get_feedback_page, is_read=False, date_from="2024-01-01")),
+        ("feedback search", partial(crud.get_feedback_page, search="заказ")),
+        ("admin products filters", partial(crud.get_admin_products_page, is_active=True, category=category)),
+        ("admin products search", partial(crud.get_admin_products_page, search=word)),
+        ("admin products sku", partial(crud.get_admin_products_page, search=sku)),
+        ("database info", partial(crud.get_database_info)),
+    ]
+    return calls
+
+def record_samples(conn: sqlite3.Connection):
+    async def run():
+        recorded = []
+        for label, call in sample_calls(conn):
+            db = RecordingConnection(conn)
+            await call(db)
+            recorded += [(f"{location} [{label}]", sql, params) for location, sql, params in db.statements]
+        return recorded
+    conn.row_factory = sqlite3.Row
+    crud.catalog_cache.clear()
+    try:
+        return asyncio.run(run())
+    finally:
+        conn.row_factory = None
+
+def count_parameters(sql):
+    # '?' внутри строковых литералов не является параметром
+    return re.sub(r"'[^']*'", "", sql).count("?")
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in TABLE_RE.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+def table_rows(conn, table, cache):
+    if table not in cache:
+        cache[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    return cache[table]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Dump EXPLAIN QUERY PLAN for every SQL statement in crud.py, product_io.py and the routers"
+    )
+    parser.add_argument("--db", default=DATABASE_URL)
+    parser.add_argument("--max-rows", type=int, default=1000,
+                        help="fail on a full table scan of a table with more rows than this")
+    parser.add_argument("--quiet", action="store_true", help="print only failures")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    statements, dynamic = collect_statements()
+    # Запросы, собираемые во время выполнения, проверяются по вызовам функций с типичными аргументами
+    recorded = record_samples(conn)
+    covered = {location.split(" ")[0] for location, _, _ in recorded}
+    recorded = [statement for statement in recorded if STATEMENT_RE.match(statement[1])]
+    statements += recorded
+    row_counts = {}
+    failures = []
+
+    for location, sql, params in statements:
+        one_line = " ".join(sql.split())
+        try:
+            if params is None:
+                params = (None,) * count_parameters(sql)
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except sqlite3.Error as e:
+            failures.append((location, one_line, f"error: {e}"))
+            continue
+
+        aliases = table_aliases(sql)
+        if not args.quiet:
+            print(f"{location}: {one_line}")
+            for row in plan:
+                print(f"    {row[3]}")
+        for row in plan:
+            match = SCAN_RE.match(row[3])
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            rows = table_rows(conn, table, row_counts)
+            if rows > args.max_rows:
+                failures.append((location, one_line, f"full scan of {table} ({rows} rows)"))
+
+    # Новый динамический запрос без образца в sample_calls не должен остаться непроверенным
+    for location in dynamic:
+        if location not in covered:
+            failures.append((location, "", "built at run time and not covered by sample_calls()"))
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) failed the plan check:")
+        for location, sql, reason in failures:
+            print(f"  {location}: {reason}\n    {sql}")
+        sys.exit(1)
+    print(f"\nChecked {len(statements)} statements ({len(recorded)} from sample calls), "
+          f"no full scans over {args.max_rows} rows")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import database
+from auth import get_password_hash
+from migrations import MIGRATIONS
+
+# Пароль всех сгенерированных пользователей; под ним входит benchmarks/load_test.py
+LOAD_TEST_PASSWORD = "loadtest123"
+USERNAME_PREFIX = "user"
+
+# Категория: (виды товаров, базовая цена, картинка, доля в каталоге)
+CATALOG = {
+    "Инструменты": (["Молоток", "Уровень", "Рулетка", "Ножовка", "Стамеска", "Шпатель"], 15, "hammer.jpg", 12),
+    "Электроинструменты": (["Шуруповерт", "Перфоратор", "Дрель", "Болгарка", "Лобзик", "Фрезер"], 120, "perforator.jpg", 8),
+    "Строительные материалы": (["Цемент", "Кирпич", "Газобетон", "Штукатурка", "Смесь кладочная", "Пескобетон"], 6, "cement.jpg", 20),
+    "Пиломатериалы": (["Доска обрезная", "Брус", "Фанера", "Плита ОСБ", "Вагонка", "Рейка"], 8, "board.jpg", 10),
+    "Отделочные материалы": (["Краска", "Плитка", "Ламинат", "Обои", "Грунтовка", "Затирка"], 20, "paint.jpg", 18),
+    "Сантехника": (["Смеситель", "Труба ПП", "Фитинг", "Сифон", "Кран шаровой", "Унитаз"], 30, "tile.jpg", 10),
+    "Электрика": (["Кабель ВВГ", "Розетка", "Выключатель", "Автомат", "Щиток", "Светильник"], 12, "screwdriver.jpg", 10),
+    "Крепёж": (["Саморез", "Дюбель", "Анкер", "Болт", "Гвоздь", "Шуруп"], 2, "brick.jpg", 12),
+}
+BRANDS = ["Зубр", "Makita", "Bosch", "Kraftool", "Stayer", "Knauf", "Ceresit", "Tikkurila",
+          "Wavin", "Legrand", "Fischer", "Интерскол", "Волма", "Кедр"]
+FEATURES = ["для внутренних работ", "для наружных работ", "повышенной прочности", "влагостойкий",
+            "профессиональная серия", "в упаковке", "с гарантией 2 года", "морозостойкий",
+            "для ремонта квартиры", "для загородного дома", "сертифицирован по ГОСТ"]
+FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Сергей", "Андрей", "Мария", "Анна", "Ольга", "Елена", "Дмитрий"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Новиков"]
+SUBJECTS = ["Вопрос о доставке", "Наличие товара", "Оптовый заказ", "Возврат", "Счёт для юрлица", "Качество товара"]
+
+# То, что при обычной работе поддерживают триггеры: шаги миграций, которые
+# заполняют поисковые индексы и сводки по уже существующим строкам
+REBUILD_STEPS = [
+    step for _, _, steps in MIGRATIONS for step in steps
+    if isinstance(step, str) and step.lstrip().startswith(("INSERT INTO products_fts", "INSERT INTO users_fts",
+                                                          "INSERT INTO feedback_fts", "INSERT OR REPLACE"))
+]
+BATCH_SIZE = 50_000
+
+def timestamps(rng: random.Random, count: int, days: int):
+    # Строки создаются по порядку id: время растёт вместе с id, как при настоящей работе
+    start = datetime.now() - timedelta(days=days)
+    step = days * 86400 / max(count, 1)
+    for i in range(count):
+        yield (start + timedelta(seconds=i * step + rng.random() * step)).strftime("%Y-%m-%d %H:%M:%S")
+
+def insert(conn: sqlite3.Connection, sql: str, rows, label: str):
+    started = time.perf_counter()
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    conn.executemany(sql, batch)
+    count += len(batch)
+    print(f"  {label}: {count} rows in {time.perf_counter() - started:.1f}s")
+    return count
+
+def product_rows(rng: random.Random, count: int, first_id: int, prices: list):
+    categories = list(CATALOG)
+    weights = [CATALOG[category][3] for category in categories]
+    for i, created_at in enumerate(timestamps(rng, count, 3 * 365)):
+        category = rng.choices(categories, weights)[0]
+        kinds, base_price, image, _ = CATALOG[category]
+        kind = rng.choice(kinds)
+        brand = rng.choice(BRANDS)
+        price = round(base_price * rng.lognormvariate(0, 0.8), 2) or 0.01
+        prices.append(price)
+        yield (
+            first_id + i, f"GEN-{i:07d}", f"{kind} {brand} {rng.choice('ABCDEKMPTX')}{rng.randint(10, 999)}",
+            f"{kind} {brand}: {', '.join(rng.sample(FEATURES, 3))}.", price, category,
+            f"/static/images/{image}", 0 if rng.random() < 0.08 else rng.randint(1, 1000),
+            rng.random() > 0.03, created_at
+        )
+
+def user_rows(rng: random.Random, count: int, hashed_password: str):
+    for i, created_at in enumerate(timestamps(rng, count, 3 * 365)):
+        yield (
+            f"{USERNAME_PREFIX}{i}", f"{USERNAME_PREFIX}{i}@example.com", hashed_password,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.random() > 0.05, created_at
+        )
+
+def insert_orders(conn: sqlite3.Connection, rng: random.Random, count: int, users: list, prices: list,
+                  first_product_id: int):
+    # Заказы и их позиции пишутся одинаковыми пачками, чтобы миллионы позиций не копились в памяти.
+    # Десятая часть пользователей - постоянные подрядчики, на них приходится половина заказов
+    started = time.perf_counter()
+    regulars = users[::10]
+    order_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders").fetchone()[0]
+    orders, items = [], []
+    total_items = 0
+    for i, created_at in enumerate(timestamps(rng, count, 2 * 365), 1):
+        order_id += 1
+        user_id = (rng.choice(regulars) if rng.random() < 0.5 else rng.choice(users))[0]
+        total = 0
+        for product in rng.sample(range(len(prices)), rng.randint(1, 5)):
+            quantity = rng.randint(1, 20)
+            items.append((order_id, first_product_id + product, quantity, prices[product]))
+            total += quantity * prices[product]
+        orders.append((order_id, user_id, round(total, 2), created_at))
+        if len(orders) == BATCH_SIZE or i == count:
+            conn.executemany("INSERT INTO orders (id, user_id, total_amount, created_at) VALUES (?, ?, ?, ?)", orders)
+            conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                             items)
+            total_items += len(items)
+            orders, items = [], []
+    print(f"  orders: {count} rows, order_items: {total_items} rows in {time.perf_counter() - started:.1f}s")
+
+def cart_rows(rng: random.Random, count: int, users: list, products: int, first_product_id: int):
+    # UNIQUE(user_id, product_id): у пользователя каждый товар в корзине один раз
+    for user_id, _ in rng.sample(users, min(count, len(users))):
+        for product in rng.sample(range(products), rng.randint(1, 8)):
+            yield user_id, first_product_id + product, rng.randint(1, 10)
+
+def feedback_rows(rng: random.Random, count: int, users: list):
+    for created_at in timestamps(rng, count, 2 * 365):
+        user_id, email = rng.choice(users) if users and rng.random() < 0.7 else (None, None)
+        yield (
+            user_id, rng.choice(SUBJECTS), "Здравствуйте! " + " ".join(rng.sample(FEATURES, 4)),
+            email or f"guest{rng.randint(1, 10**6)}@example.com", rng.random() < 0.8, created_at
+        )
+
+def generate(path: str, args, hashed_password: str):
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    # Файл создаётся с нуля: журнал и fsync не нужны, при сбое его проще создать заново
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    # Триггеры и вторичные индексы снимаются на время загрузки: индекс, построенный
+    # одной сортировкой, быстрее миллионов вставок в B-дерево, а поисковые индексы
+    # и сводки потом пересчитываются шагами миграций целиком
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    conn.execute("BEGIN")
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER "{name}"')
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+
+    print(f"Generating into {path}")
+    first_product_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM products").fetchone()[0]
+    prices = []
+    insert(conn, "INSERT INTO products (id, sku, name, description, price, category, image_url, stock_quantity, "
+                 "is_active, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+           product_rows(rng, args.products, first_product_id, prices), "products")
+    insert(conn, "INSERT INTO users (username, email, hashed_password, full_name, is_active, created_at) "
+                 "VALUES (?, ?, ?, ?, ?, ?)",
+           user_rows(rng, args.users, hashed_password), "users")
+    users = conn.execute(
+        "SELECT id, email FROM users WHERE username LIKE ? AND is_active ORDER BY id", (f"{USERNAME_PREFIX}%",)
+    ).fetchall()
+    if users and prices:
+        insert_orders(conn, rng, args.orders, users, prices, first_product_id)
+        insert(conn, "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+               cart_rows(rng, args.carts, users, len(prices), first_product_id), "cart")
+    insert(conn, "INSERT INTO feedback (user_id, subject, message, email, is_read, created_at) "
+                 "VALUES (?, ?, ?, ?, ?, ?)",
+           feedback_rows(rng, args.feedback, users), "feedback")
+
+    started = time.perf_counter()
+    for _, sql in indexes:
+        conn.execute(sql)
+    print(f"  indexes: {len(indexes)} in {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    for step in REBUILD_STEPS:
+        conn.execute(step)
+    for _, sql in triggers:
+        conn.execute(sql)
+    print(f"  search indexes and rollups in {time.perf_counter() - started:.1f}s")
+    conn.execute("COMMIT")
+
+    started = time.perf_counter()
+    conn.execute(f"PRAGMA analysis_limit={args.analysis_limit}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    print(f"  ANALYZE in {time.perf_counter() - started:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a production-sized store database for load testing")
+    parser.add_argument("--db", default="scale_test.db", help="target file; must not exist unless --force")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--orders", type=int, default=2_000_000, help="1-5 items each")
+    parser.add_argument("--carts", type=int, default=50_000, help="users with a non-empty cart")
+    parser.add_argument("--feedback", type=int, default=100_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply all row counts, e.g. 0.01 for a quick run")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--analysis-limit", type=int, default=1000)
+    parser.add_argument("--force", action="store_true", help="overwrite an existing file")
+    args = parser.parse_args()
+    for name in ("products", "users", "orders", "carts", "feedback"):
+        setattr(args, name, int(getattr(args, name) * args.scale))
+
+    # Генерация дописывает строки в свежую схему; рабочая БД не должна попасть под неё случайно
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f"{args.db} already exists, pass --force to overwrite it")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    async def prepare():
+        # Схема, миграции и администратор - как при первом запуске приложения
+        database.DATABASE_URL = args.db
+        await database.init_db()
+        return await get_password_hash(LOAD_TEST_PASSWORD)
+
+    started = time.perf_counter()
+    hashed_password = asyncio.run(prepare())
+    try:
+        generate(args.db, args, hashed_password)
+    except BaseException:
+        os.remove(args.db)
+        raise
+    size = os.path.getsize(args.db)
+    print(f"Done in {time.perf_counter() - started:.1f}s, {size / 2**20:.0f} MiB; "
+          f"users {USERNAME_PREFIX}0..{USERNAME_PREFIX}{args.users - 1} log in with '{LOAD_TEST_PASSWORD}'")
+
+if __name__ == "__main__":
+    main()
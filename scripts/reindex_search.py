@@ -0,0 +1,24 @@
+import argparse
+import sqlite3
+import time
+
+from settings import DATABASE_URL
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the products_fts full-text index from the products table")
+    parser.add_argument("--db", default=DATABASE_URL)
+    parser.add_argument("--optimize", action="store_true", help="merge index segments after the rebuild")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    started = time.perf_counter()
+    conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    if args.optimize:
+        conn.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+    conn.commit()
+    count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    conn.close()
+    print(f"Reindexed {count} products in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
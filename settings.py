@@ -0,0 +1,107 @@
+import os
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Переменные окружения важнее файла .env; .env удобен для разработки и одного сервера
+load_dotenv(os.path.join(ROOT, ".env"), override=False)
+
+# Сервер
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Каждый процесс держит свой пул соединений, кеши и обработчик фоновых задач
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# База данных
+DATABASE_URL = os.getenv("DATABASE_URL", "construction_store.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Групповая фиксация записей: не больше блоков в одной транзакции и не дольше задержки
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "64"))
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "5"))
+
+# Обслуживание БД. Каждый процесс раз в MAINTENANCE_POLL_INTERVAL переносит WAL в файл БД
+# (checkpoint PASSIVE), не дожидаясь автоматического checkpoint внутри COMMIT; задачи по расписанию
+# выполняет один процесс. Нулевой интервал отключает задачу, из админки её можно запустить вручную
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "1") == "1"
+MAINTENANCE_POLL_INTERVAL = float(os.getenv("MAINTENANCE_POLL_INTERVAL", "5"))
+WAL_TRUNCATE_INTERVAL = float(os.getenv("WAL_TRUNCATE_INTERVAL", "3600"))
+# WAL больше порога обрезается checkpoint(TRUNCATE), не дожидаясь расписания
+WAL_TRUNCATE_SIZE_MB = float(os.getenv("WAL_TRUNCATE_SIZE_MB", "64"))
+ANALYZE_INTERVAL = float(os.getenv("ANALYZE_INTERVAL", "86400"))
+# Строк на индекс при ANALYZE: статистика приблизительная, зато запись не блокируется надолго
+ANALYZE_LIMIT = int(os.getenv("ANALYZE_LIMIT", "1000"))
+# Пустой BACKUP_DIR - каталог backups рядом с файлом БД
+BACKUP_DIR = os.getenv("BACKUP_DIR", "")
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", "86400"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# Копирование шагами по BACKUP_STEP_PAGES страниц с паузой между ними
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))
+BACKUP_STEP_PAUSE_MS = float(os.getenv("BACKUP_STEP_PAUSE_MS", "5"))
+
+# Токены входа; все процессы должны использовать один ключ
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# Хеширование паролей (стоимость подбирается с помощью benchmarks/password_hashing.py)
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "argon2")
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# По умолчанию ядра делятся между процессами, чтобы хеширование не вытесняло обработку запросов
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // WORKERS))))
+
+# Кеши процесса
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "2048"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "5"))
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "5000"))
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", "3600"))
+
+# HTTP: статика, шаблоны, сжатие
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+TEMPLATES_BYTECODE_DIR = os.getenv("TEMPLATES_BYTECODE_DIR", ".jinja_cache")
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Изображения товаров: уменьшенные копии в AVIF/WebP/JPEG создаются при сохранении товара
+# или первом запросе и хранятся на диске; каталог кеша можно удалить в любой момент
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", ".image_cache")
+# Ширины копий в пикселях - кандидаты srcset; другие размеры сервер не создаёт
+IMAGE_WIDTHS = [int(width) for width in os.getenv("IMAGE_WIDTHS", "160,320,480,640,960").split(",")]
+# Кодирование идёт в отдельных процессах; по умолчанию ядра делятся между воркерами
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(max(1, (os.cpu_count() or 1) // WORKERS))))
+
+# Фоновые задачи (число обработчиков - на каждый процесс)
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# Задачи других процессов и отложенные повторы подхватываются не позже этого интервала
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "60"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "600"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Почта
+SMTP_HOST = os.getenv("SMTP_HOST", "")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+MAIL_FROM = os.getenv("MAIL_FROM", "store@localhost")
+# Получатель уведомлений о новых отзывах и заканчивающихся товарах
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@store.com")
+
+# Метрики и профилирование
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Если задан, /metrics требует заголовок Authorization: Bearer <токен>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Профилирование SQL только по явному включению: на каждый запрос к БД заводится запись трассы
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+# Столько одинаковых запросов за один HTTP-запрос считаются циклом N+1
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "5"))
+SQL_PROFILE_HISTORY = int(os.getenv("SQL_PROFILE_HISTORY", "50"))
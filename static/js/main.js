@@ -10,29 +10,54 @@ document.addEventListener('DOMContentLoaded', function() {
         }, 5000);
     });
 
-    // Add to cart functionality (placeholder)
-    const addToCartButtons = document.querySelectorAll('.add-to-cart');
-    addToCartButtons.forEach(function(button) {
-        button.addEventListener('click', function() {
-            const productId = this.dataset.productId;
-            const productName = this.dataset.productName;
-            
-            // Show temporary feedback
-            const originalText = this.textContent;
-            this.textContent = 'Добавлено!';
-            this.classList.add('btn-success');
-            
-            setTimeout(() => {
-                this.textContent = originalText;
-                this.classList.remove('btn-success');
-            }, 2000);
-            
-            console.log(`Product ${productName} (ID: ${productId}) added to cart`);
+    // Cart changes go through the JSON API: one small request instead of a redirect and a page render.
+    // If the request fails the form is submitted the usual way.
+    document.querySelectorAll('form[data-api]').forEach(function(form) {
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            const productId = Number(this.dataset.productId);
+            const submitButton = this.querySelector('button[type="submit"]');
+            if (submitButton) {
+                submitButton.disabled = true;
+            }
+
+            let request;
+            if (this.dataset.api === 'cart-add') {
+                request = apiRequest('POST', '/api/v1/cart/items', {
+                    product_id: productId,
+                    quantity: Number(this.querySelector('[name="quantity"]').value)
+                });
+            } else if (this.dataset.api === 'cart-update') {
+                request = apiRequest('PUT', `/api/v1/cart/items/${productId}`, {
+                    quantity: Number(this.querySelector('[name="quantity"]').value)
+                });
+            } else {
+                request = apiRequest('DELETE', `/api/v1/cart/items/${productId}`);
+            }
+
+            request.then((cart) => {
+                updateCart(cart);
+                if (this.dataset.api === 'cart-add' && submitButton) {
+                    const originalText = submitButton.textContent;
+                    submitButton.textContent = 'Добавлено!';
+                    submitButton.classList.add('btn-success');
+                    setTimeout(() => {
+                        submitButton.textContent = originalText;
+                        submitButton.classList.remove('btn-success');
+                    }, 2000);
+                }
+            }).catch(() => {
+                this.submit();
+            }).finally(() => {
+                if (submitButton) {
+                    submitButton.disabled = false;
+                }
+            });
         });
     });
 
     // Form validation enhancement
-    const forms = document.querySelectorAll('form');
+    const forms = document.querySelectorAll('form:not([data-api])');
     forms.forEach(function(form) {
         form.addEventListener('submit', function(e) {
             const submitButton = this.querySelector('button[type="submit"]');
@@ -50,4 +75,62 @@ document.addEventListener('DOMContentLoaded', function() {
             this.form.submit();
         });
     }
-});
\ No newline at end of file
+
+    // Catalog sort selector
+    const sortFilter = document.getElementById('sortFilter');
+    if (sortFilter) {
+        sortFilter.addEventListener('change', function() {
+            this.form.submit();
+        });
+    }
+});
+
+function apiRequest(method, url, body) {
+    const options = {method: method, headers: {'Accept': 'application/json'}, credentials: 'same-origin'};
+    if (body !== undefined) {
+        options.headers['Content-Type'] = 'application/json';
+        options.body = JSON.stringify(body);
+    }
+    return fetch(url, options).then(function(response) {
+        if (!response.ok) {
+            throw new Error(`${method} ${url}: ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+function formatPrice(value) {
+    return `${Math.round(value * 100) / 100} руб.`;
+}
+
+function updateCart(cart) {
+    const badge = document.getElementById('cartCount');
+    if (badge) {
+        badge.textContent = cart.count;
+        badge.classList.toggle('d-none', cart.count === 0);
+    }
+
+    const rows = document.querySelectorAll('[data-cart-row]');
+    if (!rows.length) {
+        return;
+    }
+    if (!cart.items.length) {
+        // Пустая корзина рендерится сервером
+        window.location.reload();
+        return;
+    }
+    const items = new Map(cart.items.map((item) => [item.product_id, item]));
+    rows.forEach(function(row) {
+        const item = items.get(Number(row.dataset.cartRow));
+        if (!item) {
+            row.remove();
+            return;
+        }
+        row.querySelector('[name="quantity"]').value = item.quantity;
+        row.querySelector('[data-line-total]').textContent = formatPrice(item.price * item.quantity);
+    });
+    const total = document.getElementById('cartTotal');
+    if (total) {
+        total.textContent = formatPrice(cart.total);
+    }
+}
@@ -0,0 +1,96 @@
+import os
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, Template
+from markupsafe import Markup, escape
+from typing import Optional
+
+from cache import fragment_cache, MISSING
+from http_cache import static_url
+from images import responsive_image
+from crud import HIGHLIGHT_START, HIGHLIGHT_END
+import metrics
+from settings import TEMPLATES_BYTECODE_DIR, TEMPLATES_AUTO_RELOAD
+
+TEMPLATES_DIR = "templates"
+
+os.makedirs(TEMPLATES_BYTECODE_DIR, exist_ok=True)
+
+class TimedTemplate(Template):
+    """Template reporting full-page render time; macros called from other templates are not timed."""
+
+    def render(self, *args, **kwargs) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.observe_template(self.name, time.perf_counter() - started)
+
+    async def generate_async(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            async for chunk in super().generate_async(*args, **kwargs):
+                yield chunk
+        finally:
+            metrics.observe_template(self.name, time.perf_counter() - started)
+
+# Одно окружение Jinja на всё приложение: общий кеш скомпилированных шаблонов,
+# байткод на диске переживает перезапуск и разделяется воркерами
+templates = Jinja2Templates(
+    directory=TEMPLATES_DIR,
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATES_BYTECODE_DIR),
+    auto_reload=TEMPLATES_AUTO_RELOAD,
+)
+
+def product_card(kind: str, product) -> Markup:
+    """Render a product card macro from _product_card.html, cached by product id and row version."""
+    key = (kind, product["id"], product["version"])
+    html = fragment_cache.get(key)
+    if html is MISSING:
+        macro = getattr(templates.get_template("_product_card.html").module, kind)
+        html = Markup(macro(product))
+        fragment_cache.set(key, html)
+    return html
+
+def highlight(text: Optional[str]) -> Markup:
+    if not text:
+        return Markup("")
+    escaped = str(escape(text))
+    return Markup(escaped.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>"))
+
+if metrics.METRICS_ENABLED:
+    templates.env.template_class = TimedTemplate
+
+templates.env.filters["highlight"] = highlight
+templates.env.globals.update(min=min, range=range, static_url=static_url, product_card=product_card,
+                             responsive_image=responsive_image)
+
+# Асинхронное окружение для потоковых страниц (generate_async по асинхронным строкам БД).
+# Скомпилированный код отличается от синхронного, поэтому кеши отдельные
+os.makedirs(os.path.join(TEMPLATES_BYTECODE_DIR, "async"), exist_ok=True)
+stream_env = templates.env.overlay(
+    enable_async=True,
+    cache_size=100,
+    bytecode_cache=FileSystemBytecodeCache(os.path.join(TEMPLATES_BYTECODE_DIR, "async")),
+)
+STREAM_BUFFER_SIZE = 16384
+
+async def stream_template(name: str, context: dict):
+    # Jinja отдаёт много мелких кусков; клиенту они уходят пачками по STREAM_BUFFER_SIZE
+    buffer = []
+    size = 0
+    async for chunk in stream_env.get_template(name).generate_async(context):
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+def precompile_templates():
+    # Компилирует все шаблоны при старте, чтобы первый запрос не ждал компиляции
+    for name in templates.env.list_templates(extensions=["html"]):
+        templates.get_template(name)